@@ -1,9 +1,23 @@
-from ._version import get_versions
+from importlib import import_module
 
-from .defacing_algorithms import run_pydeface, run_mri_deface, run_mridefacer, run_quickshear
+from ._version import get_versions
 
-from .utils import (check_outpath, copy_no_deid, check_meta_data, del_meta_data,
-                    run_brain_extraction_nb, run_brain_extraction_bet, validate_input_dir)\
+# The public functions live in modules that pull in Nipype, pandas and
+# nibabel, so they are only imported once they are first accessed
+# (PEP 562), keeping ``import bidsonym`` and ``bidsonym --version`` fast
+_lazy_attributes = {
+    'run_pydeface': '.defacing_algorithms',
+    'run_mri_deface': '.defacing_algorithms',
+    'run_mridefacer': '.defacing_algorithms',
+    'run_quickshear': '.defacing_algorithms',
+    'check_outpath': '.utils',
+    'copy_no_deid': '.utils',
+    'check_meta_data': '.utils',
+    'del_meta_data': '.utils',
+    'run_brain_extraction_nb': '.utils',
+    'run_brain_extraction_bet': '.utils',
+    'validate_input_dir': '.utils',
+}
 
 # from .reports import (plot_defaced, gif_defaced, run_reports)
 
@@ -23,3 +37,15 @@ __all__ = [
     'run_brain_extraction_bet',
     'validate_input_dir',
 ]
+
+
+def __getattr__(name):
+    if name in _lazy_attributes:
+        value = getattr(import_module(_lazy_attributes[name], __name__), name)
+        globals()[name] = value
+        return value
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
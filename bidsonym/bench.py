@@ -0,0 +1,537 @@
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from glob import glob
+
+import numpy as np
+import nibabel as nib
+import pandas as pd
+
+from bidsonym import utils
+from bidsonym.utils import (check_outpath, copy_no_deid, check_meta_data,
+                            check_dataset_meta_data, del_meta_data,
+                            del_dataset_meta_data, rename_non_deid,
+                            clean_up_files, revert_bidsonym, deface_image,
+                            profile_stage, _brainmask_outfile)
+
+
+# Meta-data written to the synthetic json sidecars, including fields
+# commonly considered problematic
+SIDECAR_META_DATA = {
+    'Manufacturer': 'Synthetic',
+    'MagneticFieldStrength': 3,
+    'InstitutionName': 'BIDSonym Benchmark Hospital',
+    'InstitutionAddress': 'Synthetic Street 1',
+    'AcquisitionTime': '12:00:00.000000',
+    'SeriesDescription': 'synthetic',
+    'ProtocolName': 'bidsonym_bench'
+}
+
+
+def get_parser():
+    """
+    Set up the argument parser of bidsonym-bench.
+    """
+
+    parser = argparse.ArgumentParser(
+        description='Benchmark the pure-Python stages of BIDSonym on a '
+                    'synthetic BIDS dataset, using stub brain extraction and '
+                    'defacing (no FSL or other external tools required).'
+    )
+    parser.add_argument(
+        'out_dir',
+        help='Directory the synthetic BIDS dataset is generated in. An '
+             'existing directory is replaced.'
+    )
+    parser.add_argument(
+        '--n_subjects', type=int, default=4,
+        help='Number of subjects (default: 4).'
+    )
+    parser.add_argument(
+        '--n_sessions', type=int, default=1,
+        help='Number of sessions per subject, 0 for no session level '
+             '(default: 1).'
+    )
+    parser.add_argument(
+        '--modalities', nargs='+', default=['T1w', 'T2w', 'FLAIR'],
+        choices=['T1w', 'T2w', 'FLAIR'],
+        help='Anatomical images per session (default: T1w T2w FLAIR).'
+    )
+    parser.add_argument(
+        '--n_bold', type=int, default=1,
+        help='Number of BOLD runs per session (default: 1).'
+    )
+    parser.add_argument(
+        '--shape', type=int, nargs=3, default=[96, 96, 64],
+        metavar=('X', 'Y', 'Z'),
+        help='Voxel grid of the anatomical images (default: 96 96 64).'
+    )
+    parser.add_argument(
+        '--bold_shape', type=int, nargs=4, default=[32, 32, 24, 20],
+        metavar=('X', 'Y', 'Z', 'T'),
+        help='Voxel grid and number of volumes of the BOLD runs '
+             '(default: 32 32 24 20).'
+    )
+    parser.add_argument(
+        '--n_workers', type=int, default=1,
+        help='Number of subjects processed in parallel worker processes '
+             '(default: 1, i.e. serial).'
+    )
+    parser.add_argument(
+        '--report_workers', type=int, default=1,
+        help='Number of processes rendering the quality control graphics '
+             'of each subject (default: 1, i.e. serial).'
+    )
+    parser.add_argument(
+        '--del_meta', nargs='+', default=['InstitutionName', 'InstitutionAddress'],
+        help='Meta-data fields deleted from the json sidecars '
+             '(default: InstitutionName InstitutionAddress).'
+    )
+    parser.add_argument(
+        '--skip_reports', action='store_true', default=False,
+        help='Do not benchmark the quality control plots and GIFs.'
+    )
+    parser.add_argument(
+        '--skip_revert', action='store_true', default=False,
+        help='Do not benchmark reverting the de-identification.'
+    )
+    parser.add_argument(
+        '--seed', type=int, default=0,
+        help='Seed of the random image data (default: 0).'
+    )
+    parser.add_argument(
+        '--output',
+        help='Path of a json file the per-stage timings are written to '
+             '(a TSV with the same name holds all measured stages).'
+    )
+
+    return parser
+
+
+def _synthetic_head(shape, rng, n_volumes=None):
+    """
+    Create image data of an ellipsoid 'head' with noise.
+
+    Parameters
+    ----------
+    shape : tuple of int
+        Voxel grid.
+    rng : numpy.random.Generator
+        Random number generator.
+    n_volumes : int, optional
+        Number of volumes of a 4D image.
+
+    Returns
+    -------
+    numpy.ndarray
+        int16 image data.
+    """
+
+    grid = np.ogrid[tuple(slice(0, n) for n in shape)]
+    radius = sum(((axis - (n - 1) / 2) / (0.45 * n)) ** 2
+                 for axis, n in zip(grid, shape))
+    head = np.where(radius <= 1, 800, 0).astype(np.float32)
+    full_shape = tuple(shape) + ((n_volumes,) if n_volumes else ())
+    if n_volumes:
+        head = head[..., None]
+    data = head + rng.normal(0, 50, full_shape).astype(np.float32)
+    return np.clip(data, 0, None).astype(np.int16)
+
+
+def _write_image(data, zooms, image_file, meta_data=None):
+    """
+    Save synthetic image data as NIfTI (and its json sidecar).
+
+    Parameters
+    ----------
+    data : numpy.ndarray
+        Image data.
+    zooms : tuple of float
+        Voxel size.
+    image_file : str
+        Path to the image.
+    meta_data : dict, optional
+        Content of the json sidecar.
+    """
+
+    img = nib.Nifti1Image(data, np.diag(list(zooms[:3]) + [1]))
+    img.header.set_zooms(zooms)
+    img.header['descrip'] = b'bidsonym-bench synthetic subject'
+    img.to_filename(image_file)
+    if meta_data is not None:
+        with open(image_file.replace('.nii.gz', '.json'), 'w') as json_file:
+            json.dump(meta_data, json_file, indent=4)
+
+
+def generate_dataset(out_dir, n_subjects=4, n_sessions=1,
+                     modalities=('T1w', 'T2w', 'FLAIR'), n_bold=1,
+                     shape=(96, 96, 64), bold_shape=(32, 32, 24, 20), seed=0):
+    """
+    Generate a synthetic BIDS dataset.
+
+    Parameters
+    ----------
+    out_dir : str
+        Directory the dataset is generated in, an existing directory is
+        replaced.
+    n_subjects : int, optional
+        Number of subjects.
+    n_sessions : int, optional
+        Number of sessions per subject, 0 for no session level.
+    modalities : list of str, optional
+        Anatomical images per session.
+    n_bold : int, optional
+        Number of BOLD runs per session.
+    shape : tuple of int, optional
+        Voxel grid of the anatomical images.
+    bold_shape : tuple of int, optional
+        Voxel grid and number of volumes of the BOLD runs.
+    seed : int, optional
+        Seed of the random image data.
+
+    Returns
+    -------
+    list of str
+        Labels of the generated subjects.
+    """
+
+    shutil.rmtree(out_dir, ignore_errors=True)
+    os.makedirs(out_dir)
+    rng = np.random.default_rng(seed)
+
+    # Dataset-level files, including a task sidecar inherited by all runs
+    with open(os.path.join(out_dir, 'dataset_description.json'), 'w') as json_file:
+        json.dump({'Name': 'bidsonym-bench', 'BIDSVersion': '1.8.0'}, json_file, indent=4)
+    with open(os.path.join(out_dir, 'task-rest_bold.json'), 'w') as json_file:
+        json.dump(dict(SIDECAR_META_DATA, TaskName='rest', RepetitionTime=2.0),
+                  json_file, indent=4)
+
+    subject_labels = ['%02d' % i for i in range(1, n_subjects + 1)]
+    sessions = [str(i) for i in range(1, n_sessions + 1)] or [None]
+    for subject_label in subject_labels:
+        for session in sessions:
+            subject_dir = os.path.join(out_dir, f'sub-{subject_label}')
+            prefix = f'sub-{subject_label}'
+            if session is not None:
+                subject_dir = os.path.join(subject_dir, f'ses-{session}')
+                prefix += f'_ses-{session}'
+
+            os.makedirs(os.path.join(subject_dir, 'anat'))
+            for modality in modalities:
+                _write_image(_synthetic_head(shape, rng), (1.0, 1.0, 1.0),
+                             os.path.join(subject_dir, 'anat', f'{prefix}_{modality}.nii.gz'),
+                             dict(SIDECAR_META_DATA, EchoTime=0.003))
+
+            if n_bold:
+                os.makedirs(os.path.join(subject_dir, 'func'))
+            for run in range(1, n_bold + 1):
+                _write_image(_synthetic_head(bold_shape[:3], rng, bold_shape[3]),
+                             (3.0, 3.0, 3.0, 2.0),
+                             os.path.join(subject_dir, 'func',
+                                          f'{prefix}_task-rest_run-{run}_bold.nii.gz'),
+                             dict(SIDECAR_META_DATA, EchoTime=0.03))
+
+    return subject_labels
+
+
+def _stub_brainmask(image, outfile):
+    """
+    Stub brain extraction, thresholding the image at its mean.
+    """
+
+    img = nib.load(image)
+    data = np.asanyarray(img.dataobj)
+    nib.Nifti1Image((data > data.mean()).astype(np.uint8), img.affine).to_filename(outfile)
+    return outfile
+
+
+def _stub_deface_mask(image, outfile):
+    """
+    Stub defacing mask, removing the anterior-inferior part of the image
+    (1: keep, 0: remove).
+    """
+
+    img = nib.load(image)
+    nx, ny, nz = img.shape[:3]
+    mask = np.ones((nx, ny, nz), dtype=np.uint8)
+    mask[:, 2 * ny // 3:, :nz // 3] = 0
+    nib.Nifti1Image(mask, img.affine).to_filename(outfile)
+    return outfile
+
+
+def _file_hashes(bids_dir, subject_label):
+    """
+    Hash all files of a subject in the BIDS dataset.
+
+    Parameters
+    ----------
+    bids_dir : str
+        Path to BIDS root directory.
+    subject_label : str
+        Label of subject (without 'sub-').
+
+    Returns
+    -------
+    dict
+        sha256 of every file, keyed by its path relative to bids_dir.
+    """
+
+    hashes = {}
+    for path in glob(os.path.join(bids_dir, f'sub-{subject_label}', '**', '*'), recursive=True):
+        if os.path.isfile(path):
+            with open(path, 'rb') as f:
+                hashes[os.path.relpath(path, bids_dir)] = hashlib.sha256(f.read()).hexdigest()
+    return hashes
+
+
+def _check_restored(bids_dir, subject_label, originals):
+    """
+    Check that reverting a subject restored exactly its original files.
+
+    Parameters
+    ----------
+    bids_dir : str
+        Path to BIDS root directory.
+    subject_label : str
+        Label of subject (without 'sub-').
+    originals : dict
+        Hashes of the original files, see _file_hashes.
+    """
+
+    restored = _file_hashes(bids_dir, subject_label)
+    missing = sorted(set(originals) - set(restored))
+    added = sorted(set(restored) - set(originals))
+    changed = sorted(path for path in set(originals) & set(restored)
+                     if originals[path] != restored[path])
+    if missing or added or changed:
+        raise Exception(f"Reverting subject {subject_label} did not restore the original "
+                        f"files. Missing: {missing}, added: {added}, changed: {changed}.")
+    if os.path.exists(os.path.join(bids_dir, 'sourcedata', 'bidsonym', f'sub-{subject_label}')):
+        raise Exception(f"Reverting subject {subject_label} left its backup directory behind.")
+
+
+def bench_subject(bids_dir, subject_label, del_meta=None, reports=True,
+                  revert=True, report_workers=1):
+    """
+    Run the pure-Python stages of BIDSonym for one subject, in the order
+    of a BIDSonym run, with stub brain extraction and defacing.
+
+    Parameters
+    ----------
+    bids_dir : str
+        Path to BIDS root directory.
+    subject_label : str
+        Label of subject (without 'sub-').
+    del_meta : list of str, optional
+        Meta-data fields deleted from the json sidecars.
+    reports : bool, optional
+        Whether the quality control plots and GIFs are created.
+    revert : bool, optional
+        Whether the de-identification is reverted at the end, which has
+        to restore the original files exactly.
+    report_workers : int, optional
+        Number of processes rendering the quality control graphics.
+
+    Returns
+    -------
+    list of dict
+        Measured stages, see bidsonym.utils.profile_stage.
+    """
+
+    # Stages measured in this call, the profile of the current run might
+    # also hold stages of the parent process
+    first_record = len(utils._run_profile)
+
+    originals = _file_hashes(bids_dir, subject_label) if revert else None
+
+    check_outpath(bids_dir, subject_label)
+    with profile_stage('metadata_check', subject_label):
+        check_meta_data(bids_dir, subject_label)
+
+    anat_images = sorted(glob(os.path.join(bids_dir, f'sub-{subject_label}',
+                                           '**', 'anat', '*.nii.gz'),
+                              recursive=True))
+    sessions = sorted({os.path.basename(image).split('_')[1][4:]
+                       for image in anat_images if '_ses-' in image}) or [None]
+
+    mask_dir = tempfile.mkdtemp(prefix=f'bidsonym_bench_sub-{subject_label}_')
+    defaced_files, brainmask_files, image_sessions = [], [], []
+    try:
+        for image in anat_images:
+            session = (os.path.basename(image).split('_')[1][4:]
+                       if '_ses-' in image else None)
+            item = os.path.relpath(image, bids_dir)
+
+            with profile_stage('backup', subject_label, session, item):
+                source = copy_no_deid(bids_dir, subject_label, image, session=session)
+            with profile_stage('brainmask_stub', subject_label, session, item):
+                brainmask = _stub_brainmask(
+                    source, _brainmask_outfile(source, subject_label, bids_dir))
+            with profile_stage('deface_mask_stub', subject_label, session, item):
+                deface_mask = _stub_deface_mask(
+                    source, os.path.join(mask_dir, os.path.basename(image)))
+            with profile_stage('deface_image', subject_label, session, item):
+                deface_image(source, deface_mask, image)
+
+            defaced_files.append(image)
+            brainmask_files.append(brainmask)
+            image_sessions.append(session)
+    finally:
+        shutil.rmtree(mask_dir, ignore_errors=True)
+
+    if del_meta:
+        with profile_stage('metadata_scrub', subject_label):
+            del_meta_data(bids_dir, subject_label, del_meta)
+
+    if reports:
+        from bidsonym.reports import plot_defaced, gif_defaced
+        for session in sessions:
+            session_images = [i for i, image_session in enumerate(image_sessions)
+                              if image_session == session]
+            with profile_stage('plot_defaced', subject_label, session):
+                plot_defaced(bids_dir, subject_label, session,
+                             defaced_files=[defaced_files[i] for i in session_images],
+                             brainmask_files=[brainmask_files[i] for i in session_images],
+                             n_workers=report_workers)
+            with profile_stage('gif_defaced', subject_label, session):
+                gif_defaced(bids_dir, subject_label, session,
+                            defaced_files=[defaced_files[i] for i in session_images],
+                            n_workers=report_workers)
+
+    with profile_stage('rename', subject_label):
+        rename_non_deid(bids_dir, subject_label)
+    for session in sessions:
+        with profile_stage('cleanup', subject_label, session):
+            clean_up_files(bids_dir, subject_label, session=session)
+
+    # All sessions are reverted at once, as via --revert, and have to be
+    # restored exactly
+    if revert:
+        with profile_stage('revert', subject_label):
+            revert_bidsonym(bids_dir, subject_label, confirm=False)
+        _check_restored(bids_dir, subject_label, originals)
+
+    return utils._run_profile[first_record:]
+
+
+def run_benchmark(bids_dir, subject_labels, n_workers=1, del_meta=None,
+                  reports=True, revert=True, report_workers=1):
+    """
+    Benchmark the pure-Python stages of BIDSonym on a (synthetic) BIDS
+    dataset, serially or with subjects processed in parallel.
+
+    Parameters
+    ----------
+    bids_dir : str
+        Path to BIDS root directory.
+    subject_labels : list of str
+        Labels of subjects (without 'sub-').
+    n_workers : int, optional
+        Number of subjects processed in parallel worker processes.
+    del_meta : list of str, optional
+        Meta-data fields deleted from the json sidecars.
+    reports : bool, optional
+        Whether the quality control plots and GIFs are created.
+    revert : bool, optional
+        Whether the de-identification is reverted at the end.
+    report_workers : int, optional
+        Number of processes rendering the quality control graphics of
+        each subject.
+
+    Returns
+    -------
+    tuple
+        (stages, summary, wall_time)
+        stages: DataFrame of all measured stages
+        summary: DataFrame with one row per stage
+        wall_time: Wall time of the whole benchmark in seconds
+    """
+
+    start = time.perf_counter()
+    first_record = len(utils._run_profile)
+
+    # Dataset-level meta-data is handled once, as in a BIDSonym run
+    with profile_stage('metadata_check'):
+        check_dataset_meta_data(bids_dir)
+    if del_meta:
+        with profile_stage('metadata_scrub'):
+            del_dataset_meta_data(bids_dir, del_meta)
+    records = utils._run_profile[first_record:]
+
+    if n_workers > 1:
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            futures = [executor.submit(bench_subject, bids_dir, subject_label,
+                                       del_meta, reports, revert, report_workers)
+                       for subject_label in subject_labels]
+            for future in futures:
+                records += future.result()
+    else:
+        for subject_label in subject_labels:
+            records += bench_subject(bids_dir, subject_label, del_meta,
+                                     reports, revert, report_workers)
+
+    wall_time = time.perf_counter() - start
+
+    stages = pd.DataFrame(records, columns=utils.RUN_PROFILE_COLUMNS)
+    summary = stages.groupby('stage', sort=False).agg(
+        n=('stage', 'size'),
+        wall_time_s=('wall_time_s', 'sum'),
+        wall_time_s_mean=('wall_time_s', 'mean'),
+        wall_time_s_max=('wall_time_s', 'max'),
+        cpu_time_s=('cpu_time_s', 'sum'),
+        peak_rss_mb=('peak_rss_mb', 'max')
+    ).reset_index()
+
+    return stages, summary, wall_time
+
+
+def run_bench():
+    """
+    Main entry point of bidsonym-bench.
+    """
+
+    args = get_parser().parse_args()
+
+    print(f"Generating synthetic BIDS dataset in {args.out_dir}")
+    subject_labels = generate_dataset(
+        args.out_dir, n_subjects=args.n_subjects, n_sessions=args.n_sessions,
+        modalities=args.modalities, n_bold=args.n_bold, shape=args.shape,
+        bold_shape=args.bold_shape, seed=args.seed
+    )
+    n_images = len(glob(os.path.join(args.out_dir, 'sub-*', '**', 'anat', '*.nii.gz'),
+                        recursive=True))
+
+    stages, summary, wall_time = run_benchmark(
+        args.out_dir, subject_labels, n_workers=args.n_workers,
+        del_meta=args.del_meta, reports=not args.skip_reports,
+        revert=not args.skip_revert, report_workers=args.report_workers
+    )
+
+    print(f"\n{'=' * 60}")
+    print("BIDSONYM BENCHMARK")
+    print(f"{'=' * 60}")
+    print(f"Subjects: {len(subject_labels)}, anatomical images: {n_images}, "
+          f"workers: {args.n_workers}, report workers: {args.report_workers}")
+    print(summary.to_string(index=False, float_format='%.3f'))
+    print(f"Total wall time: {wall_time:.3f} s "
+          f"({n_images / wall_time:.2f} anatomical images/s)")
+
+    if args.output:
+        results = {'subjects': len(subject_labels), 'anatomical_images': n_images,
+                   'n_workers': args.n_workers, 'report_workers': args.report_workers,
+                   'wall_time_s': wall_time,
+                   'stages': json.loads(summary.to_json(orient='records'))}
+        with open(args.output, 'w') as json_file:
+            json.dump(results, json_file, indent=4)
+        stages.to_csv(os.path.splitext(args.output)[0] + '.tsv', sep='\t',
+                      index=False, na_rep='n/a')
+        print(f"Timings saved to {args.output}")
+
+
+if __name__ == "__main__":
+    run_bench()
@@ -0,0 +1,448 @@
+# Registry of the available defacing algorithms ("defacers")
+# Only the standard library is imported here, the defacers themselves are
+# imported once they are used, so that the registry can be queried cheaply,
+# e.g. while setting up the command line parser
+import os
+import shutil
+from importlib import import_module
+from importlib.util import find_spec
+
+
+# Entry point group third-party packages can register defacers in, e.g.
+#   entry_points={'bidsonym.defacers': ['mydefacer = mypackage:DEFACER']}
+# where DEFACER is a dict holding the keyword arguments of register_defacer
+# (without name) or a function returning it
+DEFACER_ENTRY_POINT_GROUP = 'bidsonym.defacers'
+
+# Capabilities a defacer can advertise:
+#   batched: defaces a list of images more efficiently than one at a time,
+#            e.g. by loading a model only once
+#   gpu_free: runs reasonably fast without a GPU
+#   in_process: runs within the Python process, i.e. without starting an
+#               external program per image
+#   mask_output: writes the defacing mask next to every defaced image
+DEFACER_CAPABILITIES = ('batched', 'gpu_free', 'in_process', 'mask_output')
+
+# Default locations of the external programs, can be changed via the
+# BIDSONYM_FS_DATA and BIDSONYM_MRIDEFACER environment variables
+FS_DATA_DIR = '/home/bm/bidsonym/fs_data'
+MRIDEFACER_EXECUTABLE = '/mridefacer/mridefacer'
+
+# Registered defacers, see register_defacer
+_defacers = {}
+_entry_points_loaded = False
+
+
+def fs_data_dir():
+    """
+    Directory holding the mri_deface executable and its atlases.
+
+    Returns
+    -------
+    str
+        Value of the BIDSONYM_FS_DATA environment variable or the default
+        directory.
+    """
+
+    return os.environ.get('BIDSONYM_FS_DATA', FS_DATA_DIR)
+
+
+def mridefacer_executable():
+    """
+    Path to the mridefacer executable.
+
+    Returns
+    -------
+    str
+        Value of the BIDSONYM_MRIDEFACER environment variable, the
+        mridefacer found on the PATH or the default location.
+    """
+
+    return (os.environ.get('BIDSONYM_MRIDEFACER') or shutil.which('mridefacer')
+            or MRIDEFACER_EXECUTABLE)
+
+
+def defacemask_file(image, outdir):
+    """
+    Name of the defacing mask written by deface_batch for an image.
+
+    Parameters
+    ----------
+    image : str
+        Path to image.
+    outdir : str
+        Output directory of deface_batch.
+
+    Returns
+    -------
+    str
+        Path to the defacing mask, '<image name>_defacemask.nii.gz'.
+    """
+
+    basename = os.path.basename(image)
+    if '.nii' in basename:
+        basename = basename[:basename.find('.nii')]
+    return os.path.join(outdir, basename + '_defacemask.nii.gz')
+
+
+def _is_executable(path):
+    return os.path.isfile(path) and os.access(path, os.X_OK)
+
+
+def _has_modules(*modules):
+    return all(find_spec(module) is not None for module in modules)
+
+
+def register_defacer(name, deface_batch, capabilities=None, available=None,
+                     rank=100, options=()):
+    """
+    Register a defacer, replacing a defacer of the same name.
+
+    Parameters
+    ----------
+    name : str
+        Name of the defacer, as used for --deid.
+    deface_batch : callable or str
+        Function (or 'module:function' reference to it) with the signature
+        deface_batch(images, outdir, n_workers=1, **options), which writes
+        the defaced images to outdir, keeping their file names, and
+        returns a list holding the defaced file of every image, None for
+        images that failed. Defacers advertising 'mask_output' also write
+        the mask of every image (see defacemask_file).
+    capabilities : dict or iterable of str, optional
+        Capabilities of the defacer (see DEFACER_CAPABILITIES), missing
+        capabilities are False.
+    available : callable, optional
+        Function returning whether the defacer can be run in the current
+        environment, e.g. whether its executable exists. Default is
+        always available.
+    rank : int, optional
+        Expected speed of the defacer relative to the others, lower is
+        faster. Used by select_defacer.
+    options : tuple of str, optional
+        Additional keyword arguments deface_batch accepts, e.g.
+        'mask_files' for a list of existing brain masks.
+    """
+
+    if capabilities is None:
+        capabilities = {}
+    elif not isinstance(capabilities, dict):
+        capabilities = {capability: True for capability in capabilities}
+
+    unknown = set(capabilities) - set(DEFACER_CAPABILITIES)
+    if unknown:
+        raise Exception(f"Defacer {name} advertises unknown capabilities: "
+                        f"{', '.join(sorted(unknown))}. Known capabilities "
+                        f"are: {', '.join(DEFACER_CAPABILITIES)}.")
+
+    _defacers[name] = {
+        'name': name,
+        'deface_batch': deface_batch,
+        'capabilities': {capability: bool(capabilities.get(capability, False))
+                         for capability in DEFACER_CAPABILITIES},
+        'available': available,
+        'rank': rank,
+        'options': tuple(options),
+    }
+
+
+def _load_entry_points():
+    """
+    Register the defacers provided by installed packages via the
+    'bidsonym.defacers' entry point group, once per process.
+    """
+
+    global _entry_points_loaded
+
+    if _entry_points_loaded:
+        return
+    _entry_points_loaded = True
+
+    try:
+        from importlib.metadata import entry_points
+    except ImportError:
+        return
+
+    entry_points = entry_points()
+    if hasattr(entry_points, 'select'):
+        entry_points = entry_points.select(group=DEFACER_ENTRY_POINT_GROUP)
+    else:
+        entry_points = entry_points.get(DEFACER_ENTRY_POINT_GROUP, [])
+
+    for entry_point in entry_points:
+        try:
+            spec = entry_point.load()
+            if callable(spec):
+                spec = spec()
+            register_defacer(entry_point.name, **spec)
+        except Exception as e:
+            print(f"Defacer {entry_point.name} provided by "
+                  f"{entry_point.value} could not be loaded: {e}")
+
+
+def list_defacers(available_only=False):
+    """
+    List the registered defacers.
+
+    Parameters
+    ----------
+    available_only : bool, optional
+        Only list defacers that can be run in the current environment.
+
+    Returns
+    -------
+    list of str
+        Names of the defacers, fastest first.
+    """
+
+    _load_entry_points()
+
+    defacers = sorted(_defacers.values(), key=lambda d: (d['rank'], d['name']))
+    return [defacer['name'] for defacer in defacers
+            if not available_only or defacer_available(defacer['name'])]
+
+
+def get_defacer(name):
+    """
+    Get a registered defacer.
+
+    Parameters
+    ----------
+    name : str
+        Name of the defacer.
+
+    Returns
+    -------
+    dict
+        Registry entry holding 'name', 'deface_batch', 'capabilities',
+        'available', 'rank' and 'options'.
+    """
+
+    _load_entry_points()
+
+    if name not in _defacers:
+        raise Exception(f"Unknown defacer {name}. Registered defacers are: "
+                        f"{', '.join(list_defacers())}.")
+    return _defacers[name]
+
+
+def defacer_available(name):
+    """
+    Check whether a defacer can be run in the current environment.
+
+    Parameters
+    ----------
+    name : str
+        Name of the defacer.
+
+    Returns
+    -------
+    bool
+        True if the defacer is available.
+    """
+
+    available = get_defacer(name)['available']
+    return available is None or bool(available())
+
+
+def select_defacer(candidates=None, require=()):
+    """
+    Select the fastest available defacer.
+
+    Parameters
+    ----------
+    candidates : list of str, optional
+        Defacers to choose from. Default is all registered defacers.
+    require : iterable of str, optional
+        Capabilities the defacer needs to have.
+
+    Returns
+    -------
+    str
+        Name of the selected defacer.
+    """
+
+    for name in list_defacers(available_only=True):
+        if candidates is not None and name not in candidates:
+            continue
+        if all(get_defacer(name)['capabilities'][capability]
+               for capability in require):
+            return name
+
+    raise Exception("None of the defacers "
+                    + (f"{', '.join(candidates)} " if candidates else "")
+                    + (f"with {', '.join(require)} " if require else "")
+                    + "is available in this environment.")
+
+
+def deface_batch(images, outdir, n_workers=1, defacer=None, **options):
+    """
+    Deface a list of images with a single call of a defacer.
+
+    Parameters
+    ----------
+    images : list of str
+        Paths to images that should be defaced.
+    outdir : str
+        Directory the defaced images (and masks) are written to, keeping
+        the file names of the images.
+    n_workers : int, optional
+        Number of images processed in parallel, or threads used by
+        in-process defacers.
+    defacer : str, optional
+        Name of the defacer. Default is the fastest available defacer.
+    **options
+        Additional arguments of the defacer, see its 'options'.
+
+    Returns
+    -------
+    list of str or None
+        Defaced file of every image, None for images that failed.
+    """
+
+    if defacer is None:
+        defacer = select_defacer()
+    function = get_defacer(defacer)['deface_batch']
+    if isinstance(function, str):
+        module, attribute = function.split(':')
+        function = getattr(import_module(module), attribute)
+
+    os.makedirs(outdir, exist_ok=True)
+    return function(list(images), outdir, n_workers=n_workers, **options)
+
+
+def deface_files(defacer, images, outfiles, maskfiles=None, n_workers=1,
+                 mask_files=None):
+    """
+    Deface images via deface_batch and move the results to their final
+    locations.
+
+    Parameters
+    ----------
+    defacer : str
+        Name of the defacer.
+    images : list of str
+        Paths to images that should be defaced.
+    outfiles : list of str
+        Names of the defaced files, one per image.
+    maskfiles : list of str, optional
+        Names the defacing masks are moved to, one per image. Only used
+        by defacers advertising 'mask_output'.
+    n_workers : int, optional
+        Number of images processed in parallel.
+    mask_files : list of str, optional
+        Brain masks of the images, passed on to defacers accepting them.
+
+    Returns
+    -------
+    outfiles : list of str or None
+        Names of the defaced files, None for images that failed.
+    """
+
+    # Imports are done here as this function is run as a Nipype Function node
+    import os
+    import shutil
+    import tempfile
+    from bidsonym.defacers import defacemask_file, deface_batch, get_defacer
+
+    entry = get_defacer(defacer)
+    options = {}
+    if mask_files is not None and 'mask_files' in entry['options']:
+        options['mask_files'] = mask_files
+
+    if not images:
+        return []
+
+    # Deface into a temporary directory first, as defaced files replace
+    # the original images, which might have the same file names. It is
+    # created next to the defaced files, so that moving them into place
+    # does not copy them across file systems
+    outdir = tempfile.mkdtemp(prefix='.bidsonym_deface_',
+                              dir=os.path.dirname(os.path.abspath(outfiles[0])))
+    try:
+        defaced = deface_batch(images, outdir, n_workers=n_workers,
+                               defacer=defacer, **options)
+
+        results = [None] * len(images)
+        for i, (image, defaced_file) in enumerate(zip(images, defaced)):
+            if defaced_file is None:
+                continue
+            shutil.move(defaced_file, outfiles[i])
+            mask = defacemask_file(image, outdir)
+            if (maskfiles and entry['capabilities']['mask_output'] and
+                    os.path.exists(mask)):
+                shutil.move(mask, maskfiles[i])
+            results[i] = outfiles[i]
+    finally:
+        shutil.rmtree(outdir, ignore_errors=True)
+
+    return results
+
+
+def deface_file(defacer, image, outfile, maskfile=None, mask_file=None):
+    """
+    Deface a single image via deface_batch.
+
+    Parameters
+    ----------
+    defacer : str
+        Name of the defacer.
+    image : str
+        Path to image that should be defaced.
+    outfile : str
+        Name of the defaced file.
+    maskfile : str, optional
+        Name the defacing mask is moved to.
+    mask_file : str, optional
+        Brain mask of the image, passed on to defacers accepting it.
+
+    Returns
+    -------
+    outfile : str
+        Name of the defaced file.
+    """
+
+    # Imports are done here as this function is run as a Nipype Function node
+    from bidsonym.defacers import deface_files
+
+    if deface_files(defacer, [image], [outfile],
+                    maskfiles=[maskfile] if maskfile else None,
+                    mask_files=[mask_file] if mask_file else None)[0] is None:
+        raise RuntimeError(f"{defacer} defacing of {image} failed.")
+
+    return outfile
+
+
+# Defacers shipped with BIDSonym, their batch functions are implemented in
+# bidsonym.defacing_algorithms
+register_defacer(
+    'quickshear', 'bidsonym.defacing_algorithms:quickshear_batch',
+    capabilities=('gpu_free', 'in_process'),
+    # Quickshear itself runs in-process, BET is only needed for images
+    # without a brain mask, which quickshear_batch checks for
+    rank=10, options=('mask_files',)
+)
+register_defacer(
+    'pydeface', 'bidsonym.defacing_algorithms:pydeface_batch',
+    capabilities=('gpu_free',),
+    available=lambda: shutil.which('pydeface') is not None,
+    rank=20
+)
+register_defacer(
+    'mridefacer', 'bidsonym.defacing_algorithms:mridefacer_batch',
+    capabilities=('gpu_free',),
+    available=lambda: _is_executable(mridefacer_executable()),
+    rank=30
+)
+register_defacer(
+    'mri_deface', 'bidsonym.defacing_algorithms:mri_deface_batch',
+    capabilities=('gpu_free',),
+    available=lambda: _is_executable(os.path.join(fs_data_dir(), 'mri_deface')),
+    rank=40
+)
+register_defacer(
+    'deepdefacer', 'bidsonym.defacing_algorithms:deepdefacer_batch',
+    capabilities=('batched', 'in_process', 'mask_output'),
+    available=lambda: _has_modules('deepdefacer', 'tensorflow'),
+    rank=50
+)
@@ -1,8 +1,7 @@
 import nipype.pipeline.engine as pe
 from nipype import Function
 from nipype.interfaces import utility as niu
-from nipype.interfaces.quickshear import Quickshear
-from nipype.interfaces.fsl import BET, FLIRT
+from nipype.interfaces.fsl import BET
 from bidsonym.utils import deface_image
 
 
@@ -30,12 +29,12 @@ def pydeface_cmd(image, outfile):
     # Execute the pydeface command
     # check_call will raise an exception if the command fails
     check_call(cmd)
-    return
+    return outfile
 
 
-def run_pydeface(image, outfile):
+def init_pydeface_wf(image, outfile, name='deface_wf'):
     """
-    Setup and run pydeface workflow.
+    Setup pydeface workflow.
 
     Parameters
     ----------
@@ -43,10 +42,17 @@ def run_pydeface(image, outfile):
         Path to image that should be defaced.
     outfile : str
         Name of the defaced file.
+    name : str, optional
+        Name of the workflow.
+
+    Returns
+    -------
+    deface_wf : nipype.pipeline.engine.Workflow
+        Workflow providing the defaced file as 'outputnode.out_file'.
     """
 
     # Create a Nipype workflow for pydeface processing
-    deface_wf = pe.Workflow('deface_wf')
+    deface_wf = pe.Workflow(name)
     
     # Create input node to handle data flow
     inputnode = pe.Node(niu.IdentityInterface(['in_file']),
@@ -59,13 +65,39 @@ def run_pydeface(image, outfile):
                                 function=pydeface_cmd),
                        name='pydeface')
     
+    # Create output node exposing the defaced file
+    outputnode = pe.Node(niu.IdentityInterface(['out_file']),
+                         name='outputnode')
+    
     # Connect input node to pydeface node (data flow)
-    deface_wf.connect([(inputnode, pydeface, [('in_file', 'image')])])
+    deface_wf.connect([(inputnode, pydeface, [('in_file', 'image')]),
+                       (pydeface, outputnode, [('outfile', 'out_file')])])
     
     # Set workflow inputs
     inputnode.inputs.in_file = image
     pydeface.inputs.outfile = outfile
     
+    return deface_wf
+
+
+def run_pydeface(image, outfile, base_dir=None):
+    """
+    Setup and run pydeface workflow.
+
+    Parameters
+    ----------
+    image : str
+        Path to image that should be defaced.
+    outfile : str
+        Name of the defaced file.
+    base_dir : str, optional
+        Directory in which the workflow is executed and its results are
+        cached, so that reruns with unchanged inputs are skipped.
+    """
+
+    deface_wf = init_pydeface_wf(image, outfile)
+    deface_wf.base_dir = base_dir
+
     # Execute the workflow
     deface_wf.run()
 
@@ -82,25 +114,30 @@ def mri_deface_cmd(image, outfile):
         Name of the defaced file.
     """
 
+    import os
     from subprocess import check_call
+    from bidsonym.defacers import fs_data_dir
+
+    # Directory holding mri_deface and its atlases, see BIDSONYM_FS_DATA
+    fs_data = fs_data_dir()
 
     # Construct mri_deface command (FreeSurfer's defacing tool)
     # Uses atlas-based approach with Talairach registration and face template
-    cmd = ["/home/bm/bidsonym/fs_data/mri_deface",                    # mri_deface executable
+    cmd = [os.path.join(fs_data, "mri_deface"),                       # mri_deface executable
            image,                                                     # Input T1w image
-           '/home/bm/bidsonym/fs_data/talairach_mixed_with_skull.gca',  # Atlas for brain registration
-           '/home/bm/bidsonym/fs_data/face.gca',                      # Face template for detection
+           os.path.join(fs_data, 'talairach_mixed_with_skull.gca'),   # Atlas for brain registration
+           os.path.join(fs_data, 'face.gca'),                         # Face template for detection
            outfile,                                                   # Output defaced image
            ]
     
     # Execute the mri_deface command
     check_call(cmd)
-    return
+    return outfile
 
 
-def run_mri_deface(image, outfile):
+def init_mri_deface_wf(image, outfile, name='deface_wf'):
     """
-    Setup and run mri_deface workflow.
+    Setup mri_deface workflow.
 
     Parameters
     ----------
@@ -108,10 +145,17 @@ def run_mri_deface(image, outfile):
         Path to image that should be defaced.
     outfile : str
         Name of the defaced file.
+    name : str, optional
+        Name of the workflow.
+
+    Returns
+    -------
+    deface_wf : nipype.pipeline.engine.Workflow
+        Workflow providing the defaced file as 'outputnode.out_file'.
     """
 
     # Create a Nipype workflow for mri_deface processing
-    deface_wf = pe.Workflow('deface_wf')
+    deface_wf = pe.Workflow(name)
     
     # Create input node for data flow
     inputnode = pe.Node(niu.IdentityInterface(['in_file']),
@@ -124,58 +168,304 @@ def run_mri_deface(image, outfile):
                                   function=mri_deface_cmd),
                          name='mri_deface')
     
+    # Create output node exposing the defaced file
+    outputnode = pe.Node(niu.IdentityInterface(['out_file']),
+                         name='outputnode')
+    
     # Connect workflow nodes
-    deface_wf.connect([(inputnode, mri_deface, [('in_file', 'image')])])
+    deface_wf.connect([(inputnode, mri_deface, [('in_file', 'image')]),
+                       (mri_deface, outputnode, [('outfile', 'out_file')])])
     
     # Set workflow inputs
     inputnode.inputs.in_file = image
     mri_deface.inputs.outfile = outfile
     
+    return deface_wf
+
+
+def run_mri_deface(image, outfile, base_dir=None):
+    """
+    Setup and run mri_deface workflow.
+
+    Parameters
+    ----------
+    image : str
+        Path to image that should be defaced.
+    outfile : str
+        Name of the defaced file.
+    base_dir : str, optional
+        Directory in which the workflow is executed and its results are
+        cached, so that reruns with unchanged inputs are skipped.
+    """
+
+    deface_wf = init_mri_deface_wf(image, outfile)
+    deface_wf.base_dir = base_dir
+
     # Execute the workflow
     deface_wf.run()
 
 
-def run_quickshear(image, outfile):
+def _quickshear_edge_mask(mask):
     """
-    Setup and run quickshear workflow.
+    Find the edges of the brain mask projected onto the sagittal plane.
+
+    Parameters
+    ----------
+    mask : numpy.ndarray
+        3D binary brain mask in RPS orientation.
+
+    Returns
+    -------
+    edgemask : numpy.ndarray
+        2D (P, S) binary mask of the edges of the projected brain mask.
+    """
+
+    import numpy as np
+
+    # Collapse the mask along the left/right axis
+    brain = mask.any(axis=0)
+
+    # Simple edge detection via the 4-neighbourhood
+    edgemask = (4 * brain - np.roll(brain, 1, 0) - np.roll(brain, -1, 0) -
+                np.roll(brain, 1, 1) - np.roll(brain, -1, 1)) != 0
+
+    return edgemask
+
+
+def _quickshear_lower_hull(edgemask):
+    """
+    Compute the lower convex hull of the edge points via the monotone
+    chain algorithm.
+
+    Parameters
+    ----------
+    edgemask : numpy.ndarray
+        2D binary mask of edge points.
+
+    Returns
+    -------
+    hull : list of tuple
+        (p, s) coordinates of the lower convex hull, sorted by p.
+    """
+
+    import numpy as np
+
+    # np.nonzero already returns the points sorted by (p, s)
+    points = np.transpose(np.nonzero(edgemask)).tolist()
+
+    hull = []
+    for p, q in points:
+        while len(hull) >= 2:
+            (p0, q0), (p1, q1) = hull[-2], hull[-1]
+            if (p1 - p0) * (q - q0) - (q1 - q0) * (p - p0) > 0:
+                break
+            hull.pop()
+        hull.append((p, q))
+
+    return hull
+
+
+def quickshear_array(anat, mask, affine, buff=10):
+    """
+    Deface an image via the Quickshear algorithm.
+
+    Native NumPy implementation of Quickshear (Schimke and Hale, 2011),
+    operating on already loaded data. The brain mask is projected onto
+    the sagittal plane, the first segment of the lower convex hull of its
+    edges defines the shear plane, which is shifted by buff voxels, and
+    all voxels below it are set to 0.
+
+    Parameters
+    ----------
+    anat : numpy.ndarray
+        Image data, 3D or 4D (the same shear is applied to all volumes).
+    mask : numpy.ndarray
+        3D brain mask or brain extracted image, nonzero voxels are brain.
+    affine : numpy.ndarray
+        4x4 affine of anat and mask.
+    buff : int, optional
+        Distance (in voxels) between the shear plane and the brain.
+
+    Returns
+    -------
+    defaced : numpy.ndarray
+        Defaced image data.
+    keep : numpy.ndarray
+        3D boolean mask of the voxels that were kept.
+    """
+
+    import numpy as np
+    from nibabel.orientations import (io_orientation, axcodes2ornt,
+                                      ornt_transform, apply_orientation)
+
+    mask = np.asanyarray(mask)
+    while mask.ndim > 3 and mask.shape[-1] == 1:
+        mask = mask[..., 0]
+    if mask.shape != anat.shape[:3]:
+        raise ValueError(f"The brain mask with shape {mask.shape} does not "
+                         f"match the image with shape {anat.shape}.")
+
+    # Quickshear operates in RPS orientation
+    src_ornt = io_orientation(affine)
+    tgt_ornt = axcodes2ornt('RPS')
+    mask_rps = apply_orientation(mask > 0, ornt_transform(src_ornt, tgt_ornt))
+
+    hull = _quickshear_lower_hull(_quickshear_edge_mask(mask_rps))
+    if len(hull) < 2:
+        raise ValueError("The brain mask is empty or too small to compute "
+                         "the Quickshear shear plane.")
+
+    # Shear plane through the first segment of the lower hull, moved down
+    # by buff voxels
+    (p0, s0), (p1, s1) = hull[0], hull[1]
+    slope = (s1 - s0) / (p1 - p0)
+    intercept = s0 - p0 * slope - buff
+    ys = np.arange(mask_rps.shape[1]) * slope + intercept
+
+    # Keep all voxels above the shear plane, for every left/right slice
+    keep_rps = (np.arange(mask_rps.shape[2])[None, :] >=
+                np.trunc(ys)[:, None])
+    keep_rps = np.broadcast_to(keep_rps, mask_rps.shape)
+    keep = apply_orientation(keep_rps, ornt_transform(tgt_ornt, src_ornt))
+
+    keep_nd = keep.reshape(keep.shape + (1,) * (anat.ndim - 3))
+    defaced = np.where(keep_nd, anat, 0).astype(anat.dtype, copy=False)
+
+    return defaced, keep
+
+
+def quickshear_image(image, mask_file, outfile, buff=10):
+    """
+    Deface an image file via the native Quickshear implementation.
 
     Parameters
     ----------
     image : str
         Path to image that should be defaced.
+    mask_file : str
+        Path to brain mask or brain extracted image.
+    outfile : str
+        Name of the defaced file.
+    buff : int, optional
+        Distance (in voxels) between the shear plane and the brain.
+
+    Returns
+    -------
     outfile : str
         Name of the defaced file.
     """
 
+    # Imports are done here as this function is run as a Nipype Function node
+    import numpy as np
+    import nibabel as nib
+    from bidsonym.defacing_algorithms import quickshear_array
+
+    anat_img = nib.load(image)
+    mask_img = nib.load(mask_file)
+
+    defaced, _ = quickshear_array(np.asanyarray(anat_img.dataobj),
+                                  np.asanyarray(mask_img.dataobj),
+                                  anat_img.affine, buff=buff)
+
+    # Keep header (incl. on-disk data type) of the original image
+    anat_img.__class__(defaced, anat_img.affine,
+                       anat_img.header).to_filename(outfile)
+
+    return outfile
+
+
+def init_quickshear_wf(image, outfile, separate_bet=True, name='deface_wf'):
+    """
+    Setup quickshear workflow.
+
+    Parameters
+    ----------
+    image : str
+        Path to image that should be defaced.
+    outfile : str
+        Name of the defaced file.
+    separate_bet : bool, optional
+        If True (default), the brain mask is computed via BET (frac=0.5)
+        within the workflow. If False, 'inputnode.mask_file' has to be
+        connected to an existing brain mask or brain extracted image,
+        e.g. the output of the quality control brain extraction.
+    name : str, optional
+        Name of the workflow.
+
+    Returns
+    -------
+    deface_wf : nipype.pipeline.engine.Workflow
+        Workflow providing the defaced file as 'outputnode.out_file'.
+    """
+
     # Create workflow for Quickshear defacing method
     # Quickshear uses brain extraction + geometric face removal
-    deface_wf = pe.Workflow('deface_wf')
+    deface_wf = pe.Workflow(name)
     
     # Create input node
-    inputnode = pe.Node(niu.IdentityInterface(['in_file']),
+    # mask_file is only used if the brain mask is provided from outside
+    inputnode = pe.Node(niu.IdentityInterface(['in_file', 'mask_file']),
                         name='inputnode')
     
-    # Create BET node for brain extraction
-    # mask=True generates binary brain mask, frac=0.5 sets intensity threshold
-    bet = pe.Node(BET(mask=True, frac=0.5), name='bet')
-    
     # Create Quickshear node for face removal
     # buff=50 sets buffer size around face removal region
-    quickshear = pe.Node(Quickshear(buff=50), name='quickshear')
+    quickshear = pe.Node(Function(input_names=['image', 'mask_file', 'outfile', 'buff'],
+                                  output_names=['outfile'],
+                                  function=quickshear_image),
+                         name='quickshear')
+    
+    # Create output node exposing the defaced file
+    outputnode = pe.Node(niu.IdentityInterface(['out_file']),
+                         name='outputnode')
     
     # Connect workflow nodes
-    # Both BET and Quickshear receive the original image
-    # Quickshear also receives the brain mask from BET
+    # Quickshear receives the original image and a brain mask
     deface_wf.connect([
-        (inputnode, bet, [('in_file', 'in_file')]),              # Input -> BET
-        (inputnode, quickshear, [('in_file', 'in_file')]),       # Input -> Quickshear
-        (bet, quickshear, [('mask_file', 'mask_file')])          # BET mask -> Quickshear
+        (inputnode, quickshear, [('in_file', 'image')]),         # Input -> Quickshear
+        (quickshear, outputnode, [('outfile', 'out_file')])      # Quickshear -> Output
     ])
+
+    if separate_bet:
+        # Create BET node for brain extraction
+        # mask=True generates binary brain mask, frac=0.5 sets intensity threshold
+        bet = pe.Node(BET(mask=True, frac=0.5), name='bet')
+        deface_wf.connect([
+            (inputnode, bet, [('in_file', 'in_file')]),          # Input -> BET
+            (bet, quickshear, [('mask_file', 'mask_file')])      # BET mask -> Quickshear
+        ])
+    else:
+        # Only nonzero voxels are considered by Quickshear, hence brain
+        # extracted images can be used as mask as well
+        deface_wf.connect([
+            (inputnode, quickshear, [('mask_file', 'mask_file')])  # Mask -> Quickshear
+        ])
     
     # Set workflow inputs
     inputnode.inputs.in_file = image
-    quickshear.inputs.out_file = outfile
+    quickshear.inputs.outfile = outfile
+    quickshear.inputs.buff = 50
     
+    return deface_wf
+
+
+def run_quickshear(image, outfile, base_dir=None):
+    """
+    Setup and run quickshear workflow.
+
+    Parameters
+    ----------
+    image : str
+        Path to image that should be defaced.
+    outfile : str
+        Name of the defaced file.
+    base_dir : str, optional
+        Directory in which the workflow is executed and its results are
+        cached, so that reruns with unchanged inputs are skipped.
+    """
+
+    deface_wf = init_quickshear_wf(image, outfile)
+    deface_wf.base_dir = base_dir
+
     # Execute the workflow
     deface_wf.run()
 
@@ -192,7 +482,9 @@ def mridefacer_cmd(image, T1_file):
         Path to reference T1-weighted image.
     """
 
+    import os
     from subprocess import check_call
+    from bidsonym.defacers import mridefacer_executable
 
     # Extract output directory from T1_file path
     # mridefacer writes output to the same directory as the reference T1
@@ -200,18 +492,19 @@ def mridefacer_cmd(image, T1_file):
 
     # Construct mridefacer command
     # Uses deep learning approach for face detection and removal
-    cmd = ["/mridefacer/mridefacer",    # mridefacer executable
+    # The executable can be set via BIDSONYM_MRIDEFACER
+    cmd = [mridefacer_executable(),     # mridefacer executable
            "--apply", image,            # Apply defacing to this image
            "--outdir", outdir]          # Output directory
     
     # Execute the mridefacer command
     check_call(cmd)
-    return
+    return os.path.join(outdir, os.path.basename(image))
 
 
-def run_mridefacer(image, T1_file):
+def init_mridefacer_wf(image, T1_file, name='deface_wf'):
     """
-    Setup and run mridefacer workflow.
+    Setup mridefacer workflow.
 
     Parameters
     ----------
@@ -219,10 +512,17 @@ def run_mridefacer(image, T1_file):
         Path to image that should be defaced.
     T1_file : str
         Path to reference T1-weighted image.
+    name : str, optional
+        Name of the workflow.
+
+    Returns
+    -------
+    deface_wf : nipype.pipeline.engine.Workflow
+        Workflow providing the defaced file as 'outputnode.out_file'.
     """
 
     # Create Nipype workflow for mridefacer processing
-    deface_wf = pe.Workflow('deface_wf')
+    deface_wf = pe.Workflow(name)
     
     # Create input node
     inputnode = pe.Node(niu.IdentityInterface(['in_file']),
@@ -235,20 +535,211 @@ def run_mridefacer(image, T1_file):
                                   function=mridefacer_cmd),
                          name='mridefacer')
     
+    # Create output node exposing the defaced file
+    outputnode = pe.Node(niu.IdentityInterface(['out_file']),
+                         name='outputnode')
+    
     # Connect workflow nodes
-    deface_wf.connect([(inputnode, mridefacer, [('in_file', 'image')])])
+    deface_wf.connect([(inputnode, mridefacer, [('in_file', 'image')]),
+                       (mridefacer, outputnode, [('outfile', 'out_file')])])
     
     # Set workflow inputs
     inputnode.inputs.in_file = image
     mridefacer.inputs.T1_file = T1_file
     
+    return deface_wf
+
+
+def run_mridefacer(image, T1_file, base_dir=None):
+    """
+    Setup and run mridefacer workflow.
+
+    Parameters
+    ----------
+    image : str
+        Path to image that should be defaced.
+    T1_file : str
+        Path to reference T1-weighted image.
+    base_dir : str, optional
+        Directory in which the workflow is executed and its results are
+        cached, so that reruns with unchanged inputs are skipped.
+    """
+
+    deface_wf = init_mridefacer_wf(image, T1_file)
+    deface_wf.base_dir = base_dir
+
     # Execute the workflow
     deface_wf.run()
 
 
-def deepdefacer_cmd(image, subject_label, bids_dir):
+# deepdefacer models loaded in this process, see load_deepdefacer_model
+_deepdefacer_models = {}
+
+
+def load_deepdefacer_model(model_path=None, n_threads=None):
+    """
+    Load the deepdefacer U-Net, reusing it if it was already loaded by
+    this process.
+
+    Parameters
+    ----------
+    model_path : str, optional
+        Path to the deepdefacer model. Default is the model shipped with
+        the deepdefacer package.
+    n_threads : int, optional
+        Number of threads TensorFlow uses within operations.
+
+    Returns
+    -------
+    model : tf.keras.Model
+        Loaded deepdefacer model.
+    """
+
+    import os
+
+    if model_path is None:
+        import deepdefacer
+        model_path = os.path.join(os.path.dirname(deepdefacer.__file__), 'model.hdf5')
+
+    if model_path not in _deepdefacer_models:
+        import tensorflow as tf
+        from bidsonym.utils import configure_tf_threads
+
+        configure_tf_threads(n_threads)
+        # compile=False, as the custom training metrics are not needed
+        _deepdefacer_models[model_path] = tf.keras.models.load_model(model_path, compile=False)
+
+    return _deepdefacer_models[model_path]
+
+
+def deepdefacer_predict(images, outfiles, maskfiles, model_path=None,
+                        n_threads=None, batch_size=4):
     """
-    Setup deepdefacer command.
+    Run deepdefacer on a batch of images in-process.
+
+    The model is loaded only once per process and batch_size images are
+    predicted at once. Processing follows deepdefacer: images are
+    resampled to the input shape of the model (160^3 voxels) and
+    z-scored, and the predicted mask is thresholded at 0.5 and resampled
+    back to the image grid, where it is applied to the original data.
+
+    Parameters
+    ----------
+    images : list of str
+        Paths to images that should be defaced.
+    outfiles : list of str
+        Names of the defaced files, one per image.
+    maskfiles : list of str
+        Names of the defacing masks, one per image.
+    model_path : str, optional
+        Path to the deepdefacer model.
+    n_threads : int, optional
+        Number of threads TensorFlow uses within operations.
+    batch_size : int, optional
+        Number of images predicted at once.
+
+    Returns
+    -------
+    outfiles : list of str or None
+        Names of the defaced files, None for images that failed. Errors
+        are reported, but do not stop the remaining images of the batch.
+    """
+
+    # Imports are done here as this function is run as a Nipype Function node
+    import time
+    import traceback
+    import numpy as np
+    import nibabel as nib
+    from skimage.transform import resize
+    from bidsonym.defacing_algorithms import load_deepdefacer_model
+
+    model = load_deepdefacer_model(model_path, n_threads)
+    input_shape = tuple(model.input_shape[1:4])
+
+    results = [None] * len(images)
+    for batch_start in range(0, len(images), batch_size):
+        batch = range(batch_start, min(batch_start + batch_size, len(images)))
+
+        # Load and preprocess all images of the batch
+        start = time.time()
+        loaded, features = {}, []
+        for i in batch:
+            try:
+                img = nib.load(images[i])
+                data = img.get_fdata(dtype=np.float32)
+                feature = resize(data, input_shape, order=1,
+                                 preserve_range=True, anti_aliasing=False)
+                feature = (feature - feature.mean()) / (feature.std() or 1)
+                loaded[i] = img
+                features.append(feature)
+            except Exception:
+                print(f"deepdefacer: loading {images[i]} failed")
+                traceback.print_exc()
+        if not loaded:
+            continue
+
+        predictions = model.predict(np.stack(features)[..., np.newaxis],
+                                    batch_size=len(features), verbose=0)
+        batch_time = (time.time() - start) / len(loaded)
+
+        # Apply the predicted masks at the original resolution
+        for i, prediction in zip(loaded, predictions):
+            start = time.time()
+            try:
+                img = loaded[i]
+                mask = resize((prediction[..., 0] >= 0.5).astype(np.float32),
+                              img.shape[:3], order=0, preserve_range=True,
+                              anti_aliasing=False).astype(np.uint8)
+
+                nib.Nifti1Image(mask, img.affine).to_filename(maskfiles[i])
+
+                data = np.asanyarray(img.dataobj)
+                mask = mask.reshape(mask.shape + (1,) * (data.ndim - 3))
+                img.__class__(data * mask, img.affine,
+                              img.header).to_filename(outfiles[i])
+
+                results[i] = outfiles[i]
+                print(f"deepdefacer: {images[i]} done in "
+                      f"{batch_time + time.time() - start:.1f}s")
+            except Exception:
+                print(f"deepdefacer: defacing {images[i]} failed")
+                traceback.print_exc()
+
+    return results
+
+
+def _defacemask_outfile(image, subject_label, bids_dir, defacer='deepdefacer'):
+    """
+    Construct the name of the defacing mask of an image.
+
+    Parameters
+    ----------
+    image : str
+        Path to image.
+    subject_label : str
+        Label of subject (without 'sub-').
+    bids_dir : str
+        Path to BIDS root directory.
+    defacer : str, optional
+        Name of the defacer that wrote the mask.
+
+    Returns
+    -------
+    str
+        Path to the defacing mask in sourcedata/bidsonym.
+    """
+
+    import os
+
+    basename = os.path.basename(image)
+    basename = basename[:basename.find('.nii')]
+    return os.path.join(bids_dir, "sourcedata/bidsonym/sub-%s" % subject_label,
+                        basename + '_space-native_defacemask-%s.nii.gz' % defacer)
+
+
+def deepdefacer_cmd(image, subject_label, bids_dir, outfile=None):
+    """
+    Run deepdefacer in-process.
 
     Parameters
     ----------
@@ -258,31 +749,37 @@ def deepdefacer_cmd(image, subject_label, bids_dir):
         Label of subject to operate on (without 'sub-').
     bids_dir : str
         Path to BIDS root directory.
+    outfile : str, optional
+        Name of the defaced file. Default is to overwrite image.
+
+    Returns
+    -------
+    outfile : str
+        Name of the defaced file.
     """
 
-    import os
-    from subprocess import check_call
+    # Imports are done here as this function is run as a Nipype Function node
+    from bidsonym.defacing_algorithms import (_defacemask_outfile,
+                                              deepdefacer_predict)
 
-    # Construct path for defacing mask output
-    # deepdefacer can output both defaced image and binary mask
-    maskfile = os.path.join(bids_dir,
-                            "sourcedata/bidsonym/sub-%s/sub-%s_T1w_space-native_defacemask-deepdefacer"
-                            % (subject_label, subject_label))
+    if outfile is None:
+        outfile = image
 
-    # Construct deepdefacer command
-    # Uses deep learning (U-Net) for face detection and removal
-    cmd = ["deepdefacer",                           # deepdefacer executable
-           "--input_file", image,                   # Input image to deface
-           "--defaced_output_path", image,          # Overwrite input with defaced version
-           "--mask_output_path", maskfile]          # Save defacing mask separately
-    
-    # Execute the deepdefacer command
-    check_call(cmd)
+    # Defacing mask is saved next to the non-de-identified images
+    maskfile = _defacemask_outfile(image, subject_label, bids_dir)
+
+    # The model is kept in memory, so further images processed by the
+    # same process skip loading the model
+    if deepdefacer_predict([image], [outfile], [maskfile])[0] is None:
+        raise RuntimeError(f"deepdefacer defacing of {image} failed.")
 
+    return outfile
 
-def run_deepdefacer(image, subject_label, bids_dir):
+
+def init_deepdefacer_wf(image, subject_label, bids_dir, outfile=None,
+                        batched=False, name='deface_wf'):
     """
-    Setup and run deepdefacer workflow.
+    Setup deepdefacer workflow.
 
     Parameters
     ----------
@@ -292,62 +789,440 @@ def run_deepdefacer(image, subject_label, bids_dir):
         Label of subject to operate on (without 'sub-').
     bids_dir : str
         Path to BIDS root directory.
+    outfile : str, optional
+        Name of the defaced file. Default is to overwrite image.
+    batched : bool, optional
+        If True, the workflow does not run deepdefacer itself. Instead,
+        'inputnode.defaced_file' has to be connected to the output of a
+        deepdefacer_predict node processing 'inputnode.in_file' as part
+        of a batch of images, written to 'inputnode.out_file' and
+        'inputnode.deface_mask_file'.
+    name : str, optional
+        Name of the workflow.
+
+    Returns
+    -------
+    deface_wf : nipype.pipeline.engine.Workflow
+        Workflow providing the defaced file as 'outputnode.out_file'.
     """
 
+    if outfile is None:
+        outfile = image
+
     # Create Nipype workflow for deepdefacer processing
-    deface_wf = pe.Workflow('deface_wf')
+    deface_wf = pe.Workflow(name)
     
     # Create input node
-    inputnode = pe.Node(niu.IdentityInterface(['in_file']),
+    inputnode = pe.Node(niu.IdentityInterface(['in_file', 'out_file', 'deface_mask_file',
+                                               'defaced_file']),
                         name='inputnode')
     
+    # Create output node exposing the defaced file
+    outputnode = pe.Node(niu.IdentityInterface(['out_file']),
+                         name='outputnode')
+
+    # Set workflow inputs
+    inputnode.inputs.in_file = image
+    inputnode.inputs.out_file = outfile
+    inputnode.inputs.deface_mask_file = _defacemask_outfile(image, subject_label, bids_dir)
+
+    if batched:
+        # The defaced image is provided by a batch of images processed at once
+        deface_wf.connect([(inputnode, outputnode, [('defaced_file', 'out_file')])])
+        return deface_wf
+    
     # Create function node that wraps deepdefacer_cmd
     # Integrates deepdefacer deep learning tool into workflow
-    deepdefacer = pe.Node(Function(input_names=['image', 'subject_label', 'bids_dir'],
+    deepdefacer = pe.Node(Function(input_names=['image', 'subject_label', 'bids_dir', 'outfile'],
                                    output_names=['outfile'],
                                    function=deepdefacer_cmd),
                           name='deepdefacer')
     
     # Connect workflow nodes
-    deface_wf.connect([(inputnode, deepdefacer, [('in_file', 'image')])])
+    deface_wf.connect([(inputnode, deepdefacer, [('in_file', 'image'),
+                                                 ('out_file', 'outfile')]),
+                       (deepdefacer, outputnode, [('outfile', 'out_file')])])
     
-    # Set workflow inputs
-    inputnode.inputs.in_file = image
     deepdefacer.inputs.subject_label = subject_label
     deepdefacer.inputs.bids_dir = bids_dir
     
+    return deface_wf
+
+
+def run_deepdefacer(image, subject_label, bids_dir, base_dir=None, outfile=None):
+    """
+    Setup and run deepdefacer workflow.
+
+    Parameters
+    ----------
+    image : str
+        Path to image that should be defaced.
+    subject_label : str
+        Label of subject to operate on (without 'sub-').
+    bids_dir : str
+        Path to BIDS root directory.
+    base_dir : str, optional
+        Directory in which the workflow is executed and its results are
+        cached, so that reruns with unchanged inputs are skipped.
+    outfile : str, optional
+        Name of the defaced file. Default is to overwrite image.
+    """
+
+    deface_wf = init_deepdefacer_wf(image, subject_label, bids_dir, outfile=outfile)
+    deface_wf.base_dir = base_dir
+
     # Execute the workflow
     deface_wf.run()
 
 
-def run_image_deface(image, t1w_deface_mask, outfile):
+def _map_images(function, images, outdir, n_workers=1):
     """
-    Setup and run image defacing workflow.
+    Apply a single image defacing function to a list of images, using
+    n_workers threads.
+
+    Parameters
+    ----------
+    function : callable
+        Function with the signature function(image, outfile).
+    images : list of str
+        Paths to images that should be defaced.
+    outdir : str
+        Directory the defaced images are written to, keeping their file
+        names.
+    n_workers : int, optional
+        Number of images processed in parallel.
+
+    Returns
+    -------
+    list of str or None
+        Defaced file of every image, None for images that failed. Errors
+        are reported, but do not stop the remaining images.
+    """
+
+    import os
+    import traceback
+    from concurrent.futures import ThreadPoolExecutor
+
+    def deface(image):
+        try:
+            return function(image, os.path.join(outdir, os.path.basename(image)))
+        except Exception:
+            print(f"{function.__name__}: defacing {image} failed")
+            traceback.print_exc()
+            return None
+
+    # The defacers run as separate programs (or release the GIL), so
+    # threads are sufficient to process several images at once
+    with ThreadPoolExecutor(max_workers=max(1, n_workers or 1)) as executor:
+        return list(executor.map(deface, images))
+
+
+def pydeface_batch(images, outdir, n_workers=1):
+    """
+    Deface a list of images via pydeface, see bidsonym.defacers.deface_batch.
+    """
+
+    return _map_images(pydeface_cmd, images, outdir, n_workers)
+
+
+def mri_deface_batch(images, outdir, n_workers=1):
+    """
+    Deface a list of images via mri_deface, see
+    bidsonym.defacers.deface_batch.
+    """
+
+    return _map_images(mri_deface_cmd, images, outdir, n_workers)
+
+
+def mridefacer_batch(images, outdir, n_workers=1):
+    """
+    Deface a list of images via mridefacer, see
+    bidsonym.defacers.deface_batch.
+    """
+
+    # mridefacer writes to the directory of its second argument
+    return _map_images(mridefacer_cmd, images, outdir, n_workers)
+
+
+def quickshear_batch(images, outdir, n_workers=1, mask_files=None):
+    """
+    Deface a list of images via the native Quickshear implementation, see
+    bidsonym.defacers.deface_batch.
+
+    Parameters
+    ----------
+    mask_files : list of str, optional
+        Brain masks or brain extracted images, one per image. By default,
+        brain masks are computed via BET (frac=0.5), which requires FSL.
+    """
+
+    import os
+    import shutil
+    from tempfile import TemporaryDirectory
+
+    if mask_files is None:
+        mask_files = [None] * len(images)
+    masks = dict(zip(images, mask_files))
+
+    # Fail once for the whole batch instead of once per image
+    if None in mask_files and shutil.which('bet') is None:
+        raise RuntimeError("Quickshear needs brain masks of the images: "
+                           "either provide them via mask_files or install "
+                           "FSL, whose bet is used to compute them.")
+
+    # Brain masks computed here are only kept until all images are defaced
+    with TemporaryDirectory(prefix='bidsonym_bet_') as bet_dir:
+        def deface(image, outfile):
+            mask_file = masks[image]
+            if mask_file is None:
+                from nipype.interfaces.fsl import BET
+                mask_file = BET(in_file=image, mask=True, frac=0.5,
+                                out_file=os.path.join(bet_dir, os.path.basename(outfile))
+                                ).run().outputs.mask_file
+            return quickshear_image(image, mask_file, outfile, buff=50)
+
+        deface.__name__ = 'quickshear'
+        return _map_images(deface, images, outdir, n_workers)
+
+
+def deepdefacer_batch(images, outdir, n_workers=1):
+    """
+    Deface a list of images via deepdefacer in-process, see
+    bidsonym.defacers.deface_batch. The model is loaded once and the
+    defacing masks are written as well.
+    """
+
+    import os
+    from bidsonym.defacers import defacemask_file
+
+    outfiles = [os.path.join(outdir, os.path.basename(image)) for image in images]
+    maskfiles = [defacemask_file(image, outdir) for image in images]
+    return deepdefacer_predict(images, outfiles, maskfiles, n_threads=n_workers)
+
+
+def init_defacer_wf(defacer, image, outfile, maskfile=None, batched=False,
+                    name='deface_wf'):
+    """
+    Setup a workflow defacing an image via a registered defacer (see
+    bidsonym.defacers).
 
     Parameters
     ----------
+    defacer : str
+        Name of the defacer.
     image : str
         Path to image that should be defaced.
-    t1w_deface_mask : str
+    outfile : str
+        Name of the defaced file.
+    maskfile : str, optional
+        Name the defacing mask is saved as, if the defacer writes one.
+    batched : bool, optional
+        If True, the workflow does not run the defacer itself. Instead,
+        'inputnode.defaced_file' has to be connected to the output of a
+        deface_files node processing 'inputnode.in_file' as part of a
+        batch of images, written to 'inputnode.out_file' and
+        'inputnode.deface_mask_file'.
+    name : str, optional
+        Name of the workflow.
+
+    Returns
+    -------
+    deface_wf : nipype.pipeline.engine.Workflow
+        Workflow providing the defaced file as 'outputnode.out_file'. If
+        the defacer accepts brain masks, 'inputnode.mask_file' can be
+        connected to one.
+    """
+
+    from bidsonym.defacers import get_defacer, deface_file
+
+    # Create workflow for the defacer
+    deface_wf = pe.Workflow(name)
+
+    # Create input node
+    inputnode = pe.Node(niu.IdentityInterface(['in_file', 'out_file', 'deface_mask_file',
+                                               'mask_file', 'defaced_file']),
+                        name='inputnode')
+
+    # Create output node exposing the defaced file
+    outputnode = pe.Node(niu.IdentityInterface(['out_file']),
+                         name='outputnode')
+
+    # Set workflow inputs
+    inputnode.inputs.in_file = image
+    inputnode.inputs.out_file = outfile
+    if maskfile is not None:
+        inputnode.inputs.deface_mask_file = maskfile
+
+    if batched:
+        # The defaced image is provided by a batch of images processed at once
+        deface_wf.connect([(inputnode, outputnode, [('defaced_file', 'out_file')])])
+        return deface_wf
+
+    # Create function node that defaces the image via deface_batch
+    input_names = ['defacer', 'image', 'outfile', 'maskfile']
+    if 'mask_files' in get_defacer(defacer)['options']:
+        input_names.append('mask_file')
+    deface = pe.Node(Function(input_names=input_names,
+                              output_names=['outfile'],
+                              function=deface_file),
+                     name=defacer)
+    deface.inputs.defacer = defacer
+
+    # Connect workflow nodes
+    deface_wf.connect([(inputnode, deface, [('in_file', 'image'),
+                                            ('out_file', 'outfile')]),
+                       (deface, outputnode, [('outfile', 'out_file')])])
+    if maskfile is not None:
+        deface_wf.connect([(inputnode, deface, [('deface_mask_file', 'maskfile')])])
+    if 'mask_file' in input_names:
+        deface_wf.connect([(inputnode, deface, [('mask_file', 'mask_file')])])
+
+    return deface_wf
+
+
+def registration_cache_key(in_file, reference, cost_func='mutualinfo'):
+    """
+    Key of a cached FLIRT registration, see flirt_cached.
+
+    Parameters
+    ----------
+    in_file : str
+        Path to image that is registered.
+    reference : str
+        Path to reference image.
+    cost_func : str, optional
+        Cost function of the registration.
+
+    Returns
+    -------
+    str
+        Hex digest of the sha256 of both images and the cost function.
+    """
+
+    import hashlib
+
+    key = hashlib.sha256(cost_func.encode())
+    for image in [in_file, reference]:
+        # Hash each image separately, so that the boundary between the
+        # images is part of the key
+        digest = hashlib.sha256()
+        with open(image, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                digest.update(chunk)
+        key.update(digest.digest())
+
+    return key.hexdigest()
+
+
+def flirt_cached(in_file, reference, cache_dir=None):
+    """
+    Register an image to a reference image via FLIRT, reusing a previously
+    estimated transformation if available.
+
+    Transformations are cached as FLIRT matrices in cache_dir, keyed by
+    the content of in_file and reference (see registration_cache_key).
+    Reruns with a persistent --work_dir, e.g. via --resume, thus only
+    resample in_file via the cached matrix instead of registering it
+    again. Transformations are not shared between images, e.g. further
+    echoes or runs on the same voxel grid as reference, as the head might
+    have moved between the acquisitions.
+
+    Parameters
+    ----------
+    in_file : str
+        Path to image that should be registered.
+    reference : str
+        Path to reference image.
+    cache_dir : str, optional
+        Directory in which transformations are cached. If None, the
+        registration is always estimated.
+
+    Returns
+    -------
+    out_file : str
+        Path to in_file registered to reference.
+    out_matrix_file : str
+        Path to the FLIRT matrix mapping in_file to reference.
+    """
+
+    # Imports are done here as this function is run as a Nipype Function node
+    import os
+    import shutil
+    from nipype.interfaces.fsl import FLIRT
+    from bidsonym.defacing_algorithms import registration_cache_key
+
+    # Cost function is part of the key, changing it invalidates the cache
+    cost_func = 'mutualinfo'
+
+    cache_file = None
+    if cache_dir is not None:
+        key = registration_cache_key(in_file, reference, cost_func)
+        cache_file = os.path.join(cache_dir, key + '.mat')
+
+    if cache_file is not None and os.path.exists(cache_file):
+        # Only resample in_file to reference via the cached transformation
+        res = FLIRT(in_file=in_file, reference=reference, apply_xfm=True,
+                    in_matrix_file=cache_file, output_type='NIFTI_GZ').run()
+        return os.path.abspath(res.outputs.out_file), cache_file
+
+    res = FLIRT(in_file=in_file, reference=reference, cost_func=cost_func,
+                output_type='NIFTI_GZ').run()
+    out_matrix_file = os.path.abspath(res.outputs.out_matrix_file)
+
+    if cache_file is not None:
+        # Copy to a temporary file first, so that concurrent processes
+        # never read a partially written matrix
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp_file = f'{cache_file}.{os.getpid()}.tmp'
+        shutil.copyfile(out_matrix_file, tmp_file)
+        os.replace(tmp_file, cache_file)
+
+    return os.path.abspath(res.outputs.out_file), out_matrix_file
+
+
+def init_image_deface_wf(image, t1w_deface_mask, outfile,
+                         registration_cache_dir=None, name='deface_wf'):
+    """
+    Setup image defacing workflow.
+
+    Parameters
+    ----------
+    image : str
+        Path to image that should be defaced.
+    t1w_deface_mask : str or None
         Path to the defaced T1w image that will be used
-        as defacing mask.
+        as defacing mask. If None, 'inputnode.t1w_deface_mask'
+        has to be connected, e.g. to the output of a T1w
+        defacing workflow.
     outfile : str
         Name of the defaced file.
+    registration_cache_dir : str, optional
+        Directory in which T1w to image registrations are cached and
+        reused from, see flirt_cached. If None, the registration is
+        always estimated.
+    name : str, optional
+        Name of the workflow.
+
+    Returns
+    -------
+    deface_wf : nipype.pipeline.engine.Workflow
+        Workflow providing the defaced file as 'outputnode.out_file'.
     """
 
     # Create workflow for applying T1w defacing mask to other image modalities
     # This allows defacing of non-T1w images using a T1w-derived mask
-    deface_wf = pe.Workflow('deface_wf')
+    deface_wf = pe.Workflow(name)
     
     # Create input node
-    inputnode = pe.Node(niu.IdentityInterface(['in_file']),
+    inputnode = pe.Node(niu.IdentityInterface(['in_file', 't1w_deface_mask']),
                         name='inputnode')
     
     # Create FLIRT node for image registration
     # Registers the T1w defacing mask to the target image space
-    # Uses mutual information cost function for robust cross-modal registration
-    flirtnode = pe.Node(FLIRT(cost_func='mutualinfo',
-                              output_type="NIFTI_GZ"),
+    # and reuses cached registrations of the same pair of images
+    flirtnode = pe.Node(Function(input_names=['in_file', 'reference', 'cache_dir'],
+                                 output_names=['out_file', 'out_matrix_file'],
+                                 function=flirt_cached),
                         name='flirtnode')
     
     # Create deface_image node using the custom deface_image function
@@ -357,17 +1232,55 @@ def run_image_deface(image, t1w_deface_mask, outfile):
                                          function=deface_image),
                                 name='deface_image')
     
+    # Create output node exposing the defaced file
+    outputnode = pe.Node(niu.IdentityInterface(['out_file']),
+                         name='outputnode')
+    
     # Connect workflow nodes
     # FLIRT registers T1w mask to target image space
     # deface_image applies the warped mask to remove facial features
-    deface_wf.connect([(inputnode, flirtnode, [('in_file', 'reference')]),      # Target image as reference
+    deface_wf.connect([(inputnode, flirtnode, [('in_file', 'reference'),             # Target image as reference
+                                               ('t1w_deface_mask', 'in_file')]),     # T1w defacing mask to register
                        (inputnode, deface_image_node, [('in_file', 'image')]),        # Target image to deface
-                       (flirtnode, deface_image_node, [('out_file', 'warped_mask')])])  # Registered mask
+                       (flirtnode, deface_image_node, [('out_file', 'warped_mask')]),  # Registered mask
+                       (deface_image_node, outputnode, [('outfile', 'out_file')])])   # Defaced image
     
     # Set workflow inputs
     inputnode.inputs.in_file = image              # Image to be defaced
-    flirtnode.inputs.in_file = t1w_deface_mask    # T1w defacing mask to register
+    if t1w_deface_mask is not None:
+        inputnode.inputs.t1w_deface_mask = t1w_deface_mask  # T1w defacing mask to register
+    if registration_cache_dir is not None:
+        flirtnode.inputs.cache_dir = str(registration_cache_dir)
     deface_image_node.inputs.outfile = outfile          # Output file path
     
+    return deface_wf
+
+
+def run_image_deface(image, t1w_deface_mask, outfile, base_dir=None,
+                     registration_cache_dir=None):
+    """
+    Setup and run image defacing workflow.
+
+    Parameters
+    ----------
+    image : str
+        Path to image that should be defaced.
+    t1w_deface_mask : str
+        Path to the defaced T1w image that will be used
+        as defacing mask.
+    outfile : str
+        Name of the defaced file.
+    base_dir : str, optional
+        Directory in which the workflow is executed and its results are
+        cached, so that reruns with unchanged inputs are skipped.
+    registration_cache_dir : str, optional
+        Directory in which T1w to image registrations are cached and
+        reused from, see flirt_cached.
+    """
+
+    deface_wf = init_image_deface_wf(image, t1w_deface_mask, outfile,
+                                     registration_cache_dir=registration_cache_dir)
+    deface_wf.base_dir = base_dir
+
     # Execute the workflow
     deface_wf.run()
@@ -1,27 +1,189 @@
 # Import all required modules at the top
+# Modules used by the plotting functions are imported within them, as these
+# are run as Nipype Function nodes, Nipype itself is only imported when
+# the report workflow is set up
 import os
+import json
+import queue
+import atexit
+import logging
+import threading
 from datetime import datetime
-from glob import glob
-from os.path import join as opj
-from shutil import move
+from logging.handlers import MemoryHandler, QueueHandler, QueueListener
 
-import matplotlib.pyplot as plt
-from matplotlib.pyplot import figure
-import nipype.pipeline.engine as pe
-from nipype import Function
-from nipype.interfaces import utility as niu
-from bids import BIDSLayout
-from nilearn.plotting import find_cut_slices, plot_stat_map
-import gif_your_nifti.core as gif2nif
+
+class _LogFormatter(logging.Formatter):
+    """
+    Format log records as text lines or, optionally, as JSON lines.
+    """
+
+    def __init__(self, json_lines=False):
+        super().__init__('[%(asctime)s] [%(level)s] %(message)s',
+                         '%Y-%m-%d %H:%M:%S')
+        self.json_lines = json_lines
+
+    def format(self, record):
+        if not self.json_lines:
+            return super().format(record)
+        return json.dumps({
+            'time': self.formatTime(record, self.datefmt),
+            'level': record.level,
+            'operation': record.operation,
+            'subject': record.subject,
+            'session': record.session,
+            'message': record.getMessage()
+        })
+
+
+def _log_level(level):
+    """
+    Get the numeric logging level of a level name, unknown names are
+    logged as INFO.
+    """
+
+    level_number = logging.getLevelName(level)
+    return level_number if isinstance(level_number, int) else logging.INFO
+
+
+# Records of all log files set up via setup_logging are written by a
+# single background thread per process. Open log files are shared by
+# the log_print functions of the same log path and closed once the last
+# of them is closed (see _close_log_file)
+_log_listener = None
+_log_listener_pid = None
+_log_records = None
+_log_files = {}
+_log_lock = threading.Lock()
+
+
+def _close_handler(handler):
+    """
+    Write out the buffered records of a log file and close it.
+    """
+
+    # Closing the buffer resets its target
+    file_handler = handler.target
+    handler.close()
+    file_handler.close()
+
+
+class _LogFileDispatcher(logging.Handler):
+    """
+    Pass log records on to the buffered handler of their log file, or
+    close that handler if the record is a close request.
+    """
+
+    def emit(self, record):
+        if getattr(record, 'close_log', None) is not None:
+            _close_handler(record.log_handler)
+            record.close_log.set()
+        else:
+            record.log_handler.handle(record)
+
+
+def _start_log_listener():
+    """
+    Start the thread writing the log files of this process, if it is not
+    running yet. Processes forked from a process that was already logging
+    start their own thread, as threads are not inherited.
+    """
+
+    global _log_listener, _log_listener_pid, _log_records, _log_files
+
+    if _log_listener is not None and _log_listener_pid == os.getpid():
+        return
+
+    _log_records = queue.SimpleQueue()
+    _log_files = {}
+    _log_listener = QueueListener(_log_records, _LogFileDispatcher())
+    _log_listener.start()
+    _log_listener_pid = os.getpid()
+    logger = logging.getLogger("bidsonym.logfiles")
+    logger.propagate = False
+    logger.setLevel(logging.DEBUG)
+    logger.handlers = [QueueHandler(_log_records)]
+
+
+def _stop_logging():
+    """
+    Write out all queued and buffered records and close the log files
+    that are still open, at exit.
+    """
+
+    global _log_listener
+
+    with _log_lock:
+        if _log_listener is None or _log_listener_pid != os.getpid():
+            return
+        _log_listener.stop()
+        _log_listener = None
+        for log_file in _log_files.values():
+            _close_handler(log_file['handler'])
+        _log_files.clear()
+
+
+atexit.register(_stop_logging)
+
+
+def _open_log_file(log_path, json_lines):
+    """
+    Get the buffered handler of a log file, opening the file if no other
+    log_print function is using it.
+    """
+
+    with _log_lock:
+        _start_log_listener()
+        if log_path not in _log_files:
+            file_handler = logging.FileHandler(log_path, mode='a',
+                                               encoding='utf-8')
+            file_handler.setFormatter(_LogFormatter(json_lines))
+            # Warnings and errors are written out right away, so that
+            # they are not lost if the process is killed
+            _log_files[log_path] = {
+                'handler': MemoryHandler(32, flushLevel=logging.WARNING,
+                                         target=file_handler),
+                'users': 0,
+            }
+        _log_files[log_path]['users'] += 1
+        return _log_files[log_path]['handler']
+
+
+def _close_log_file(log_path, handler):
+    """
+    Release a log file opened via _open_log_file. Once it has no users
+    left, its queued records are written and the file is closed.
+    """
+
+    with _log_lock:
+        log_file = _log_files.get(log_path)
+        if log_file is None or log_file['handler'] is not handler:
+            return
+        log_file['users'] -= 1
+        if log_file['users'] > 0:
+            return
+        del _log_files[log_path]
+        closed = threading.Event()
+        _log_records.put(logging.makeLogRecord(
+            {'close_log': closed, 'log_handler': handler}))
+
+    # Wait until the listener wrote the remaining records, so that the
+    # file is closed once close() returns
+    closed.wait(timeout=10)
 
 
 def setup_logging(bids_dir, subject_label, session=None, 
-                  operation="bidsonymrevert"):
+                  operation="bidsonymrevert", json_lines=False,
+                  log_queue=None):
     """
     Set up logging functionality for BIDSonym operations.
     
     Creates a BIDS-compliant log file and returns a logging function that 
     writes to both console and the log file with timestamps and severity levels.
+
+    Messages are passed through a queue to a background thread, which
+    keeps the log file open and writes buffered records (immediately for
+    warnings and errors), so that logging a message does not open the log
+    file. The log file is closed via log_print.close() or at exit.
     
     Parameters
     ----------
@@ -33,23 +195,49 @@ def setup_logging(bids_dir, subject_label, session=None,
         Session label (without 'ses-' prefix), if applicable.
     operation : str, optional
         Name of the operation being logged (default: 'bidsonymrevert').
+    json_lines : bool, optional
+        Write the log as JSON lines (.jsonl) instead of text.
+    log_queue : queue, optional
+        Queue shared with another process (see forward_logging). If
+        provided, messages are sent to that process' log instead of
+        creating a log file.
         
     Returns
     -------
     tuple
         (log_print_function, log_file_path)
-        log_print_function: Function to print and log messages
+        log_print_function: Function to print and log messages, its
+        close() method writes out the remaining messages and closes the
+        log file
         log_file_path: Path to the created log file
     """
+
+    context = {'operation': operation, 'subject': subject_label,
+               'session': session}
+
+    # Worker processes send their records to the process owning the log
+    if log_queue is not None:
+        logger = logging.getLogger(f"bidsonym.{operation}.worker.sub-{subject_label}")
+        logger.propagate = False
+        logger.setLevel(logging.DEBUG)
+        logger.handlers = [QueueHandler(log_queue)]
+
+        def log_print(message="", level="INFO"):
+            logger.log(_log_level(level), message,
+                       extra=dict(context, level=level))
+
+        log_print.close = lambda: None
+        return log_print, None
     
     # Create BIDS-compliant log filename with timestamp
     timestamp = datetime.now().strftime("%Y%m%dT%H%M%S")
+    extension = 'jsonl' if json_lines else 'log'
     if session is not None:
         log_filename = (f"sub-{subject_label}_ses-{session}_desc-"
-                        f"{operation}_{timestamp}.log")
+                        f"{operation}_{timestamp}.{extension}")
     else:
         log_filename = (f"sub-{subject_label}_desc-{operation}_"
-                        f"{timestamp}.log")
+                        f"{timestamp}.{extension}")
     
     # Create log directory following BIDS conventions with subject subdirectory
     log_base_dir = os.path.join(bids_dir, "sourcedata", "bidsonym", 
@@ -58,39 +246,54 @@ def setup_logging(bids_dir, subject_label, session=None,
     os.makedirs(log_subject_dir, exist_ok=True)
     log_path = os.path.join(log_subject_dir, log_filename)
     
-    # Initialize log file with header information
+    # Initialize log file with header information, unless it is already
+    # in use, i.e. set up again within the same second
     try:
-        with open(log_path, 'w', encoding='utf-8') as log_file:
-            log_file.write("=" * 80 + '\n')
-            log_file.write(f"BIDSonym {operation.title()} Log\n")
-            log_file.write("=" * 80 + '\n')
-            log_file.write(f"Timestamp: "
-                           f"{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
-            log_file.write(f"Subject: sub-{subject_label}\n")
-            if session is not None:
-                log_file.write(f"Session: ses-{session}\n")
-            log_file.write(f"BIDS Directory: {bids_dir}\n")
-            log_file.write(f"Log File: {log_path}\n")
-            log_file.write("=" * 80 + '\n\n')
+        with open(log_path, 'a' if log_path in _log_files else 'w',
+                  encoding='utf-8') as log_file:
+            if not json_lines and log_path not in _log_files:
+                log_file.write("=" * 80 + '\n')
+                log_file.write(f"BIDSonym {operation.title()} Log\n")
+                log_file.write("=" * 80 + '\n')
+                log_file.write(f"Timestamp: "
+                               f"{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
+                log_file.write(f"Subject: sub-{subject_label}\n")
+                if session is not None:
+                    log_file.write(f"Session: ses-{session}\n")
+                log_file.write(f"BIDS Directory: {bids_dir}\n")
+                log_file.write(f"Log File: {log_path}\n")
+                log_file.write("=" * 80 + '\n\n')
+
+        # The log file is opened once and records are buffered, warnings
+        # and errors are written out right away
+        log_handler = _open_log_file(log_path, json_lines)
+        logger = logging.getLogger("bidsonym.logfiles")
+        closed = []
         
-        # Create the log_print function with access to log_path
+        # Create the log_print function with access to the logger
         def log_print(message="", level="INFO"):
             """Print message to console and write to log file with timestamp 
             and level."""
-            timestamp_str = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            log_message = f"[{timestamp_str}] [{level}] {message}"
             
             # Print to console (original behavior)
             print(message)
             
             # Write to log file
             try:
-                with open(log_path, 'a', encoding='utf-8') as log_file:
-                    log_file.write(log_message + '\n')
+                logger.log(_log_level(level), message,
+                           extra=dict(context, level=level,
+                                      log_handler=log_handler))
             except Exception as e:
                 # If logging fails, at least show the error on console
                 print(f"WARNING: Could not write to log file: {e}")
         
+        def close():
+            """Write out the remaining messages and release the log file."""
+            if not closed:
+                closed.append(True)
+                _close_log_file(log_path, log_handler)
+        
+        log_print.close = close
         return log_print, log_path
         
     except Exception as e:
@@ -100,10 +303,258 @@ def setup_logging(bids_dir, subject_label, session=None,
         def log_print(message="", level="INFO"):
             print(message)
         
+        log_print.close = lambda: None
         return log_print, None
 
 
-def plot_defaced(bids_dir, subject_label, session=None, t2w=None):
+class _LogPrintHandler(logging.Handler):
+    """
+    Pass log records of worker processes on to a log_print function.
+    """
+
+    def __init__(self, log_print):
+        super().__init__()
+        self.log_print = log_print
+
+    def emit(self, record):
+        self.log_print(f"[sub-{record.subject}] {record.getMessage()}",
+                       record.level)
+
+
+def forward_logging(log_print, log_queue):
+    """
+    Forward the messages worker processes log via
+    setup_logging(..., log_queue=log_queue) to log_print, so that
+    parallel subject runs share one log.
+
+    Parameters
+    ----------
+    log_print : function
+        Logging function of the process owning the log.
+    log_queue : queue
+        Queue shared with the worker processes, e.g. created via
+        multiprocessing.Manager().Queue().
+
+    Returns
+    -------
+    logging.handlers.QueueListener
+        Started listener, which has to be stopped once all workers are done.
+    """
+
+    listener = QueueListener(log_queue, _LogPrintHandler(log_print))
+    listener.start()
+    return listener
+
+
+def render_map(function, tasks, n_workers=1):
+    """
+    Render a list of tasks, in parallel via a pool of rendering processes
+    if more than one worker is requested.
+
+    The pool only lives for one call, so that no rendering processes are
+    left behind in Nipype worker processes. Modules imported before the
+    call are inherited by the forked rendering processes.
+
+    Parameters
+    ----------
+    function : callable
+        Module-level function rendering a single task.
+    tasks : list of tuple
+        Arguments of function, one tuple per task.
+    n_workers : int, optional
+        Number of rendering processes, independent of the processes used
+        for defacing. Daemonic processes, which cannot start processes of
+        their own, render serially.
+
+    Returns
+    -------
+    list
+        Results of function, in the order of tasks.
+    """
+
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+
+    if (not n_workers or n_workers <= 1 or len(tasks) < 2 or
+            multiprocessing.current_process().daemon):
+        return [function(*task) for task in tasks]
+
+    with ProcessPoolExecutor(max_workers=min(n_workers, len(tasks))) as pool:
+        return list(pool.map(function, *zip(*tasks)))
+
+
+def _load_volume(image):
+    """
+    Load the first volume of an image in RAS+ orientation.
+
+    The data keeps its on-disk data type (unless it is scaled) and is
+    memory-mapped for uncompressed images. Of 4D images, only the first
+    volume is read. The reorientation only flips
+    and transposes the array, i.e. it is not copied.
+
+    Parameters
+    ----------
+    image : str or nibabel image
+        Path to image or loaded image.
+
+    Returns
+    -------
+    tuple
+        (img, data, zooms)
+        img: Loaded nibabel image
+        data: 3D array in RAS+ orientation
+        zooms: Voxel sizes in the order of the axes of data
+    """
+
+    import numpy as np
+    import nibabel as nib
+    from nibabel.orientations import apply_orientation, io_orientation
+
+    img = nib.load(image) if isinstance(image, str) else image
+    # Only the first volume of 4D (or higher) images is read from disk
+    extra_dims = len(img.shape) - 3
+    data = np.asanyarray(img.dataobj[(Ellipsis,) + (0,) * extra_dims]
+                         if extra_dims > 0 else img.dataobj)
+
+    ornt = io_orientation(img.affine)
+    data = apply_orientation(data, ornt)
+    zooms = np.array(img.header.get_zooms()[:3])[np.argsort(ornt[:, 0])]
+
+    return img, data, zooms
+
+
+def slice_montage(defaced, brainmask, n_cuts=12, width=1500,
+                  color=(255, 0, 0), alpha=0.5):
+    """
+    Render the brain mask overlaid on slices of a defaced image, one row
+    of n_cuts slices per direction (sagittal, coronal, axial).
+
+    Both images are loaded once and all slices of a direction are taken
+    at once via NumPy indexing. The overlay is alpha blended for all
+    slices at once and only the rows are resized (via Pillow), which is
+    much faster than plotting every panel with nilearn. Only the taken
+    slices are converted to floating point, so that the memory needed
+    beyond the (memory-mapped) images is small and does not grow with
+    the number of rendered images.
+
+    Parameters
+    ----------
+    defaced : str
+        Path to defaced image.
+    brainmask : str
+        Path to brain mask of the image, resampled to the image grid if
+        necessary.
+    n_cuts : int, optional
+        Number of slices per direction, evenly spread over the head.
+    width : int, optional
+        Width of the montage in pixels.
+    color : tuple of int, optional
+        RGB color of the brain mask.
+    alpha : float, optional
+        Opacity of the brain mask.
+
+    Returns
+    -------
+    numpy.ndarray
+        Montage as RGB image (height x width x 3, uint8).
+    """
+
+    import numpy as np
+    import nibabel as nib
+    from PIL import Image
+    from bidsonym.reports import _load_volume
+
+    # Use RAS+ orientation, so that all images are shown the same way
+    img, data, zooms = _load_volume(defaced)
+
+    # Only masks on a different grid need to be resampled, otherwise the
+    # mask is reoriented the same way as the image
+    mask_img = nib.load(brainmask)
+    if (mask_img.shape[:3] != img.shape[:3] or
+            not np.allclose(mask_img.affine, img.affine, atol=1e-3)):
+        from nibabel.processing import resample_from_to
+        if len(mask_img.shape) > 3:
+            mask_img = mask_img.slicer[..., 0]
+        mask_img = resample_from_to(mask_img, (img.shape[:3], img.affine), order=0)
+    mask = _load_volume(mask_img)[1]
+
+    # Scale the intensities to [0, 1] based on a subsample of the volume,
+    # robust to single bright voxels
+    sample = np.asarray(data[::2, ::2, ::2], dtype=np.float32)
+    sample = sample[sample != 0]
+    low, high = np.percentile(sample, (1, 99.5)) if sample.size else (0, 1)
+    scale = 1 / ((high - low) or 1)
+
+    # Voxels within the head, used to spread the slices
+    head = data != 0
+    overlay = np.array(color, dtype=np.float32) / 255
+
+    rows = []
+    for axis in range(3):
+        in_plane = [other for other in range(3) if other != axis]
+
+        # Slices evenly spread over the extent of the head along this axis
+        extent = np.flatnonzero(head.any(axis=tuple(in_plane)))
+        first, last = (extent[0], extent[-1]) if extent.size else (0, data.shape[axis] - 1)
+        cuts = np.linspace(first, last, n_cuts + 2)[1:-1].round().astype(int)
+
+        # Take all slices at once, as (cut, horizontal, vertical) arrays,
+        # and rotate them so that the vertical axis points up
+        # Only these slices are scaled to [0, 1] in floating point
+        slices = np.rot90(np.moveaxis(data.take(cuts, axis=axis), axis, 0), axes=(1, 2))
+        slices = np.clip((slices.astype(np.float32) - low) * scale, 0, 1)
+        masks = np.rot90(np.moveaxis(mask.take(cuts, axis=axis) > 0, axis, 0), axes=(1, 2))
+
+        # Alpha blend the brain mask onto all slices at once
+        weight = alpha * masks[..., np.newaxis]
+        blended = slices[..., np.newaxis] * (1 - weight) + overlay * weight
+
+        # Put the slices next to each other and resize the row to the
+        # montage width, keeping the physical aspect ratio of the voxels
+        row = np.concatenate(blended, axis=1)
+        aspect = zooms[in_plane[1]] / zooms[in_plane[0]]
+        height = max(1, int(round(width * row.shape[0] * aspect / row.shape[1])))
+        row = Image.fromarray((row * 255).astype(np.uint8)).resize(
+            (width, height), Image.BILINEAR
+        )
+        rows.append(np.asarray(row))
+
+    return np.concatenate(rows, axis=0)
+
+
+def _render_montage(defaced, brainmask, outfile):
+    """
+    Render the brain mask plot of a defaced image (see slice_montage) and
+    save it as PNG.
+
+    Parameters
+    ----------
+    defaced : str
+        Path to defaced image.
+    brainmask : str
+        Path to brain mask of the image.
+    outfile : str
+        Name of the PNG file.
+
+    Returns
+    -------
+    outfile : str
+        Name of the PNG file.
+    """
+
+    from PIL import Image
+    from bidsonym.reports import slice_montage
+
+    # Close the image right away, so that its buffer is released before
+    # the next plot is rendered by the same (long-lived) worker
+    with Image.fromarray(slice_montage(defaced, brainmask)) as montage:
+        montage.save(outfile)
+    return outfile
+
+
+def plot_defaced(bids_dir, subject_label, session=None, modalities=['T1w'],
+                 defaced_files=None, brainmask_files=None, database_path=None,
+                 n_workers=1):
     """
     Plot brainmask created from original non-defaced image on defaced image
     to evaluate defacing performance.
@@ -111,7 +562,8 @@ def plot_defaced(bids_dir, subject_label, session=None, t2w=None):
     This function creates static plots showing the brain mask overlaid on the
     defaced images to visually assess the quality of the defacing process.
     The plots show axial, coronal, and sagittal views with the brain mask
-    highlighting preserved brain regions.
+    highlighting preserved brain regions, rendered via slice_montage. The
+    plots of all images are rendered in parallel if n_workers > 1.
 
     Parameters
     ----------
@@ -122,142 +574,220 @@ def plot_defaced(bids_dir, subject_label, session=None, t2w=None):
     session : str, optional
         If multiple sessions exist, create one plot per session.
         If None, processes all sessions for the subject.
-    t2w : bool, optional
-        If True and T2w/FLAIR images exist, create plots for those as well.
-        Currently processes FLAIR images when t2w=True.
+    modalities : list of str, optional
+        Image modalities that should be plotted if defaced_files is not
+        provided. Default is ['T1w'].
+    defaced_files : list of str, optional
+        Defaced images that should be plotted. If None, the defaced images
+        are queried from the BIDS dataset based on modalities.
+    brainmask_files : list of str, optional
+        Brain masks matching defaced_files. If None, the brain masks are
+        located in sourcedata/bidsonym via their naming convention.
+    database_path : str, optional
+        Directory holding the SQLite index of the BIDS dataset, which is
+        used instead of re-indexing the dataset if defaced_files is None.
+    n_workers : int, optional
+        Number of processes rendering the plots, see render_map.
 
     Returns
     -------
-    tuple
-        (t1w_files, t2w_flag) - paths to processed T1w files and t2w parameter
+    list of str
+        Paths to the created plots.
     """
 
-    # Initialize BIDS layout to query dataset structure
-    layout = BIDSLayout(bids_dir)
-    
+    # Imports are done here as this function is run as a Nipype Function node
+    from glob import glob
+    from os.path import join as opj
+    from bidsonym.utils import get_bids_layout
+    from bidsonym.reports import render_map, _render_montage
+
     # Define path to BIDSonym sourcedata directory for this subject
     bidsonym_path = opj(bids_dir, f'sourcedata/bidsonym/sub-{subject_label}')
 
-    # Query for T1w images based on session specification
-    if session is not None:
-        # Get T1w images for specific session
-        defaced_t1w = layout.get(
-            subject=subject_label, 
-            extension='nii.gz', 
-            suffix='T1w',
-            return_type='filename', 
-            session=session
-        )
-    else:
-        # Get all T1w images for subject (all sessions)
-        defaced_t1w = layout.get(
-            subject=subject_label, 
-            extension='nii.gz', 
-            suffix='T1w',
-            return_type='filename'
-        )
+    # Query for defaced images based on session specification
+    if defaced_files is None:
+        # Initialize BIDS layout to query dataset structure
+        layout = get_bids_layout(bids_dir, database_path)
+        defaced_files = []
+        for modality in modalities:
+            if session is not None:
+                # Get images for specific session
+                defaced_files += layout.get(
+                    subject=subject_label, 
+                    extension='nii.gz', 
+                    suffix=modality,
+                    return_type='filename', 
+                    session=session
+                )
+            else:
+                # Get all images for subject (all sessions)
+                defaced_files += layout.get(
+                    subject=subject_label, 
+                    extension='nii.gz', 
+                    suffix=modality,
+                    return_type='filename'
+                )
 
-    # Process each T1w image found
-    for t1w in defaced_t1w:
-        # Construct path to corresponding brain mask file
-        # Extract filename and replace extension with brain mask naming convention
-        brain_mask_pattern = (
-            t1w[t1w.rfind('/') + 1:t1w.rfind('.nii')] + 
-            '_brainmask_desc-nondeid.nii.gz'
-        )
-        brainmask_t1w = glob(opj(bidsonym_path, brain_mask_pattern))[0]
-        
-        # Create figure with subplots for three orthogonal views
-        fig = figure(figsize=(15, 5))
-        plt.subplots_adjust(left=0, bottom=0, right=1, top=1, wspace=-0.2, hspace=0)
-        
-        # Generate plots for each anatomical direction (sagittal, coronal, axial)
-        for i, direction in enumerate(['x', 'y', 'z']):
-            ax = fig.add_subplot(3, 1, i + 1)
-            
-            # Find optimal slice positions for this direction
-            cuts = find_cut_slices(t1w, direction=direction, n_cuts=12)
-            
-            # Plot brain mask overlaid on defaced T1w image
-            plot_stat_map(
-                brainmask_t1w,           # Brain mask as overlay
-                bg_img=t1w,              # Defaced T1w as background
-                display_mode=direction,   # Anatomical direction
-                cut_coords=cuts,         # Slice positions
-                annotate=False,          # No anatomical annotations
-                dim=-1,                  # Dim background slightly
-                axes=ax,                 # Use specific subplot
-                colorbar=False           # No colorbar
+    # Collect one rendering task per image
+    tasks = []
+    for i_img, defaced in enumerate(defaced_files):
+        if brainmask_files is not None:
+            brainmask = brainmask_files[i_img]
+        else:
+            # Construct path to corresponding brain mask file
+            # Extract filename and replace extension with brain mask naming convention
+            brain_mask_pattern = (
+                defaced[defaced.rfind('/') + 1:defaced.rfind('.nii')] + 
+                '_brainmask_desc-nondeid.nii.gz'
             )
-        
+            brainmask = glob(opj(bidsonym_path, brain_mask_pattern))[0]
+
         # Save the plot with descriptive filename
-        output_filename = (
-            t1w[t1w.rfind('/') + 1:t1w.rfind('.nii')] + 
+        output_filename = opj(
+            bidsonym_path,
+            defaced[defaced.rfind('/') + 1:defaced.rfind('.nii')] + 
             '_desc-brainmaskdeid.png'
         )
-        plt.savefig(opj(bidsonym_path, output_filename))
-
-    # Process T2w/FLAIR images if requested
-    if t2w is not None:
-        # Query for FLAIR images (T2w images are commented out)
-        if session is not None:
-            # Get FLAIR images for specific session
-            defaced_flair = layout.get(
-                subject=subject_label, 
-                extension='nii.gz', 
-                suffix='FLAIR',
-                return_type='filename', 
-                session=session
-            )
-        else:
-            # Get all FLAIR images for subject
-            defaced_flair = layout.get(
-                subject=subject_label, 
-                extension='nii.gz', 
-                suffix='FLAIR',
-                return_type='filename'
-            )
+        tasks.append((defaced, brainmask, output_filename))
 
-        # Process each FLAIR image found
-        for flair in defaced_flair:
-            # Construct path to corresponding brain mask
-            brain_mask_pattern = (
-                flair[flair.rfind('/') + 1:flair.rfind('.nii')] + 
-                '_brainmask_desc-nondeid.nii.gz'
-            )
-            brainmask_flair = glob(opj(bidsonym_path, brain_mask_pattern))[0]
-            
-            # Create figure with subplots (reusing previous figure structure)
-            for i, direction in enumerate(['x', 'y', 'z']):
-                ax = fig.add_subplot(3, 1, i + 1)
-                
-                # Find optimal slice positions for FLAIR image
-                cuts = find_cut_slices(flair, direction=direction, n_cuts=12)
-                
-                # Plot brain mask overlaid on defaced FLAIR image
-                plot_stat_map(
-                    brainmask_flair,         # Brain mask as overlay
-                    bg_img=flair,            # Defaced FLAIR as background
-                    display_mode=direction,   # Anatomical direction
-                    cut_coords=cuts,         # Slice positions
-                    annotate=False,          # No anatomical annotations
-                    dim=-1,                  # Dim background slightly
-                    axes=ax,                 # Use specific subplot
-                    colorbar=False           # No colorbar
-                )
-            
-            # Save FLAIR plot with descriptive filename
-            output_filename = (
-                flair[flair.rfind('/') + 1:flair.rfind('.nii')] + 
-                '_desc-brainmaskdeid.png'
-            )
-            plt.savefig(opj(bidsonym_path, output_filename))
+    # Render all plots, fanned out across the rendering pool
+    plots = render_map(_render_montage, tasks, n_workers)
 
     # Return processed files for potential downstream use
-    return (t1w, t2w)
+    return plots
+
+
+def _gif_frames(data, zooms, stride=1, size=128, n_colors=64):
+    """
+    Generate the frames of a GIF scrolling through a volume, each showing
+    a sagittal, coronal and axial slice next to each other.
+
+    Only the slices of the current frame are read from data, which can
+    be memory-mapped, and downsampled to size pixels.
+
+    Parameters
+    ----------
+    data : numpy.ndarray
+        3D volume in RAS+ orientation.
+    zooms : tuple of float
+        Voxel sizes of the volume.
+    stride : int, optional
+        Number of slices advanced per frame.
+    size : int, optional
+        Maximum width/height of each view in pixels.
+    n_colors : int, optional
+        Number of gray levels the frames are quantized to.
+
+    Yields
+    ------
+    PIL.Image.Image
+        Frames as grayscale images.
+    """
+
+    import numpy as np
+    from PIL import Image
+
+    # Scale the intensities to [0, 255] based on a subsample of the volume,
+    # robust to single bright voxels
+    sample = np.asarray(data[::4, ::4, ::4], dtype=np.float32)
+    sample = sample[sample != 0]
+    low, high = np.percentile(sample, (1, 99.5)) if sample.size else (0, 1)
+    scale = 255 / ((high - low) or 1)
+
+    # Lookup of the quantized gray levels
+    levels = np.round(np.linspace(0, n_colors - 1, 256)) * (255 / (n_colors - 1))
+    levels = levels.astype(np.uint8)
+
+    # Size of the views, keeping the physical extent of the volume
+    extent = np.array(data.shape[:3]) * np.array(zooms[:3])
+    pixels = size / extent.max()
+
+    n_frames = max(data.shape[:3])
+    for i in range(0, n_frames, max(1, stride)):
+        views = []
+        for axis in range(3):
+            in_plane = [other for other in range(3) if other != axis]
+
+            # All directions are scrolled through simultaneously
+            index = min(int(i * data.shape[axis] / n_frames), data.shape[axis] - 1)
+            view = np.rot90(np.asarray(np.take(data, index, axis=axis), dtype=np.float32))
+            view = np.clip((view - low) * scale, 0, 255).astype(np.uint8)
+
+            view = Image.fromarray(levels[view]).resize(
+                (max(1, int(round(extent[in_plane[0]] * pixels))),
+                 max(1, int(round(extent[in_plane[1]] * pixels)))),
+                Image.BILINEAR
+            )
+
+            # Center the view on a black square tile
+            tile = Image.new('L', (size, size))
+            tile.paste(view, ((size - view.width) // 2, (size - view.height) // 2))
+            views.append(tile)
+
+        frame = Image.new('L', (3 * size, size))
+        for i_view, view in enumerate(views):
+            frame.paste(view, (i_view * size, 0))
+        yield frame
+
+
+def write_gif(image, outfile, stride=1, size=128, n_colors=64, fps=18):
+    """
+    Write an animated GIF scrolling through an image, showing sagittal,
+    coronal and axial slices next to each other.
 
+    The image is loaded once (memory-mapped if uncompressed) in its
+    on-disk data type and the frames are generated one at a time, as
+    downsampled grayscale images with n_colors gray levels.
 
-def gif_defaced(bids_dir, subject_label, session=None, t2w=None):
+    Parameters
+    ----------
+    image : str
+        Path to image, of 4D images the first volume is shown.
+    outfile : str
+        Name of the GIF.
+    stride : int, optional
+        Number of slices advanced per frame, larger values create shorter
+        and smaller GIFs.
+    size : int, optional
+        Maximum width/height of each view in pixels.
+    n_colors : int, optional
+        Number of gray levels of the GIF.
+    fps : int, optional
+        Frames per second.
+
+    Returns
+    -------
+    outfile : str
+        Name of the GIF.
+    """
+
+    import os
+    from bidsonym.reports import _gif_frames, _load_volume
+
+    # Reorient to RAS+ via flips and transpositions, i.e. without copying
+    data, zooms = _load_volume(image)[1:]
+
+    frames = _gif_frames(data, zooms, stride=stride, size=size, n_colors=n_colors)
+
+    # Write to a hidden temporary file first, so that no partial GIF is
+    # visible in the output directory
+    tmpfile = os.path.join(os.path.dirname(os.path.abspath(outfile)),
+                           '.' + os.path.basename(outfile))
+    try:
+        first = next(frames)
+        first.save(tmpfile, format='GIF', save_all=True, append_images=frames,
+                   duration=int(round(1000 / fps)), loop=0)
+        os.replace(tmpfile, outfile)
+    finally:
+        if os.path.exists(tmpfile):
+            os.remove(tmpfile)
+
+    return outfile
+
+
+def gif_defaced(bids_dir, subject_label, session=None, modalities=['T1w'],
+                defaced_files=None, database_path=None, n_workers=1,
+                frame_stride=1):
     """
     Create animated GIFs that loop through slices of defaced images in
     orthogonal directions (x, y, z).
@@ -275,107 +805,86 @@ def gif_defaced(bids_dir, subject_label, session=None, t2w=None):
     session : str, optional
         If multiple sessions exist, create one GIF per session.
         If None, processes all sessions for the subject.
-    t2w : bool, optional
-        If True and T2w images exist, create GIFs for T2w images as well.
+    modalities : list of str, optional
+        Image modalities for which GIFs should be created if defaced_files
+        is not provided. Default is ['T1w'].
+    defaced_files : list of str, optional
+        Defaced images for which GIFs should be created. If None, the
+        defaced images are queried from the BIDS dataset based on modalities.
+    database_path : str, optional
+        Directory holding the SQLite index of the BIDS dataset, which is
+        used instead of re-indexing the dataset if defaced_files is None.
+    n_workers : int, optional
+        Number of processes rendering the GIFs (one image per process),
+        see render_map.
+    frame_stride : int, optional
+        Number of slices advanced per frame, see write_gif.
+
+    Returns
+    -------
+    list of str
+        Paths to the created GIFs.
 
     Notes
     -----
-    The generated GIFs are initially created in the subject's anatomical
-    directory and then moved to the BIDSonym sourcedata directory for
-    organization and storage.
+    The GIFs are written via write_gif directly to their final location,
+    sourcedata/bidsonym/sub-<label>/[ses-<label>/]images (see
+    bidsonym.utils.clean_up_files), leaving the BIDS dataset untouched.
     """
 
-    # Initialize BIDS layout to query dataset structure
-    layout = BIDSLayout(bids_dir)
-    
-    # Define path to BIDSonym sourcedata directory for this subject
-    bidsonym_path = opj(bids_dir, f'sourcedata/bidsonym/sub-{subject_label}')
+    # Imports are done here as this function is run as a Nipype Function node
+    import os
+    from os.path import join as opj
+    from bidsonym.utils import get_bids_layout
+    from bidsonym.reports import render_map, write_gif
 
-    # Query for T1w images based on session specification
-    if session is not None:
-        # Get T1w images for specific session
-        defaced_t1w = layout.get(
-            subject=subject_label, 
-            extension='nii.gz', 
-            suffix='T1w',
-            return_type='filename', 
-            session=session
-        )
-        
-        # Get T2w images for specific session if requested
-        if t2w is not None:
-            defaced_t2w = layout.get(
-                subject=subject_label, 
-                extension='nii.gz', 
-                suffix='T2w',
-                return_type='filename', 
-                session=session
-            )
-    else:
-        # Get all T1w images for subject (all sessions)
-        defaced_t1w = layout.get(
-            subject=subject_label, 
-            extension='nii.gz', 
-            suffix='T1w',
-            return_type='filename'
-        )
-        
-        # Get all T2w images for subject if requested
-        # Note: There's an inconsistency here - session parameter is passed even when session is None
-        if t2w is not None:
-            defaced_t2w = layout.get(
-                subject=subject_label, 
-                extension='nii.gz', 
-                suffix='T2w',
-                return_type='filename', 
-                session=session  # This should probably be removed when session is None
-            )
-
-    # Generate GIFs for all T1w images found
-    for t1_image in defaced_t1w:
-        # Create animated GIF showing slices through the T1w image
-        gif2nif.write_gif_normal(t1_image)
+    # Define path to the images directory of this subject/session
+    images_path = opj(bids_dir, f'sourcedata/bidsonym/sub-{subject_label}',
+                      f'ses-{session}' if session is not None else '', 'images')
+    os.makedirs(images_path, exist_ok=True)
 
-    # Generate GIFs for T2w images if requested
-    if t2w is not None:
-        for t2_image in defaced_t2w:
-            # Create animated GIF showing slices through the T2w image
-            gif2nif.write_gif_normal(t2_image)
+    # Query for defaced images based on session specification
+    if defaced_files is None:
+        # Initialize BIDS layout to query dataset structure
+        layout = get_bids_layout(bids_dir, database_path)
+        defaced_files = []
+        for modality in modalities:
+            if session is not None:
+                # Get images for specific session
+                defaced_files += layout.get(
+                    subject=subject_label, 
+                    extension='nii.gz', 
+                    suffix=modality,
+                    return_type='filename', 
+                    session=session
+                )
+            else:
+                # Get all images for subject (all sessions)
+                defaced_files += layout.get(
+                    subject=subject_label, 
+                    extension='nii.gz', 
+                    suffix=modality,
+                    return_type='filename'
+                )
 
-    # Locate and move generated GIF files to BIDSonym directory
-    if session is not None:
-        # Look for GIFs in session-specific anatomical directory
-        gif_search_path = opj(
-            bids_dir, 
-            f'sub-{subject_label}/ses-{session}/anat',
-            f'sub-{subject_label}*.gif'
-        )
-        list_gifs = glob(gif_search_path)
-    else:
-        # Look for GIFs in subject's anatomical directory
-        gif_search_path = opj(
-            bids_dir, 
-            f'sub-{subject_label}/anat',
-            f'sub-{subject_label}*.gif'
-        )
-        list_gifs = glob(gif_search_path)
+    # Generate GIFs for all defaced images found, creating animated GIFs
+    # showing slices through the images in parallel
+    tasks = []
+    for defaced in defaced_files:
+        basename = os.path.basename(defaced)
+        gif_file = opj(images_path, basename[:basename.find('.nii')] + '.gif')
+        tasks.append((defaced, gif_file, frame_stride))
 
-    # Move all generated GIF files to BIDSonym sourcedata directory
-    for gif_file in list_gifs:
-        # Move GIF from original location to organized sourcedata location
-        move(gif_file, bidsonym_path)
+    return render_map(write_gif, tasks, n_workers)
 
 
-def create_graphics(bids_dir, subject_label, session=None, modalities=['T1w']):
+def init_report_wf(bids_dir, subject_label, session=None, modalities=['T1w'],
+                   database_path=None, n_workers=1, frame_stride=1,
+                   name='report_wf'):
     """
-    Setup and run the graphics workflow which creates static plots and
+    Setup the graphics workflow which creates static plots and
     animated GIFs of defaced images for quality assessment.
 
-    This function orchestrates the creation of visual reports by setting up
-    a Nipype workflow that generates both static plots (with brain masks
-    overlaid) and animated GIFs of the defaced images. Users can specify
-    exactly which modalities to process.
-
     Parameters
     ----------
     bids_dir : str
@@ -383,106 +892,495 @@ def create_graphics(bids_dir, subject_label, session=None, modalities=['T1w']):
     subject_label : str
         Label of subject to be processed (without 'sub-' prefix).
     session : str, optional
-        If multiple sessions exist, include them in workflow.
         If provided, only processes the specified session.
     modalities : list of str, optional
         List of image modalities to process. Default is ['T1w'].
-        Supported modalities: 'T1w', 'T2w', 'FLAIR'.
-        Examples: ['T1w'], ['T1w', 'T2w'], ['T1w', 'T2w', 'FLAIR']
+    database_path : str, optional
+        Directory holding the SQLite index of the BIDS dataset, see
+        get_bids_layout.
+    n_workers : int, optional
+        Number of processes rendering the graphics of each node, see
+        render_map. The nodes reserve them from the Nipype plugin.
+    frame_stride : int, optional
+        Number of slices advanced per GIF frame, see write_gif.
+    name : str, optional
+        Name of the workflow.
 
-    Notes
-    -----
-    The workflow uses Nipype for pipeline management, ensuring reproducible
-    execution and proper dependency handling. Both static plots and GIF
-    generation are enabled by default.
-
-    Examples
-    --------
-    # Process only T1w images (default)
-    create_graphics('/data/bids', 'sub001')
-    
-    # Process T1w and T2w images
-    create_graphics('/data/bids', 'sub001', modalities=['T1w', 'T2w'])
-    
-    # Process only FLAIR images
-    create_graphics('/data/bids', 'sub001', modalities=['FLAIR'])
-    
-    # Process all modalities for specific session
-    create_graphics('/data/bids', 'sub001', session='01', modalities=['T1w', 'T2w', 'FLAIR'])
+    Returns
+    -------
+    report_wf : nipype.pipeline.engine.Workflow
+        Graphics workflow. 'inputnode.defaced_files' and
+        'inputnode.brainmask_files' can be connected to restrict the
+        graphics to the outputs of upstream defacing workflows.
     """
 
-    # Validate modalities parameter
-    supported_modalities = ['T1w', 'T2w', 'FLAIR']
-    if not modalities or not isinstance(modalities, list):
-        print("Warning: No valid modalities selected. Defaulting to ['T1w'].")
-        modalities = ['T1w']
-    
-    # Filter to only supported modalities
-    valid_modalities = [mod for mod in modalities if mod in supported_modalities]
-    if not valid_modalities:
-        print("Warning: No valid modalities found. Defaulting to ['T1w'].")
-        valid_modalities = ['T1w']
+    import nipype.pipeline.engine as pe
+    from nipype import Function
+    from nipype.interfaces import utility as niu
 
     # Create Nipype workflow for graphics generation
-    report_wf = pe.Workflow('report_wf')
+    report_wf = pe.Workflow(name)
 
     # Define input node with all required parameters
+    # Inputs are not mandatory, undefined ones fall back to the defaults
+    # of plot_defaced and gif_defaced
     inputnode = pe.Node(
-        niu.IdentityInterface(fields=['bids_dir', 'subject_label', 'session', 'modalities']),
+        niu.IdentityInterface(fields=['bids_dir', 'subject_label', 'session', 'modalities',
+                                      'defaced_files', 'brainmask_files', 'database_path',
+                                      'n_workers', 'frame_stride'],
+                              mandatory_inputs=False),
         name='inputnode'
     )
     
     # Create node for static plot generation
     plt_defaced = pe.Node(
         Function(
-            input_names=['bids_dir', 'subject_label', 'session', 'modalities'],
+            input_names=['bids_dir', 'subject_label', 'session', 'modalities',
+                         'defaced_files', 'brainmask_files', 'database_path',
+                         'n_workers'],
+            output_names=['out_files'],
             function=plot_defaced
         ),
-        name='plt_defaced'
+        name='plt_defaced', n_procs=n_workers
     )
     
     # Create node for GIF generation
     gf_defaced = pe.Node(
         Function(
-            input_names=['bids_dir', 'subject_label', 'session', 'modalities'],
+            input_names=['bids_dir', 'subject_label', 'session', 'modalities',
+                         'defaced_files', 'database_path', 'n_workers',
+                         'frame_stride'],
+            output_names=['out_files'],
             function=gif_defaced
         ),
-        name='gf_defaced'
+        name='gf_defaced', n_procs=n_workers
     )
 
-    # Connect mandatory inputs (bids_dir, subject_label, and modalities are always required)
+    # Connect inputs to both graphics nodes
     report_wf.connect([
         (inputnode, plt_defaced, [
             ('bids_dir', 'bids_dir'),
             ('subject_label', 'subject_label'),
-            ('modalities', 'modalities')
+            ('session', 'session'),
+            ('modalities', 'modalities'),
+            ('defaced_files', 'defaced_files'),
+            ('brainmask_files', 'brainmask_files'),
+            ('database_path', 'database_path'),
+            ('n_workers', 'n_workers')
         ]),
         (inputnode, gf_defaced, [
             ('bids_dir', 'bids_dir'),
             ('subject_label', 'subject_label'),
-            ('modalities', 'modalities')
+            ('session', 'session'),
+            ('modalities', 'modalities'),
+            ('defaced_files', 'defaced_files'),
+            ('database_path', 'database_path'),
+            ('n_workers', 'n_workers'),
+            ('frame_stride', 'frame_stride')
         ]),
     ])
 
-    # Connect optional session input if provided
-    if session:
-        inputnode.inputs.session = session
-        report_wf.connect([
-            (inputnode, plt_defaced, [('session', 'session')]),
-            (inputnode, gf_defaced, [('session', 'session')]),
-        ])
-
     # Set all workflow inputs
     inputnode.inputs.bids_dir = bids_dir
     inputnode.inputs.subject_label = subject_label
-    inputnode.inputs.modalities = valid_modalities
-    
-    # Display processing information
-    print(f"Starting graphics workflow for subject {subject_label}")
+    inputnode.inputs.modalities = modalities
+    inputnode.inputs.n_workers = n_workers
+    inputnode.inputs.frame_stride = frame_stride
     if session:
-        print(f"Processing session: {session}")
-    print(f"Processing modalities: {valid_modalities}")
+        inputnode.inputs.session = session
+    if database_path:
+        inputnode.inputs.database_path = str(database_path)
+
+    return report_wf
+
+
+def create_graphics(bids_dir, subject_label, session=None, modalities=['T1w'],
+                    base_dir=None, database_path=None, n_workers=1,
+                    frame_stride=1, log_print=None):
+    """
+    Setup and run the graphics workflow which creates static plots and
+    animated GIFs of defaced images for quality assessment.
+
+    This function orchestrates the creation of visual reports by setting up
+    a Nipype workflow that generates both static plots (with brain masks
+    overlaid) and animated GIFs of the defaced images. Users can specify
+    exactly which modalities to process.
+
+    Parameters
+    ----------
+    bids_dir : str
+        Path to BIDS root directory.
+    subject_label : str
+        Label of subject to be processed (without 'sub-' prefix).
+    session : str, optional
+        If multiple sessions exist, include them in workflow.
+        If provided, only processes the specified session.
+    modalities : list of str, optional
+        List of image modalities to process. Default is ['T1w'].
+        Supported modalities: 'T1w', 'T2w', 'FLAIR'.
+        Examples: ['T1w'], ['T1w', 'T2w'], ['T1w', 'T2w', 'FLAIR']
+    base_dir : str, optional
+        Directory in which the workflow is executed and its results are
+        cached, so that reruns with unchanged inputs are skipped.
+    database_path : str, optional
+        Directory holding the SQLite index of the BIDS dataset, see
+        get_bids_layout.
+    n_workers : int, optional
+        Number of processes rendering the graphics, see render_map.
+    frame_stride : int, optional
+        Number of slices advanced per GIF frame, see write_gif.
+    log_print : function, optional
+        Logging function to use for output. If None, a log of the
+        subject/session is set up via setup_logging (operation
+        'bidsonymgraphics').
+
+    Notes
+    -----
+    The workflow uses Nipype for pipeline management, ensuring reproducible
+    execution and proper dependency handling. Both static plots and GIF
+    generation are enabled by default.
+
+    Examples
+    --------
+    # Process only T1w images (default)
+    create_graphics('/data/bids', 'sub001')
+    
+    # Process T1w and T2w images
+    create_graphics('/data/bids', 'sub001', modalities=['T1w', 'T2w'])
+    
+    # Process only FLAIR images
+    create_graphics('/data/bids', 'sub001', modalities=['FLAIR'])
+    
+    # Process all modalities for specific session
+    create_graphics('/data/bids', 'sub001', session='01', modalities=['T1w', 'T2w', 'FLAIR'])
+    """
+
+    # A log set up here is closed once the graphics are created
+    own_log = log_print is None
+    if own_log:
+        log_print, _ = setup_logging(bids_dir, subject_label, session,
+                                     operation="bidsonymgraphics")
+
+    try:
+        # Validate modalities parameter
+        supported_modalities = ['T1w', 'T2w', 'FLAIR']
+        if not modalities or not isinstance(modalities, list):
+            log_print("No valid modalities selected. Defaulting to ['T1w'].",
+                      "WARNING")
+            modalities = ['T1w']
     
-    # Execute the complete workflow
-    report_wf.run()
-    print("Graphics workflow completed successfully")
+        # Filter to only supported modalities
+        valid_modalities = [mod for mod in modalities if mod in supported_modalities]
+        if not valid_modalities:
+            log_print("No valid modalities found. Defaulting to ['T1w'].",
+                      "WARNING")
+            valid_modalities = ['T1w']
+
+        # Create Nipype workflow for graphics generation
+        report_wf = init_report_wf(bids_dir, subject_label, session=session,
+                                   modalities=valid_modalities,
+                                   database_path=database_path,
+                                   n_workers=n_workers,
+                                   frame_stride=frame_stride)
+        report_wf.base_dir = base_dir
+    
+        # Display processing information
+        log_print(f"Starting graphics workflow for subject {subject_label}")
+        if session:
+            log_print(f"Processing session: {session}")
+        log_print(f"Processing modalities: {valid_modalities}")
+    
+        # Execute the complete workflow, its duration is added to the
+        # profile of the current run (see bidsonym.utils.write_run_profile)
+        from bidsonym.utils import profile_stage
+        with profile_stage('graphics', subject_label, session):
+            report_wf.run()
+        log_print("Graphics workflow completed successfully")
+    finally:
+        if own_log:
+            log_print.close()
+
+
+def make_thumbnail(image, outfile, size=320):
+    """
+    Write a downscaled PNG copy of a quality control graphic.
+
+    Parameters
+    ----------
+    image : str
+        Path to PNG or GIF. Of animated GIFs, the middle frame is used.
+    outfile : str
+        Name of the thumbnail.
+    size : int, optional
+        Width of the thumbnail in pixels, the aspect ratio is kept. Images
+        that are narrower are not enlarged.
+
+    Returns
+    -------
+    list of int
+        Width and height of the thumbnail.
+    """
+
+    import os
+    from PIL import Image
+
+    with Image.open(image) as graphic:
+        if getattr(graphic, 'n_frames', 1) > 1:
+            graphic.seek(graphic.n_frames // 2)
+        thumbnail = graphic.convert('RGB')
+    thumbnail.thumbnail((size, thumbnail.height), Image.BILINEAR,
+                        reducing_gap=2.0)
+
+    # Write to a hidden temporary file first, so that an interrupted run
+    # does not leave a partial thumbnail that looks current
+    os.makedirs(os.path.dirname(os.path.abspath(outfile)), exist_ok=True)
+    tmpfile = os.path.join(os.path.dirname(os.path.abspath(outfile)),
+                           '.' + os.path.basename(outfile))
+    try:
+        thumbnail.save(tmpfile, format='PNG')
+        os.replace(tmpfile, outfile)
+    finally:
+        if os.path.exists(tmpfile):
+            os.remove(tmpfile)
+
+    return list(thumbnail.size)
+
+
+def _qc_graphics(bidsonym_dir):
+    """
+    Find the quality control graphics of all subjects, i.e. the PNGs and
+    GIFs in sub-<label>/[ses-<label>/]images.
+
+    Parameters
+    ----------
+    bidsonym_dir : str
+        Path to sourcedata/bidsonym.
+
+    Returns
+    -------
+    dict
+        Paths of the graphics relative to bidsonym_dir, sorted, keyed by
+        subject label (without 'sub-').
+    """
+
+    from glob import glob
+
+    graphics = {}
+    for pattern in ['sub-*/images/*', 'sub-*/ses-*/images/*']:
+        for graphic in glob(os.path.join(bidsonym_dir, pattern)):
+            if not graphic.endswith(('.png', '.gif')):
+                continue
+            relpath = os.path.relpath(graphic, bidsonym_dir)
+            subject_label = relpath.split(os.sep)[0][len('sub-'):]
+            graphics.setdefault(subject_label, []).append(relpath)
+
+    return {subject_label: sorted(graphics[subject_label])
+            for subject_label in sorted(graphics)}
+
+
+def _qc_dashboard_html(manifest):
+    """
+    Render the quality control dashboard of all subjects in a manifest
+    (see build_qc_dashboard) as a static HTML page.
+
+    Only the thumbnails are embedded, lazily loaded by the browser once
+    they are scrolled into view. The full resolution graphic is loaded
+    when a thumbnail is clicked.
+
+    Parameters
+    ----------
+    manifest : dict
+        Manifest of the dashboard.
+
+    Returns
+    -------
+    str
+        HTML page.
+    """
+
+    from html import escape
+    from urllib.parse import quote
+
+    def url(relpath):
+        return escape(quote(relpath.replace(os.sep, '/')))
+
+    subjects = manifest['subjects']
+    n_graphics = sum(len(subject['graphics']) for subject in subjects.values())
+
+    sections = []
+    for subject_label, subject in subjects.items():
+        figures = []
+        for relpath, graphic in subject['graphics'].items():
+            width, height = graphic['thumbnail_size']
+            figures.append(
+                f'<figure><a href="{url(relpath)}" class="full">'
+                f'<img src="{url(graphic["thumbnail"])}" width="{width}" '
+                f'height="{height}" loading="lazy" alt=""></a>'
+                f'<figcaption>{escape(os.path.basename(relpath))}</figcaption>'
+                '</figure>'
+            )
+        sections.append(
+            f'<section data-subject="{escape(subject_label)}">'
+            f'<h2>sub-{escape(subject_label)}</h2>{"".join(figures)}</section>'
+        )
+
+    return f"""<!DOCTYPE html>
+<html lang="en">
+<head>
+<meta charset="utf-8">
+<title>BIDSonym quality control</title>
+<style>
+body {{ font-family: sans-serif; margin: 1em 2em; background: #fafafa; }}
+section {{ border-top: 1px solid #ccc; padding: .5em 0; }}
+h2 {{ font-size: 1.1em; margin: .3em 0; }}
+figure {{ display: inline-block; margin: 0 1em 1em 0; vertical-align: top; }}
+figcaption {{ font-size: .8em; color: #555; }}
+img {{ background: #000; }}
+#viewer {{ display: none; position: fixed; inset: 0; background: rgba(0, 0, 0, .85);
+           justify-content: center; align-items: center; cursor: zoom-out; }}
+#viewer img {{ max-width: 95vw; max-height: 95vh; }}
+</style>
+</head>
+<body>
+<h1>BIDSonym quality control</h1>
+<p>{len(subjects)} subjects, {n_graphics} graphics, updated
+{escape(manifest['updated'])}. Click a thumbnail to show the graphic in full
+resolution.</p>
+<p><input id="filter" type="search" placeholder="Filter subjects"></p>
+{chr(10).join(sections)}
+<div id="viewer"><img alt=""></div>
+<script>
+var viewer = document.getElementById('viewer');
+document.querySelectorAll('a.full').forEach(function (link) {{
+  link.addEventListener('click', function (event) {{
+    event.preventDefault();
+    viewer.firstChild.src = link.getAttribute('href');
+    viewer.style.display = 'flex';
+  }});
+}});
+viewer.addEventListener('click', function () {{
+  viewer.style.display = 'none';
+  viewer.firstChild.removeAttribute('src');
+}});
+document.getElementById('filter').addEventListener('input', function () {{
+  var value = this.value.replace(/^sub-/, '');
+  document.querySelectorAll('section').forEach(function (section) {{
+    section.hidden = section.dataset.subject.indexOf(value) < 0;
+  }});
+}});
+</script>
+</body>
+</html>
+"""
+
+
+def build_qc_dashboard(bids_dir, thumbnail_size=320, n_workers=1,
+                       log_print=print):
+    """
+    Build the dataset-level quality control dashboard, a static HTML page
+    showing the brain mask plots and GIFs of all subjects, written to
+    sourcedata/bidsonym/desc-qc.html.
+
+    The page embeds thumbnails (sourcedata/bidsonym/qc_thumbnails), which
+    are only rendered if they are missing or older than their graphic.
+    The manifest (sourcedata/bidsonym/desc-qcmanifest.json) records the
+    graphics each thumbnail was rendered from, so that rebuilding the
+    dashboard after further subjects were processed only renders the
+    thumbnails of these subjects. Thumbnails of graphics that no longer
+    exist, e.g. of reverted subjects, are removed.
+
+    Parameters
+    ----------
+    bids_dir : str
+        Path to BIDS root directory.
+    thumbnail_size : int, optional
+        Width of the thumbnails in pixels. Changing it renders all
+        thumbnails again.
+    n_workers : int, optional
+        Number of processes rendering the thumbnails, see render_map.
+    log_print : function, optional
+        Logging function to use for output.
+
+    Returns
+    -------
+    str
+        Path to the dashboard.
+    """
+
+    import shutil
+
+    bidsonym_dir = os.path.join(bids_dir, 'sourcedata', 'bidsonym')
+    manifest_file = os.path.join(bidsonym_dir, 'desc-qcmanifest.json')
+    dashboard_file = os.path.join(bidsonym_dir, 'desc-qc.html')
+    thumbnail_dir = 'qc_thumbnails'
+
+    # Thumbnails of the previous build, only valid for the same size
+    previous = {}
+    if os.path.exists(manifest_file):
+        with open(manifest_file) as json_file:
+            previous = json.load(json_file)
+        if previous.get('thumbnail_size') != thumbnail_size:
+            previous = {}
+    previous = previous.get('subjects', {})
+
+    # A thumbnail is current if its graphic did not change since it was
+    # rendered (same modification time and size) and it still exists
+    subjects = {}
+    tasks = []
+    for subject_label, graphics in _qc_graphics(bidsonym_dir).items():
+        previous_graphics = previous.get(subject_label, {}).get('graphics', {})
+        subjects[subject_label] = {'graphics': {}}
+        for relpath in graphics:
+            stat = os.stat(os.path.join(bidsonym_dir, relpath))
+            thumbnail = os.path.join(thumbnail_dir,
+                                     os.path.splitext(relpath)[0] + '.png')
+            entry = {'mtime_ns': stat.st_mtime_ns, 'bytes': stat.st_size,
+                     'thumbnail': thumbnail}
+            current = previous_graphics.get(relpath)
+            if (current is not None and
+                    current['mtime_ns'] == entry['mtime_ns'] and
+                    current['bytes'] == entry['bytes'] and
+                    os.path.exists(os.path.join(bidsonym_dir, thumbnail))):
+                entry['thumbnail_size'] = current['thumbnail_size']
+            else:
+                tasks.append((relpath, os.path.join(bidsonym_dir, relpath),
+                              os.path.join(bidsonym_dir, thumbnail),
+                              thumbnail_size))
+            subjects[subject_label]['graphics'][relpath] = entry
+
+    # Render the missing and stale thumbnails, fanned out across the
+    # rendering pool
+    sizes = render_map(make_thumbnail, [task[1:] for task in tasks], n_workers)
+    for (relpath, *_), size in zip(tasks, sizes):
+        subject_label = relpath.split(os.sep)[0][len('sub-'):]
+        subjects[subject_label]['graphics'][relpath]['thumbnail_size'] = size
+
+    # Remove thumbnails of subjects that are no longer part of the
+    # dashboard, e.g. as their de-identification was reverted
+    for subject_label in set(previous) - set(subjects):
+        shutil.rmtree(os.path.join(bidsonym_dir, thumbnail_dir,
+                                   f'sub-{subject_label}'), ignore_errors=True)
+    for subject_label in set(previous) & set(subjects):
+        for relpath, graphic in previous[subject_label]['graphics'].items():
+            if relpath not in subjects[subject_label]['graphics']:
+                thumbnail = os.path.join(bidsonym_dir, graphic['thumbnail'])
+                if os.path.exists(thumbnail):
+                    os.remove(thumbnail)
+
+    manifest = {'thumbnail_size': thumbnail_size,
+                'updated': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                'subjects': subjects}
+
+    # Write the dashboard before the manifest, so that the manifest never
+    # refers to a dashboard that was not written
+    os.makedirs(bidsonym_dir, exist_ok=True)
+    for outfile, content in [(dashboard_file, _qc_dashboard_html(manifest)),
+                             (manifest_file, json.dumps(manifest, indent=4))]:
+        with open(outfile + '.tmp', 'w') as out:
+            out.write(content)
+        os.replace(outfile + '.tmp', outfile)
+
+    log_print(f"Quality control dashboard of {len(subjects)} subjects saved to "
+              f"{dashboard_file} ({len(tasks)} thumbnails rendered)")
+
+    return dashboard_file
@@ -1,17 +1,19 @@
 import argparse
 import os
+import re
+import shutil
 import sys
+import traceback
+from multiprocessing import Manager
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, timezone
 from pathlib import Path
-from bidsonym.defacing_algorithms import (run_pydeface, run_mri_deface,
-                                          run_mridefacer, run_quickshear,
-                                          run_deepdefacer, run_image_deface)
-from bidsonym.utils import (check_outpath, copy_no_deid, check_meta_data,
-                            del_meta_data, run_brain_extraction_nb,
-                            run_brain_extraction_bet, validate_input_dir,
-                            rename_non_deid, clean_up_files, revert_bidsonym)
-from bidsonym.reports import create_graphics, setup_logging
-from bids import BIDSLayout
+# Nipype, pybids and the BIDSonym modules building on them are imported
+# within the functions using them, so that the command line interface
+# (e.g. --version or argument errors) starts without loading them and
+# only the defacing/brain extraction backends that are selected are loaded
 from ._version import get_versions
+from .defacers import get_defacer, list_defacers, select_defacer, defacer_available
 
 
 def get_parser():
@@ -61,8 +63,12 @@ def get_parser():
         nargs="+"
     )
     parser.add_argument(
-        '--deid', help='Approach to use for de-identification.',
-        choices=['pydeface', 'mri_deface', 'quickshear', 'mridefacer']
+        '--deid',
+        help='Approach to use for de-identification. Besides the defacers '
+             'shipped with BIDSonym, defacers registered by installed '
+             'packages (via the bidsonym.defacers entry point group) can be '
+             'used. "auto" selects the fastest defacer available.',
+        choices=list_defacers() + ['auto']
     )
     
     # Updated: More flexible modality specification
@@ -88,7 +94,7 @@ def get_parser():
         help='Indicate which information from the image and .json meta-data '
              'files should be check for potentially problematic information. '
              'Indicate strings that should be searched for. The results will '
-             'be saved to sourcedata/',
+             'be saved to sourcedata/bidsonym/desc-metadata.sqlite',
         nargs="+"
     )
     parser.add_argument(
@@ -110,12 +116,115 @@ def get_parser():
              'provide a Frac value.',
         nargs=1
     )
+    parser.add_argument(
+        '--nobrainer_threads', type=int,
+        help='Number of threads TensorFlow may use for nobrainer brain '
+             'extraction. The nobrainer model is loaded once and applied '
+             'to the images of all subjects (default and maximum: value of '
+             '--n_procs).'
+    )
+    parser.add_argument(
+        '--quickshear_separate_bet', action='store_true', default=False,
+        help='If --deid quickshear is used, compute the Quickshear brain '
+             'mask via a separate BET run (frac=0.5) instead of reusing '
+             'the brain extraction specified via --brainextraction.'
+    )
     parser.add_argument(
         '--skip_bids_validation', default=False,
         help='Assume the input dataset is BIDS compliant and skip the '
              'validation (default: False).',
         action="store_true"
     )
+    parser.add_argument(
+        '--nipype_plugin', default='Linear',
+        help='Nipype plugin used to execute the workflow holding the brain '
+             'extraction, defacing and report nodes of all subjects, e.g. '
+             'Linear or MultiProc (default: Linear).'
+    )
+    parser.add_argument(
+        '--n_procs', type=int, default=1,
+        help='Maximum number of processes BIDSonym is allowed to use '
+             '(default: 1).'
+    )
+    parser.add_argument(
+        '--mem_gb', type=float,
+        help='Upper bound of memory (in GB) the MultiProc plugin is '
+             'allowed to use.'
+    )
+    parser.add_argument(
+        '--work_dir', type=Path,
+        help='Directory in which the Nipype workflow is executed. Results '
+             'of its nodes are cached there, so that a rerun (e.g. after a '
+             'crash or with changed quality control options) skips all '
+             'nodes whose inputs did not change. If not provided, a '
+             'temporary directory is used.'
+    )
+    parser.add_argument(
+        '--bids_database_dir', type=Path,
+        help='Directory in which the SQLite index of the BIDS dataset is '
+             'stored. If it holds an index of the unchanged dataset from a '
+             'previous run, the index is loaded instead of re-indexing the '
+             'dataset. The index is also shared with the worker processes '
+             'and the quality control nodes.'
+    )
+    parser.add_argument(
+        '--registration_cache_off', action='store_true', default=False,
+        help='Always estimate the registration of the defaced T1w image to '
+             'T2w/FLAIR images. By default, if --work_dir is provided, '
+             'registrations are cached there and reused by reruns in which '
+             'the defaced T1w image and the T2w/FLAIR image did not change. '
+             'Registrations are not reused across echoes or runs. Without '
+             '--work_dir, nothing is cached.'
+    )
+    parser.add_argument(
+        '--resume', action='store_true', default=False,
+        help='Continue a previous, interrupted run. Every completed stage '
+             '(backup, brain mask, defacing, meta-data, report, clean up) '
+             'is recorded in sourcedata/bidsonym/sub-<label>/'
+             'sub-<label>_desc-journal.jsonl. Recorded stages are skipped, '
+             'unfinished ones are redone.'
+    )
+    parser.add_argument(
+        '--max_parallel_subjects', type=int, default=1,
+        help='Maximum number of subjects that are de-identified '
+             'concurrently, each in its own worker process with its own '
+             'workflow. The processes given via --n_procs are split '
+             'between the workers (default: 1, i.e. a single workflow '
+             'holding all subjects).'
+    )
+    parser.add_argument(
+        '--report_workers', type=int, default=1,
+        help='Number of processes rendering the quality control graphics '
+             '(brain mask plots and GIFs) of each subject/session, '
+             'independent of --n_procs. The panels of all images are '
+             'rendered in parallel (default: 1, i.e. serially).'
+    )
+    parser.add_argument(
+        '--gif_frame_stride', type=int, default=1,
+        help='Number of slices advanced per frame of the quality control '
+             'GIFs. Larger values create shorter GIFs faster (default: 1, '
+             'i.e. every slice).'
+    )
+    parser.add_argument(
+        '--qc_thumbnail_size', type=int, default=320,
+        help='Width in pixels of the thumbnails shown in the quality control '
+             'dashboard (sourcedata/bidsonym/desc-qc.html), which is updated '
+             'at the end of every run. Only thumbnails of new or changed '
+             'graphics are rendered (default: 320).'
+    )
+    parser.add_argument(
+        '--resource_monitor', action='store_true', default=False,
+        help='Enable the resource monitor of Nipype (requires psutil), so '
+             'that the run profiles (sourcedata/bidsonym/'
+             '[sub-<label>/sub-<label>_]desc-runprofile.json/.tsv) include '
+             'CPU time and peak memory of the workflow nodes, e.g. BET, '
+             'pydeface or FLIRT.'
+    )
+    parser.add_argument(
+        '--json_log', action='store_true', default=False,
+        help='Write the log of the run in sourcedata/bidsonym/bidsonym_logs '
+             'as JSON lines (.jsonl) instead of text.'
+    )
     
     # New revert mode arguments
     parser.add_argument(
@@ -139,10 +248,525 @@ def get_parser():
     return parser
 
 
+def _workflow_name(image, suffix):
+    """
+    Derive a valid Nipype workflow name from an image file name.
+    
+    Parameters
+    ----------
+    image : str
+        Path to image.
+    suffix : str
+        Suffix appended to the name, e.g. 'deface_wf'.
+    
+    Returns
+    -------
+    str
+        Workflow name, e.g. 'sub_01_ses_1_T1w_deface_wf'.
+    """
+    
+    basename = os.path.basename(image)
+    if '.nii' in basename:
+        basename = basename[:basename.find('.nii')]
+    return re.sub(r'\W', '_', basename) + '_' + suffix
+
+
+def init_brain_extraction_wf(args, image, subject_label):
+    """
+    Setup the brain extraction workflow selected via --brainextraction.
+    
+    Parameters
+    ----------
+    args : argparse.Namespace
+        Command line arguments.
+    image : str
+        Path to image on which brain extraction should be run.
+    subject_label : str
+        Subject label to process.
+    
+    Returns
+    -------
+    nipype.pipeline.engine.Workflow
+        Brain extraction workflow.
+    """
+    
+    name = _workflow_name(image, 'brainextraction_wf')
+    if args.brainextraction == 'bet':
+        if args.bet_frac is None:
+            raise Exception(
+                "If you want to use BET for pre-defacing brain "
+                "extraction, please provide a Frac value. For example: "
+                "--bet_frac 0.5"
+            )
+        from bidsonym.utils import init_brain_extraction_bet_wf
+        return init_brain_extraction_bet_wf(image, args.bet_frac[0],
+                                            subject_label, args.bids_dir,
+                                            name=name)
+    # nobrainer is run on all images at once, see connect_nobrainer_batch
+    from bidsonym.utils import init_brain_extraction_nb_wf
+    return init_brain_extraction_nb_wf(image, subject_label, args.bids_dir,
+                                       batched=True, name=name)
+
+
+def _select_batch_result(results, index, image):
+    """
+    Select the result of one image from the results of a batch node.
+    
+    Parameters
+    ----------
+    results : list
+        Results of the batch node, None for images that failed.
+    index : int
+        Index of the image within the batch.
+    image : str
+        Path to the image, used in the error message.
+    
+    Returns
+    -------
+    result
+        Result of the image.
+    """
+    
+    if results[index] is None:
+        raise RuntimeError(f"Batch processing of {image} failed, see the "
+                           f"output of the batch node for details.")
+    return results[index]
+
+
+def _connect_batch(workflow, batch_node, suffix, inputs, result):
+    """
+    Feed all (sub-)workflows of a kind from a single batch node.
+    
+    The batch node receives the values of the given inputnode fields of
+    all matching workflows as lists and has to return a list 'outfiles'
+    holding one result per workflow, which is handed back to the
+    workflows via select nodes. Images the batch node failed on (None)
+    fail their select node, so that only the workflow of this image stops.
+    
+    Parameters
+    ----------
+    workflow : nipype.pipeline.engine.Workflow
+        Workflow holding the workflows that should be fed.
+    batch_node : nipype.pipeline.engine.Node
+        Node processing all images at once.
+    suffix : str
+        Name suffix of the workflows that should be fed.
+    inputs : dict
+        Mapping of inputnode fields of the workflows to list inputs of
+        the batch node, e.g. {'in_file': 'images'}. The first field holds
+        the image, which is named if processing it failed.
+    result : str
+        Inputnode field of the workflows receiving the result.
+    """
+    
+    import nipype.pipeline.engine as pe
+    from nipype import Function
+    
+    inputnodes = [name for name in workflow.list_node_names()
+                  if name.endswith(f'{suffix}.inputnode') and
+                  result in workflow.get_node(name).inputs.copyable_trait_names()]
+    if not inputnodes:
+        return
+    
+    for field, batch_input in inputs.items():
+        setattr(batch_node.inputs, batch_input,
+                [getattr(workflow.get_node(name).inputs, field)
+                 for name in inputnodes])
+    
+    # Hand the result of every image to its workflow
+    for index, name in enumerate(inputnodes):
+        sub_wf_name, path = name.split('.', 1)
+        select = pe.Node(Function(input_names=['results', 'index', 'image'],
+                                  output_names=['out'],
+                                  function=_select_batch_result),
+                         name='select_' + re.sub(r'\W', '_', name))
+        select.inputs.index = index
+        select.inputs.image = getattr(workflow.get_node(name).inputs,
+                                      next(iter(inputs)))
+        workflow.connect([
+            (batch_node, select, [('outfiles', 'results')]),
+            (select, workflow.get_node(sub_wf_name),
+             [('out', f'{path}.{result}')])
+        ])
+
+
+def connect_nobrainer_batch(workflow, n_threads=None, max_procs=None):
+    """
+    Feed all nobrainer brain extraction workflows within a workflow from a
+    single node, which loads the nobrainer model once and processes all
+    images as one batch.
+    
+    Parameters
+    ----------
+    workflow : nipype.pipeline.engine.Workflow
+        Workflow holding brain extraction workflows set up via
+        init_brain_extraction_nb_wf(..., batched=True).
+    n_threads : int, optional
+        Number of threads used by TensorFlow.
+    max_procs : int, optional
+        Number of processes of the workflow plugin. n_threads is limited
+        to it, as MultiProc rejects nodes requesting more processes.
+    """
+    
+    import nipype.pipeline.engine as pe
+    from nipype import Function
+    from bidsonym.utils import nobrainer_predict
+    
+    if n_threads and max_procs:
+        n_threads = min(n_threads, max_procs)
+    
+    nobrainer_batch = pe.Node(
+        Function(input_names=['images', 'outfiles', 'n_threads'],
+                 output_names=['outfiles'],
+                 function=nobrainer_predict),
+        name='nobrainer_batch', n_procs=n_threads or 1
+    )
+    if n_threads:
+        nobrainer_batch.inputs.n_threads = n_threads
+    
+    _connect_batch(workflow, nobrainer_batch, 'brainextraction_wf',
+                   {'in_file': 'images', 'out_file': 'outfiles'},
+                   'mask_file')
+
+
+def connect_defacer_batch(workflow, defacer, n_workers=None):
+    """
+    Feed all defacing workflows within a workflow from a single node,
+    which defaces all images with one call of a batched defacer, e.g.
+    loading the deepdefacer model only once.
+    
+    Parameters
+    ----------
+    workflow : nipype.pipeline.engine.Workflow
+        Workflow holding defacing workflows set up via
+        init_defacer_wf(..., batched=True).
+    defacer : str
+        Name of the defacer.
+    n_workers : int, optional
+        Number of workers (threads) used by the defacer.
+    """
+    
+    import nipype.pipeline.engine as pe
+    from nipype import Function
+    from bidsonym.defacers import deface_files
+    
+    defacer_batch = pe.Node(
+        Function(input_names=['defacer', 'images', 'outfiles', 'maskfiles',
+                              'n_workers'],
+                 output_names=['outfiles'],
+                 function=deface_files),
+        name=f'{defacer}_batch', n_procs=n_workers or 1
+    )
+    defacer_batch.inputs.defacer = defacer
+    if n_workers:
+        defacer_batch.inputs.n_workers = n_workers
+    
+    _connect_batch(workflow, defacer_batch, 'deface_wf',
+                   {'in_file': 'images', 'out_file': 'outfiles',
+                    'deface_mask_file': 'maskfiles'},
+                   'defaced_file')
+
+
+def init_deface_wf(args, image, outfile, subject_label):
+    """
+    Setup the defacing workflow selected via --deid.
+    
+    Parameters
+    ----------
+    args : argparse.Namespace
+        Command line arguments.
+    image : str
+        Path to the original image that should be defaced.
+    outfile : str
+        Name of the defaced file.
+    subject_label : str
+        Subject label to process.
+    
+    Returns
+    -------
+    nipype.pipeline.engine.Workflow or None
+        Defacing workflow, None if no defacing algorithm was selected.
+    """
+    
+    from bidsonym.defacers import get_defacer
+    from bidsonym.defacing_algorithms import (init_defacer_wf,
+                                              _defacemask_outfile)
+    
+    if args.deid is None:
+        return None
+    
+    capabilities = get_defacer(args.deid)['capabilities']
+    
+    # Defacing masks are saved next to the non-de-identified images
+    maskfile = None
+    if capabilities['mask_output']:
+        maskfile = _defacemask_outfile(image, subject_label, args.bids_dir,
+                                       args.deid)
+    
+    # Batched defacers are run on all images at once, see
+    # connect_defacer_batch
+    return init_defacer_wf(args.deid, image, outfile, maskfile=maskfile,
+                           batched=capabilities['batched'],
+                           name=_workflow_name(outfile, 'deface_wf'))
+
+
+def _get_images(args, layout, subject_label, suffix, session=None,
+                journal=None):
+    """
+    Get the images of a subject/session with a given suffix.
+    
+    Images that were moved to sourcedata by an interrupted previous run
+    are no longer part of the BIDS layout and are added from the journal.
+    
+    Parameters
+    ----------
+    args : argparse.Namespace
+        Command line arguments.
+    layout : BIDSLayout
+        BIDS layout object.
+    subject_label : str
+        Subject label to process.
+    suffix : str
+        Suffix of the images, e.g. 'T1w'.
+    session : str, optional
+        Session label, if None, images of all sessions are returned.
+    journal : dict, optional
+        Completed stages as returned by read_journal.
+    
+    Returns
+    -------
+    list of str
+        Paths to the images.
+    """
+    
+    from bids.layout import parse_file_entities
+    
+    query = dict(subject=subject_label, extension='nii.gz', suffix=suffix,
+                 return_type='filename')
+    if session:
+        query['session'] = session
+    images = layout.get(**query)
+    
+    for stage, item in (journal or {}):
+        if stage != 'backup':
+            continue
+        image = os.path.join(args.bids_dir, item)
+        entities = parse_file_entities(image)
+        if (entities.get('suffix') == suffix and image not in images and
+                (not session or entities.get('session') == session)):
+            images.append(image)
+    
+    return sorted(images)
+
+
+def _connect_or_set(workflow, source, dest, field):
+    """
+    Connect an output to an input, or set the input if the output is
+    already available as a file.
+    
+    Parameters
+    ----------
+    workflow : nipype.pipeline.engine.Workflow
+        Workflow holding source and dest.
+    source : str or tuple
+        Path to an existing file or (workflow/node, output field).
+    dest : nipype.pipeline.engine.Workflow or nipype.pipeline.engine.Node
+        Workflow (whose inputnode receives the input) or node.
+    field : str
+        Input field of dest (of its inputnode for workflows).
+    """
+    
+    import nipype.pipeline.engine as pe
+    
+    if isinstance(dest, pe.Workflow):
+        node, dest_field = dest.get_node('inputnode'), f'inputnode.{field}'
+    else:
+        node, dest_field = dest, field
+    
+    if isinstance(source, str):
+        setattr(node.inputs, field, source)
+    else:
+        workflow.connect([(source[0], dest, [(source[1], dest_field)])])
+
+
+def _journal_node(args, subject_label, stage, item, name):
+    """
+    Setup a node recording a completed stage in the journal of a subject,
+    once the output connected to its 'in_file' input is available.
+    
+    Parameters
+    ----------
+    args : argparse.Namespace
+        Command line arguments.
+    subject_label : str
+        Subject label to process.
+    stage : str
+        Stage that is recorded.
+    item : str
+        Image, session or subject the stage is recorded for.
+    name : str
+        Name of the node.
+    
+    Returns
+    -------
+    nipype.pipeline.engine.Node
+        Journal node.
+    """
+    
+    import nipype.pipeline.engine as pe
+    from nipype import Function
+    from bidsonym.utils import record_stage
+    
+    journal_node = pe.Node(
+        Function(input_names=['bids_dir', 'subject_label', 'stage', 'item',
+                              'in_file'],
+                 output_names=['out_file'],
+                 function=record_stage),
+        name=name
+    )
+    journal_node.inputs.bids_dir = args.bids_dir
+    journal_node.inputs.subject_label = subject_label
+    journal_node.inputs.stage = stage
+    journal_node.inputs.item = item
+    return journal_node
+
+
+def _backup_image(args, subject_label, image, session=None, journal=None):
+    """
+    Move an original image to sourcedata, unless the journal shows that
+    this was already done by a previous run.
+    
+    Parameters
+    ----------
+    args : argparse.Namespace
+        Command line arguments.
+    subject_label : str
+        Subject label to process.
+    image : str
+        Path to the original image.
+    session : str, optional
+        Session label.
+    journal : dict, optional
+        Completed stages as returned by read_journal.
+    
+    Returns
+    -------
+    str
+        Path to the moved original image.
+    """
+    
+    from bidsonym.utils import copy_no_deid, record_stage
+    
+    item = os.path.relpath(image, args.bids_dir)
+    entry = (journal or {}).get(('backup', item))
+    if entry is not None:
+        return entry['source']
+    
+    source = copy_no_deid(args.bids_dir, subject_label, image,
+                          session=session, resume=args.resume)
+    record_stage(args.bids_dir, subject_label, 'backup', item, source=source)
+    return source
+
+
+def _add_brain_extraction(args, ses_wf, subject_label, image, source,
+                          journal=None):
+    """
+    Add the brain extraction of an image to a session workflow, unless the
+    journal shows that it was already done by a previous run.
+    
+    Parameters
+    ----------
+    args : argparse.Namespace
+        Command line arguments.
+    ses_wf : nipype.pipeline.engine.Workflow
+        Workflow of the subject/session.
+    subject_label : str
+        Subject label to process.
+    image : str
+        Path to the original image in the BIDS dataset.
+    source : str
+        Path to the moved original image brain extraction is run on.
+    journal : dict, optional
+        Completed stages as returned by read_journal.
+    
+    Returns
+    -------
+    str or tuple
+        Path to the existing brain mask or (workflow, output field).
+    """
+    
+    from bidsonym.utils import _brainmask_outfile
+    
+    item = os.path.relpath(image, args.bids_dir)
+    brainmask = _brainmask_outfile(source, subject_label, args.bids_dir)
+    if ('brainmask', item) in (journal or {}) and os.path.exists(brainmask):
+        return brainmask
+    
+    brainextraction_wf = init_brain_extraction_wf(args, source, subject_label)
+    journal_node = _journal_node(
+        args, subject_label, 'brainmask', item,
+        _workflow_name(image, 'brainmask_journal')
+    )
+    ses_wf.connect([
+        (brainextraction_wf, journal_node, [('outputnode.out_file', 'in_file')])
+    ])
+    return (brainextraction_wf, 'outputnode.out_file')
+
+
+def _add_defacing(args, ses_wf, subject_label, image, deface_wf,
+                  journal=None):
+    """
+    Add a defacing workflow of an image to a session workflow, unless the
+    journal shows that the image was already defaced by a previous run.
+    
+    Parameters
+    ----------
+    args : argparse.Namespace
+        Command line arguments.
+    ses_wf : nipype.pipeline.engine.Workflow
+        Workflow of the subject/session.
+    subject_label : str
+        Subject label to process.
+    image : str
+        Path to the original image in the BIDS dataset, i.e. the defaced
+        file.
+    deface_wf : callable
+        Function returning the defacing workflow, only called if the
+        image still has to be defaced.
+    journal : dict, optional
+        Completed stages as returned by read_journal.
+    
+    Returns
+    -------
+    str or tuple or None
+        Path to the defaced image, (workflow, output field) or None if no
+        defacing workflow was set up.
+    """
+    
+    item = os.path.relpath(image, args.bids_dir)
+    if ('deface', item) in (journal or {}) and os.path.exists(image):
+        return image
+    
+    deface_wf = deface_wf()
+    if deface_wf is None:
+        return None
+    journal_node = _journal_node(args, subject_label, 'deface', item,
+                                 _workflow_name(image, 'deface_journal'))
+    ses_wf.connect([
+        (deface_wf, journal_node, [('outputnode.out_file', 'in_file')])
+    ])
+    return (deface_wf, 'outputnode.out_file')
+
+
 def process_subject_session(args, layout, subject_label, session=None,
-                            log_print=print):
+                            log_print=print, journal=None):
     """
-    Process a single subject/session combination.
+    Set up the processing of a single subject/session combination.
+    
+    The original images are moved to sourcedata right away, while brain
+    extraction, defacing and quality control graphics are added to a
+    workflow that is executed later on, together with all other
+    subjects/sessions.
     
     Parameters
     ----------
@@ -156,85 +780,146 @@ def process_subject_session(args, layout, subject_label, session=None,
         Session label to process.
     log_print : function, optional
         Logging function to use for output.
+    journal : dict, optional
+        Stages completed by a previous run (see read_journal), which are
+        skipped.
+    
+    Returns
+    -------
+    nipype.pipeline.engine.Workflow or None
+        Workflow of the subject/session, None if no T1w images were found
+        or all stages were completed by a previous run.
     """
     
+    import nipype.pipeline.engine as pe
+    from nipype.interfaces import utility as niu
+    from bidsonym.reports import init_report_wf
+    from bidsonym.utils import check_outpath, profile_stage
+    
     log_print(
         f"Processing subject {subject_label}"
         + (f", session {session}" if session else "")
     )
     
     # Get T1w images for this subject/session
-    if session:
-        list_t1w = layout.get(subject=subject_label, extension='nii.gz',
-                              suffix='T1w', return_type='filename',
-                              session=session)
-    else:
-        list_t1w = layout.get(subject=subject_label, extension='nii.gz',
-                              suffix='T1w', return_type='filename')
+    list_t1w = _get_images(args, layout, subject_label, 'T1w',
+                           session=session, journal=journal)
     
     if not list_t1w:
         log_print(
             f"No T1w images found for subject {subject_label}"
             + (f", session {session}" if session else "")
         )
-        return
+        return None
     
     log_print(f"Found {len(list_t1w)} T1w images: {list_t1w}")
     
+    ses_wf = pe.Workflow(f'ses_{session}_wf' if session
+                         else 'single_session_wf')
+    
+    # Defaced T1w images, used as reference for other modalities, and
+    # (defaced image, brain mask) pairs of all images, used for the
+    # quality control visualizations. Both are either files completed by
+    # a previous run or (workflow, output field) tuples
+    t1w_defaced = {}
+    image_outputs = []
+    
     # Process each T1w image
     for T1_file in list_t1w:
         # Create output directories
         check_outpath(args.bids_dir, subject_label)
         
-        # Run brain extraction for quality control
-        if args.brainextraction == 'bet':
-            if args.bet_frac is None:
-                raise Exception(
-                    "If you want to use BET for pre-defacing brain "
-                    "extraction, please provide a Frac value. For example: "
-                    "--bet_frac 0.5"
-                )
-            run_brain_extraction_bet(T1_file, args.bet_frac[0], subject_label,
-                                     args.bids_dir)
-        elif args.brainextraction == 'nobrainer':
-            run_brain_extraction_nb(T1_file, subject_label, args.bids_dir)
-        
-        # Check metadata for potentially identifying information
-        check_meta_data(args.bids_dir, subject_label, args.check_meta)
-        
-        # Copy original files to sourcedata before defacing
-        source_t1w = copy_no_deid(args.bids_dir, subject_label, T1_file,
-                                  session=session)
+        # Move original files to sourcedata before defacing
+        with profile_stage('backup', subject_label, session,
+                           os.path.relpath(T1_file, args.bids_dir)):
+            source_t1w = _backup_image(args, subject_label, T1_file,
+                                       session=session, journal=journal)
         
-        # Delete specified metadata fields if requested
-        if args.del_meta:
-            del_meta_data(args.bids_dir, subject_label, args.del_meta)
+        # Run brain extraction for quality control
+        brainmask = _add_brain_extraction(args, ses_wf, subject_label,
+                                          T1_file, source_t1w, journal)
         
         # Run the specified defacing algorithm
-        if args.deid == "pydeface":
-            run_pydeface(source_t1w, T1_file)
-        elif args.deid == "mri_deface":
-            run_mri_deface(source_t1w, T1_file)
-        elif args.deid == "quickshear":
-            run_quickshear(source_t1w, T1_file)
-        elif args.deid == "mridefacer":
-            run_mridefacer(source_t1w, T1_file)
-        elif args.deid == "deepdefacer":
-            run_deepdefacer(source_t1w, subject_label, args.bids_dir)
+        def t1w_deface_wf():
+            deface_wf = init_deface_wf(args, source_t1w, T1_file,
+                                       subject_label)
+            defacer = get_defacer(args.deid) if args.deid else None
+            if (deface_wf is not None and
+                    'mask_files' in defacer['options'] and
+                    not defacer['capabilities']['batched'] and
+                    not (args.deid == "quickshear" and
+                         args.quickshear_separate_bet)):
+                # Reuse the quality control brain extraction as brain mask
+                # of defacers accepting one, e.g. Quickshear
+                _connect_or_set(ses_wf, brainmask, deface_wf, 'mask_file')
+            return deface_wf
+        
+        defaced = _add_defacing(args, ses_wf, subject_label, T1_file,
+                                t1w_deface_wf, journal)
+        if defaced is None:
+            continue
+        t1w_defaced[T1_file] = defaced
+        image_outputs.append((defaced, brainmask))
     
     # Process T2w images if requested
     if args.deface_t2w:
-        process_additional_modality(args, layout, subject_label, 'T2w',
-                                    session, log_print)
+        image_outputs += process_additional_modality(
+            args, layout, subject_label, 'T2w', session, log_print,
+            ses_wf=ses_wf, t1w_defaced=t1w_defaced, journal=journal
+        )
     
     # Process FLAIR images if requested
     if args.deface_flair:
-        process_additional_modality(args, layout, subject_label, 'FLAIR',
-                                    session, log_print)
+        image_outputs += process_additional_modality(
+            args, layout, subject_label, 'FLAIR', session, log_print,
+            ses_wf=ses_wf, t1w_defaced=t1w_defaced, journal=journal
+        )
+    
+    # Generate quality control visualizations once all defacing and brain
+    # extraction workflows of this session have finished
+    report_item = f'ses-{session}' if session else f'sub-{subject_label}'
+    if image_outputs and ('report', report_item) not in (journal or {}):
+        report_wf = init_report_wf(args.bids_dir, subject_label,
+                                   session=session,
+                                   database_path=args.bids_database_dir,
+                                   n_workers=args.report_workers,
+                                   frame_stride=args.gif_frame_stride)
+        defaced_files = pe.Node(niu.Merge(len(image_outputs)),
+                                name='defaced_files')
+        brainmask_files = pe.Node(niu.Merge(len(image_outputs)),
+                                  name='brainmask_files')
+        for i, (defaced, brainmask) in enumerate(image_outputs, 1):
+            _connect_or_set(ses_wf, defaced, defaced_files, f'in{i}')
+            _connect_or_set(ses_wf, brainmask, brainmask_files, f'in{i}')
+        
+        report_files = pe.Node(niu.Merge(2), name='report_files')
+        report_journal = _journal_node(args, subject_label, 'report',
+                                       report_item, 'report_journal')
+        ses_wf.connect([
+            (defaced_files, report_wf,
+             [('out', 'inputnode.defaced_files')]),
+            (brainmask_files, report_wf,
+             [('out', 'inputnode.brainmask_files')]),
+            (report_wf, report_files,
+             [('plt_defaced.out_files', 'in1'),
+              ('gf_defaced.out_files', 'in2')]),
+            (report_files, report_journal, [('out', 'in_file')]),
+        ])
+    
+    if not ses_wf.list_node_names():
+        log_print(
+            f"All stages of subject {subject_label}"
+            + (f", session {session}" if session else "")
+            + " were completed by a previous run"
+        )
+        return None
+    
+    return ses_wf
 
 
 def process_additional_modality(args, layout, subject_label, modality,
-                                session=None, log_print=print):
+                                session=None, log_print=print, ses_wf=None,
+                                t1w_defaced=None, journal=None):
     """
     Process additional image modalities (T2w, FLAIR) using T1w defacing mask.
     
@@ -252,21 +937,41 @@ def process_additional_modality(args, layout, subject_label, modality,
         Session label to process.
     log_print : function, optional
         Logging function to use for output.
+    ses_wf : nipype.pipeline.engine.Workflow, optional
+        Workflow of the subject/session the processing is added to.
+    t1w_defaced : dict, optional
+        Defacing workflow outputs, as (workflow, output field), of the
+        T1w images, keyed by the T1w file. They are used as defacing
+        mask. T1w images not included are used as defacing mask
+        directly.
+    journal : dict, optional
+        Stages completed by a previous run (see read_journal), which are
+        skipped.
+    
+    Returns
+    -------
+    list of tuple
+        (defaced image, brain mask) of each image, either as file or
+        (workflow, output field).
     """
     
+    import nipype.pipeline.engine as pe
+    from bidsonym.defacing_algorithms import init_image_deface_wf
+    from bidsonym.utils import profile_stage
+    
+    if ses_wf is None:
+        ses_wf = pe.Workflow(_workflow_name(modality, 'wf'))
+    if t1w_defaced is None:
+        t1w_defaced = {}
+    
     log_print(
         f"Processing {modality} images for subject {subject_label}"
         + (f", session {session}" if session else "")
     )
     
     # Get images of this modality
-    if session:
-        modality_files = layout.get(subject=subject_label, extension='nii.gz',
-                                    suffix=modality, return_type='filename',
-                                    session=session)
-    else:
-        modality_files = layout.get(subject=subject_label, extension='nii.gz',
-                                    suffix=modality, return_type='filename')
+    modality_files = _get_images(args, layout, subject_label, modality,
+                                 session=session, journal=journal)
     
     if not modality_files:
         log_print(
@@ -274,49 +979,29 @@ def process_additional_modality(args, layout, subject_label, modality,
             f"images found for subject {subject_label}"
             + (f", session {session}" if session else "")
         )
-        return
+        return []
     
     log_print(
         f"Found {len(modality_files)} {modality} images: {modality_files}"
     )
     
+    image_outputs = []
+    
     # Process each image of this modality
     for modality_file in modality_files:
         try:
-            # Run brain extraction for quality control
-            if args.brainextraction == 'bet':
-                run_brain_extraction_bet(modality_file, args.bet_frac[0],
-                                         subject_label, args.bids_dir)
-            elif args.brainextraction == 'nobrainer':
-                run_brain_extraction_nb(modality_file, subject_label,
-                                        args.bids_dir)
-            
-            # Copy original file to sourcedata
-            source_modality = copy_no_deid(args.bids_dir, subject_label,
-                                           modality_file, session=session)
-            
             # Find corresponding T1w file to use as defacing reference
             if session:
-                t1w_files = layout.get(subject=subject_label,
-                                       extension='nii.gz',
-                                       suffix='T1w', return_type='filename',
-                                       session=session)
-            else:
+                t1w_session = session
+            elif 'ses-' in modality_file:
                 # Extract session from filename if present
-                if 'ses-' in modality_file:
-                    extracted_session = (modality_file[
-                        modality_file.find('ses-') + 4:
-                    ].split('_')[0])
-                    t1w_files = layout.get(subject=subject_label,
-                                           extension='nii.gz',
-                                           suffix='T1w',
-                                           return_type='filename',
-                                           session=extracted_session)
-                else:
-                    t1w_files = layout.get(subject=subject_label,
-                                           extension='nii.gz',
-                                           suffix='T1w',
-                                           return_type='filename')
+                t1w_session = (modality_file[
+                    modality_file.find('ses-') + 4:
+                ].split('_')[0])
+            else:
+                t1w_session = None
+            t1w_files = _get_images(args, layout, subject_label, 'T1w',
+                                    session=t1w_session, journal=journal)
             
             if not t1w_files:
                 log_print(
@@ -327,14 +1012,446 @@ def process_additional_modality(args, layout, subject_label, modality,
                 
             T1_file = t1w_files[0]  # Use first T1w file as reference
             
-            # Apply defacing using T1w mask
-            run_image_deface(source_modality, T1_file, modality_file)
+            # Copy original file to sourcedata
+            with profile_stage('backup', subject_label, session,
+                               os.path.relpath(modality_file, args.bids_dir)):
+                source_modality = _backup_image(args, subject_label,
+                                                modality_file,
+                                                session=session,
+                                                journal=journal)
+            
+            # Run brain extraction for quality control
+            brainmask = _add_brain_extraction(args, ses_wf, subject_label,
+                                              modality_file, source_modality,
+                                              journal)
+            
+            # Apply defacing using T1w mask, waiting for the T1w image
+            # to be defaced if it is processed in the same workflow
+            def image_deface_wf():
+                deface_wf = init_image_deface_wf(
+                    source_modality, None, modality_file,
+                    registration_cache_dir=args.registration_cache_dir,
+                    name=_workflow_name(modality_file, 'deface_wf')
+                )
+                _connect_or_set(ses_wf, t1w_defaced.get(T1_file, T1_file),
+                                deface_wf, 't1w_deface_mask')
+                return deface_wf
+            
+            defaced = _add_defacing(args, ses_wf, subject_label,
+                                    modality_file, image_deface_wf, journal)
+            image_outputs.append((defaced, brainmask))
             
         except Exception as e:
             log_print(
                 f"Error processing {modality} file {modality_file}: {e}"
             )
             continue
+    
+    return image_outputs
+
+
+def process_subject(args, layout, subject_label, log_print=print):
+    """
+    Set up the complete de-identification of a single subject, including
+    the check and deletion of meta-data as well as brain extraction,
+    defacing and quality control visualizations of all of its sessions.
+    
+    With --resume, stages recorded in the journal of the subject by a
+    previous run are skipped.
+    
+    Parameters
+    ----------
+    args : argparse.Namespace
+        Command line arguments.
+    layout : BIDSLayout
+        BIDS layout object.
+    subject_label : str
+        Subject label to process.
+    log_print : function, optional
+        Logging function to use for output.
+    
+    Returns
+    -------
+    tuple
+        (sub_wf, sessions_to_process)
+        sub_wf: Workflow of the subject holding all of its sessions, None
+        if no processing is left
+        sessions_to_process: List of processed session labels
+    """
+    
+    import nipype.pipeline.engine as pe
+    from bidsonym.utils import (check_outpath, check_meta_data, del_meta_data,
+                                journal_file, read_journal, record_stage,
+                                profile_stage)
+    
+    log_print(f"\n{'=' * 60}")
+    log_print(f"Processing subject: {subject_label}")
+    log_print(f"{'=' * 60}")
+    
+    # Stages completed by a previous run
+    journal = {}
+    if args.resume:
+        journal = read_journal(args.bids_dir, subject_label)
+        if journal:
+            log_print(f"Resuming subject {subject_label} from "
+                      f"{journal_file(args.bids_dir, subject_label)}")
+    elif os.path.exists(journal_file(args.bids_dir, subject_label)):
+        raise Exception(
+            f"Subject {subject_label} was already processed by a previous "
+            f"run, see {journal_file(args.bids_dir, subject_label)}.\n"
+            "In order to avoid overwriting non-de-identified data, please "
+            "evaluate the current state of the sourcedata and raw data or "
+            "use --resume to continue the previous run."
+        )
+    
+    # Get available sessions for this subject
+    available_sessions = layout.get(subject=subject_label,
+                                    return_type='id',
+                                    target='session')
+    log_print(
+        f"Available sessions for subject {subject_label}: "
+        f"{available_sessions}"
+    )
+    
+    # Determine which sessions to process
+    if args.session:
+        if "all" in args.session:
+            sessions_to_process = available_sessions
+        else:
+            # Validate requested sessions exist
+            invalid_sessions = [ses for ses in args.session
+                                if ses not in available_sessions]
+            if invalid_sessions:
+                log_print(
+                    f"Warning: The following sessions are not available "
+                    f"for subject {subject_label}: {invalid_sessions}"
+                )
+            sessions_to_process = [ses for ses in args.session
+                                   if ses in available_sessions]
+    else:
+        sessions_to_process = available_sessions
+    
+    log_print(f"Processing sessions: {sessions_to_process}")
+    
+    if ('cleanup', f'sub-{subject_label}') in journal:
+        log_print(f"Subject {subject_label} was completed by a previous run")
+        return None, sessions_to_process
+    
+    # Check metadata for potentially identifying information
+    check_outpath(args.bids_dir, subject_label)
+    metadata_done = ('metadata', f'sub-{subject_label}') in journal
+    if not metadata_done:
+        with profile_stage('metadata_check', subject_label):
+            check_meta_data(args.bids_dir, subject_label, args.check_meta)
+    
+    sub_wf = pe.Workflow(f'sub_{subject_label}_wf')
+    
+    # Process each session (or no-session data)
+    for session in (sessions_to_process or [None]):
+        ses_wf = process_subject_session(args, layout, subject_label,
+                                         session=session, log_print=log_print,
+                                         journal=journal)
+        if ses_wf is not None:
+            sub_wf.add_nodes([ses_wf])
+    
+    # Delete specified metadata fields if requested
+    if not metadata_done:
+        if args.del_meta:
+            with profile_stage('metadata_scrub', subject_label):
+                del_meta_data(args.bids_dir, subject_label, args.del_meta)
+        record_stage(args.bids_dir, subject_label, 'metadata',
+                     f'sub-{subject_label}')
+    
+    if not sub_wf.list_node_names():
+        return None, sessions_to_process
+    
+    return sub_wf, sessions_to_process
+
+
+def finalize_subject(args, subject_label, sessions_to_process,
+                     log_print=print):
+    """
+    Rename the non-de-identified files of a processed subject and
+    restructure its outputs following BIDS conventions.
+    
+    Parameters
+    ----------
+    args : argparse.Namespace
+        Command line arguments.
+    subject_label : str
+        Subject label to process.
+    sessions_to_process : list of str
+        Processed session labels.
+    log_print : function, optional
+        Logging function to use for output.
+    """
+    
+    from bidsonym.utils import (rename_non_deid, clean_up_files, read_journal,
+                                record_stage, profile_stage)
+    
+    if args.resume and ('cleanup', f'sub-{subject_label}') in read_journal(
+            args.bids_dir, subject_label):
+        return
+    
+    # Rename non-deidentified files with descriptive labels
+    with profile_stage('rename', subject_label):
+        rename_non_deid(args.bids_dir, subject_label)
+    
+    # Restructure outputs for each session
+    for session in (sessions_to_process or [None]):
+        with profile_stage('cleanup', subject_label, session):
+            clean_up_files(args.bids_dir, subject_label, session=session)
+    
+    record_stage(args.bids_dir, subject_label, 'cleanup',
+                 f'sub-{subject_label}')
+    
+    log_print(f"Completed processing for subject {subject_label}")
+
+
+def run_subjects_workflow(args, layout, subjects_to_analyze, log_print=print,
+                          n_procs=1):
+    """
+    Build a single workflow holding the brain extraction, defacing and
+    report nodes of all given subjects and run it with the Nipype plugin
+    selected via --nipype_plugin, so that independent nodes of different
+    images and subjects can be executed concurrently.
+    
+    Parameters
+    ----------
+    args : argparse.Namespace
+        Command line arguments.
+    layout : BIDSLayout
+        BIDS layout object.
+    subjects_to_analyze : list of str
+        Subject labels to process.
+    log_print : function, optional
+        Logging function to use for output.
+    n_procs : int, optional
+        Number of processes the Nipype plugin is allowed to use.
+    
+    Returns
+    -------
+    tuple
+        (successful_subjects, failed_subjects)
+        successful_subjects: List of successfully processed subject labels
+        failed_subjects: Dictionary mapping failed subject labels to a
+        description of the error
+    """
+    
+    import nipype.pipeline.engine as pe
+    from bidsonym.utils import profile_stage, profile_node, write_run_profile
+    
+    bidsonym_wf = pe.Workflow('bidsonym_wf')
+    
+    # Use a persistent working directory, so that nodes whose inputs did
+    # not change are reused from Nipype's cache in subsequent runs
+    if args.work_dir:
+        bidsonym_wf.base_dir = str(args.work_dir.absolute())
+        bidsonym_wf.config['execution']['crashdump_dir'] = os.path.join(
+            bidsonym_wf.base_dir, 'crash'
+        )
+    
+    subject_sessions = {}
+    failed_subjects = {}
+    
+    # Set up the processing of all subjects
+    for subject_label in subjects_to_analyze:
+        try:
+            with profile_stage('setup', subject_label):
+                sub_wf, sessions_to_process = process_subject(
+                    args, layout, subject_label, log_print
+                )
+        except Exception as e:
+            log_print(f"Error processing subject {subject_label}: {e}",
+                      "ERROR")
+            failed_subjects[subject_label] = traceback.format_exc()
+            continue
+        if sub_wf is not None:
+            bidsonym_wf.add_nodes([sub_wf])
+        subject_sessions[subject_label] = sessions_to_process
+    
+    # Run nobrainer and batched defacers (e.g. deepdefacer) once for all
+    # images of all subjects
+    if args.brainextraction == 'nobrainer':
+        connect_nobrainer_batch(bidsonym_wf,
+                                n_threads=args.nobrainer_threads or n_procs,
+                                max_procs=n_procs)
+    if args.deid and get_defacer(args.deid)['capabilities']['batched']:
+        connect_defacer_batch(bidsonym_wf, args.deid, n_workers=n_procs)
+    
+    # Keep track of crashing nodes to attribute failures to subjects and
+    # profile all executed nodes
+    crashed_nodes = []
+    run_start = datetime.now(timezone.utc)
+    
+    def status_callback(node, status):
+        if status == 'exception':
+            crashed_nodes.append(node.fullname)
+        profile_node(node, status, run_start)
+    
+    plugin_args = {'status_callback': status_callback}
+    if args.nipype_plugin in ('MultiProc', 'LegacyMultiProc'):
+        plugin_args['n_procs'] = n_procs
+        if args.mem_gb:
+            plugin_args['memory_gb'] = args.mem_gb
+    
+    # Execute the workflow of all subjects
+    if bidsonym_wf.list_node_names():
+        log_print(f"Running workflow using the {args.nipype_plugin} plugin")
+        try:
+            with profile_stage('workflow'):
+                bidsonym_wf.run(plugin=args.nipype_plugin,
+                                plugin_args=plugin_args)
+        except RuntimeError as e:
+            log_print(f"Workflow did not execute cleanly: {e}", "ERROR")
+    
+    # Finalize all subjects whose workflows executed cleanly
+    successful_subjects = []
+    for subject_label, sessions_to_process in subject_sessions.items():
+        subject_crashes = [
+            node for node in crashed_nodes
+            if node.startswith(f'bidsonym_wf.sub_{subject_label}_wf.')
+        ]
+        if subject_crashes:
+            failed_subjects[subject_label] = (
+                "The following nodes crashed: " + ', '.join(subject_crashes)
+            )
+            continue
+        try:
+            finalize_subject(args, subject_label, sessions_to_process,
+                             log_print)
+            successful_subjects.append(subject_label)
+        except Exception as e:
+            log_print(f"Error processing subject {subject_label}: {e}",
+                      "ERROR")
+            failed_subjects[subject_label] = traceback.format_exc()
+    
+    # Write the run profiles of all subjects that were set up
+    for subject_label in subject_sessions:
+        write_run_profile(args.bids_dir, subject_label)
+    
+    return successful_subjects, failed_subjects
+
+
+def _process_subject_worker(args, subject_label, n_procs=1, log_queue=None):
+    """
+    Process a single subject within a worker process.
+    
+    Every worker loads its own BIDS layout (from the index in
+    --bids_database_dir, if provided), so that concurrently processed
+    subjects only ever touch their own sourcedata/bidsonym/sub-<label>
+    directory. Messages are sent via log_queue to the log of the run.
+    
+    Parameters
+    ----------
+    args : argparse.Namespace
+        Command line arguments.
+    subject_label : str
+        Subject label to process.
+    n_procs : int, optional
+        Number of processes the Nipype plugin of this worker may use.
+    log_queue : queue, optional
+        Queue shared with the main process (see forward_logging). If not
+        provided, the worker writes its own subject-specific log file.
+    
+    Returns
+    -------
+    tuple
+        (successful_subjects, failed_subjects), see run_subjects_workflow.
+    """
+    
+    from bidsonym.reports import setup_logging
+    from bidsonym.utils import get_bids_layout
+    
+    log_print, _ = setup_logging(args.bids_dir, subject_label, session=None,
+                                 operation="bidsonym",
+                                 json_lines=args.json_log,
+                                 log_queue=log_queue)
+    # Pool workers are reused for further subjects, so the subject's log
+    # file is closed once it is processed
+    try:
+        layout = get_bids_layout(args.bids_dir, args.bids_database_dir,
+                                 log_print)
+        return run_subjects_workflow(args, layout, [subject_label], log_print,
+                                     n_procs=n_procs)
+    finally:
+        log_print.close()
+
+
+def run_subjects(args, layout, subjects_to_analyze, log_print=print):
+    """
+    Process subjects either within a single workflow or concurrently in a
+    pool of worker processes, depending on --max_parallel_subjects/--n_procs.
+    
+    A failing subject does not stop the remaining subjects from being
+    processed. All failures are collected and reported at the end.
+    
+    Parameters
+    ----------
+    args : argparse.Namespace
+        Command line arguments.
+    layout : BIDSLayout
+        BIDS layout object.
+    subjects_to_analyze : list of str
+        Subject labels to process.
+    log_print : function, optional
+        Logging function to use for output.
+    
+    Returns
+    -------
+    tuple
+        (successful_subjects, failed_subjects)
+        successful_subjects: List of successfully processed subject labels
+        failed_subjects: Dictionary mapping failed subject labels to a
+        description of the error
+    """
+    
+    from bidsonym.reports import forward_logging
+    
+    max_parallel_subjects = args.max_parallel_subjects or 1
+    n_workers = max(1, min(max_parallel_subjects, len(subjects_to_analyze)))
+    
+    if n_workers == 1:
+        return run_subjects_workflow(args, layout, subjects_to_analyze,
+                                     log_print, n_procs=args.n_procs)
+    
+    # Split the available processes between the workers
+    n_procs = max(1, args.n_procs // n_workers)
+    
+    successful_subjects = []
+    failed_subjects = {}
+    
+    log_print(f"Processing up to {n_workers} subjects in parallel")
+    
+    # The workers send their messages to the log of the run
+    with Manager() as manager:
+        log_queue = manager.Queue()
+        log_listener = forward_logging(log_print, log_queue)
+        try:
+            with ProcessPoolExecutor(max_workers=n_workers) as executor:
+                futures = {
+                    executor.submit(_process_subject_worker, args,
+                                    subject_label, n_procs,
+                                    log_queue): subject_label
+                    for subject_label in subjects_to_analyze
+                }
+                for future in as_completed(futures):
+                    subject_label = futures[future]
+                    try:
+                        successful, failed = future.result()
+                        successful_subjects += successful
+                        failed_subjects.update(failed)
+                    except Exception as e:
+                        log_print(f"Error processing subject {subject_label}: "
+                                  f"{e}", "ERROR")
+                        failed_subjects[subject_label] = ''.join(
+                            traceback.format_exception(type(e), e,
+                                                       e.__traceback__)
+                        )
+        finally:
+            log_listener.stop()
+    
+    return successful_subjects, failed_subjects
 
 
 def run_revert_mode(args, layout):
@@ -349,6 +1466,8 @@ def run_revert_mode(args, layout):
         BIDS layout object.
     """
     
+    from bidsonym.utils import revert_bidsonym
+    
     print("=" * 60)
     print("BIDSONYM REVERT MODE")
     print("=" * 60)
@@ -527,6 +1646,12 @@ def run_deeid():
     Main entry point for BIDSonym de-identification workflow.
     """
     
+    from nipype import config
+    from bidsonym.reports import build_qc_dashboard, setup_logging
+    from bidsonym.utils import (check_dataset_meta_data, del_dataset_meta_data,
+                                get_bids_layout, validate_input_dir, profile_stage,
+                                write_dataset_run_profile)
+    
     args = get_parser().parse_args()
     
     # Initialize logging for normal processing (not for revert mode)
@@ -540,7 +1665,7 @@ def run_deeid():
                            if args.participant_label else "all")
         log_print, log_path = setup_logging(
             args.bids_dir, primary_subject, session=None,
-            operation="bidsonym"
+            operation="bidsonym", json_lines=args.json_log
         )
         
         log_print("BIDSonym De-identification Workflow")
@@ -565,10 +1690,14 @@ def run_deeid():
             "Making sure the input data is BIDS compliant "
             "(warnings can be ignored in most cases)."
         )
-        validate_input_dir(exec_env, args.bids_dir, args.participant_label)
+        with profile_stage('validation'):
+            validate_input_dir(exec_env, args.bids_dir,
+                               args.participant_label)
 
-    # Initialize BIDS layout
-    layout = BIDSLayout(args.bids_dir)
+    # Initialize BIDS layout once, it is shared by all subjects
+    with profile_stage('layout'):
+        layout = get_bids_layout(args.bids_dir, args.bids_database_dir,
+                                 log_print)
 
     # Check if we're in revert mode
     if args.revert:
@@ -585,6 +1714,20 @@ def run_deeid():
             "nobrainer."
         )
 
+    # Resolve the defacer, "auto" picks the fastest one available
+    if args.deid == 'auto':
+        args.deid = select_defacer()
+        log_print(f"Selected defacer: {args.deid}")
+    elif args.deid and not defacer_available(args.deid):
+        log_print(f"The defacer {args.deid} does not seem to be available in "
+                  f"this environment (see the BIDSONYM_FS_DATA and "
+                  f"BIDSONYM_MRIDEFACER environment variables for the "
+                  f"locations of mri_deface and mridefacer).", "WARNING")
+    if (args.deid == 'quickshear' and args.quickshear_separate_bet and
+            shutil.which('bet') is None):
+        log_print("--quickshear_separate_bet requires FSL's bet, which "
+                  "could not be found.", "WARNING")
+
     # Determine subjects to analyze
     if args.analysis_level == "participant":
         if args.participant_label:
@@ -612,94 +1755,64 @@ def run_deeid():
         f"{subjects_to_analyze}"
     )
 
-    # Process each subject
-    for subject_label in subjects_to_analyze:
-        log_print(f"\n{'=' * 60}")
-        log_print(f"Processing subject: {subject_label}")
-        log_print(f"{'=' * 60}")
-        
-        # Get available sessions for this subject
-        available_sessions = layout.get(subject=subject_label,
-                                        return_type='id',
-                                        target='session')
-        log_print(
-            f"Available sessions for subject {subject_label}: "
-            f"{available_sessions}"
-        )
-        
-        # Determine which sessions to process
-        if args.session:
-            if "all" in args.session:
-                sessions_to_process = available_sessions
-            else:
-                # Validate requested sessions exist
-                invalid_sessions = [ses for ses in args.session
-                                    if ses not in available_sessions]
-                if invalid_sessions:
-                    log_print(
-                        f"Warning: The following sessions are not available "
-                        f"for subject {subject_label}: {invalid_sessions}"
-                    )
-                sessions_to_process = [ses for ses in args.session
-                                       if ses in available_sessions]
-        else:
-            sessions_to_process = available_sessions
-        
-        log_print(f"Processing sessions: {sessions_to_process}")
-        
-        # Process each session (or no-session data)
-        if sessions_to_process:
-            # Multi-session processing
-            for session in sessions_to_process:
-                process_subject_session(args, layout, subject_label,
-                                        session, log_print)
-        else:
-            # Single-session or no-session processing
-            process_subject_session(args, layout, subject_label,
-                                    session=None, log_print=log_print)
-        
-        # Rename non-deidentified files with descriptive labels
-        rename_non_deid(args.bids_dir, subject_label)
-        
-        # Generate quality control visualizations
-        log_print(
-            f"\nGenerating quality control visualizations for "
-            f"subject {subject_label}"
+    # Check and de-identify the dataset-level json files once, subjects
+    # only handle their own files
+    with profile_stage('metadata_check'):
+        check_dataset_meta_data(args.bids_dir, args.check_meta)
+    if args.del_meta:
+        with profile_stage('metadata_scrub'):
+            del_dataset_meta_data(args.bids_dir, args.del_meta)
+    
+    # Let Nipype measure CPU and memory usage of the workflow nodes
+    if args.resource_monitor:
+        config.enable_resource_monitor()
+
+    # Set up the cache of T1w to T2w/FLAIR registrations. It is keyed by
+    # the content of both images, which only recurs in reruns, so it is
+    # only used if it persists in a working directory
+    args.registration_cache_dir = None
+    if args.work_dir and not args.registration_cache_off:
+        args.registration_cache_dir = str(
+            (args.work_dir / 'registration_cache').absolute()
         )
-        
-        # Determine which modalities to include in visualizations based
-        # on processing flags. Always include T1w since it's always processed
-        visualization_modalities = ['T1w']
-        
-        # Add T2w if it was processed
-        if args.deface_t2w:
-            visualization_modalities.append('T2w')
-            
-        # Add FLAIR if it was processed
-        if args.deface_flair:
-            visualization_modalities.append('FLAIR')
-        
-        log_print(
-            f"Creating visualizations for modalities: "
-            f"{visualization_modalities}"
+
+    # Process all subjects, sequentially or in parallel
+    successful_subjects, failed_subjects = run_subjects(
+        args, layout, subjects_to_analyze, log_print
+    )
+    
+    # Summarize where the time of the run was spent
+    write_dataset_run_profile(args.bids_dir, subjects_to_analyze)
+
+    # Update the dashboard holding the graphics of all subjects processed
+    # so far, a failure does not affect the de-identified data
+    try:
+        with profile_stage('qc_dashboard'):
+            build_qc_dashboard(args.bids_dir, args.qc_thumbnail_size,
+                               n_workers=args.report_workers,
+                               log_print=log_print)
+    except Exception as e:
+        log_print(f"The quality control dashboard could not be updated: {e}",
+                  "WARNING")
+
+    # Print consolidated summary of the run
+    log_print(f"\n{'=' * 60}")
+    log_print("DE-IDENTIFICATION SUMMARY")
+    log_print(f"{'=' * 60}")
+    log_print(f"Successfully processed: {len(successful_subjects)} subjects")
+    for subject_label in successful_subjects:
+        log_print(f"  Success: {subject_label}")
+    if failed_subjects:
+        log_print(f"\nFailed to process: {len(failed_subjects)} subjects",
+                  "ERROR")
+        for subject_label, error in failed_subjects.items():
+            log_print(f"  Failed: {subject_label}", "ERROR")
+            log_print(error, "ERROR")
+        log_print(f"{'=' * 60}")
+        raise RuntimeError(
+            f"BIDSonym failed for the following participant(s): "
+            f"{sorted(failed_subjects)}"
         )
-        
-        # Generate visualizations for each session
-        if sessions_to_process:
-            for session in sessions_to_process:
-                log_print(f"Creating visualizations for session {session}")
-                create_graphics(
-                    args.bids_dir, subject_label, session=session,
-                    modalities=visualization_modalities
-                )
-                clean_up_files(args.bids_dir, subject_label, session=session)
-        else:
-            log_print("Creating visualizations for single-session data")
-            create_graphics(args.bids_dir, subject_label, session=None,
-                            modalities=visualization_modalities)
-            clean_up_files(args.bids_dir, subject_label, session=None)
-        
-        log_print(f"Completed processing for subject {subject_label}")
 
     log_print(f"\n{'=' * 60}")
     log_print("BIDSonym de-identification workflow completed successfully!")
@@ -709,4 +1822,4 @@ def run_deeid():
 
 
 if __name__ == "__main__":
-    run_deeid()
\ No newline at end of file
+    run_deeid()
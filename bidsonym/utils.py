@@ -1,20 +1,21 @@
 import os
+import re
 import sys
+import gzip
 import json
-
-import numpy as np
+import sqlite3
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime
+from functools import lru_cache
+from itertools import islice
 from glob import glob
 import pandas as pd
 from shutil import move
 
 import nibabel as nib
-from nibabel import load, Nifti1Image
-from nilearn.image import math_img
-
-import nipype.pipeline.engine as pe
-from nipype import Function
-from nipype.interfaces import utility as niu
-from nipype.interfaces.fsl import BET
 
 from bidsonym.reports import setup_logging
 
@@ -36,14 +37,13 @@ def check_outpath(bids_dir, subject_label):
     # The subject_label should not include the 'sub-' prefix as it's added here
     out_path = os.path.join(bids_dir, "sourcedata/bidsonym/sub-%s" % subject_label)
 
-    # Check if the directory doesn't exist
-    if not os.path.isdir(out_path):
-        # Create the directory (and any necessary parent directories)
-        # makedirs() will create intermediate directories if they don't exist
-        os.makedirs(out_path)
+    # Create the directory (and any necessary parent directories)
+    # exist_ok avoids races between subjects processed in parallel, which
+    # may create the shared sourcedata/bidsonym parent at the same time
+    os.makedirs(out_path, exist_ok=True)
 
 
-def copy_no_deid(bids_dir, subject_label, image_file, session=None):
+def copy_no_deid(bids_dir, subject_label, image_file, session=None, resume=False):
     """
     Move original non-defaced images to sourcedata.
 
@@ -57,6 +57,11 @@ def copy_no_deid(bids_dir, subject_label, image_file, session=None):
         Original non-defaced image.
     session : str
         Session label (if applicable).
+    resume : bool, optional
+        If True, an image that was already moved by a previous run is not
+        moved again, i.e. its moved path is returned. If the original
+        image still exists as well, the previous move did not finish and
+        is redone.
 
     Returns
     -------
@@ -76,36 +81,567 @@ def copy_no_deid(bids_dir, subject_label, image_file, session=None):
     # This removes the directory structure and keeps only the file name
     outfile = image_file[image_file.rfind('/') + 1:]
 
-    # Safety check: ensure we don't accidentally overwrite existing non-de-identified data
-    if os.path.isdir(path) is True:
-        # Raise an exception if the directory already exists to prevent data loss
-        raise Exception(
-            "A directory to store non-de-identified images for subject %s already exists under %s.\n"
-            "In order to avoid overwriting non-de-identified data, please evaluate the current state of the sourcedata and raw data"
-            "" % (subject_label, path)
-        )
-    else:
-        # Create the destination directory structure
-        os.makedirs(path)
-        
-        # Move (not copy) the original image file to the new location
-        # This preserves the original non-defaced data in sourcedata while
-        # allowing the defaced version to replace it in the main BIDS structure
-        move(image_file, os.path.join(path, outfile))
-
     # Construct the full path to the moved file
     moved_img_path = os.path.join(path, outfile)
 
+    # Safety check: ensure we don't accidentally overwrite existing non-de-identified data
+    if os.path.exists(moved_img_path):
+        if not resume:
+            # Raise an exception if the image was already moved to prevent data loss
+            raise Exception(
+                "A non-de-identified image %s for subject %s already exists under %s.\n"
+                "In order to avoid overwriting non-de-identified data, please evaluate the current state of the sourcedata and raw data"
+                " or use --resume to continue a previous run." % (outfile, subject_label, path)
+            )
+        if not os.path.exists(image_file):
+            # The image was moved by a previous run
+            return moved_img_path
+
+    # Create the destination directory structure
+    os.makedirs(path, exist_ok=True)
+    
+    # Move (not copy) the original image file to the new location
+    # This preserves the original non-defaced data in sourcedata while
+    # allowing the defaced version to replace it in the main BIDS structure
+    move(image_file, moved_img_path)
+
     # Return the path where the original image was moved to
     return moved_img_path
 
 
-def check_meta_data(bids_dir, subject_label, prob_fields=None):
+def journal_file(bids_dir, subject_label):
+    """
+    Construct the name of the processing journal of a subject.
+
+    Parameters
+    ----------
+    bids_dir : str
+        Path to BIDS root directory.
+    subject_label : str
+        Label of subject (without 'sub-').
+
+    Returns
+    -------
+    str
+        Path to the journal in sourcedata/bidsonym.
+    """
+
+    return os.path.join(bids_dir, "sourcedata/bidsonym/sub-%s" % subject_label,
+                        "sub-%s_desc-journal.jsonl" % subject_label)
+
+
+def record_stage(bids_dir, subject_label, stage, item, in_file=None, source=None):
+    """
+    Record a completed processing stage in the journal of a subject.
+
+    The journal is a JSON-lines file, every completed stage is appended
+    as a single line, so that an interrupted run at most loses the stage
+    that was running.
+
+    Parameters
+    ----------
+    bids_dir : str
+        Path to BIDS root directory.
+    subject_label : str
+        Label of subject (without 'sub-').
+    stage : str
+        Completed stage, one of 'backup', 'brainmask', 'deface',
+        'metadata', 'report' or 'cleanup'.
+    item : str
+        What the stage was completed for, i.e. the path of an image
+        relative to bids_dir, a session ('ses-<label>') or the subject
+        ('sub-<label>').
+    in_file : optional
+        Output of the stage, which is passed through, so that this
+        function can be chained within workflows.
+    source : str, optional
+        Path to the moved non-de-identified image (stage 'backup').
+
+    Returns
+    -------
+    in_file
+        Unchanged in_file.
+    """
+
+    # Imports are done here as this function is run as a Nipype Function node
+    import os
+    import json
+    from datetime import datetime
+    from bidsonym.utils import journal_file
+
+    entry = {'time': datetime.now().isoformat(), 'stage': stage, 'item': item}
+    if source is not None:
+        entry['source'] = source
+
+    journal = journal_file(bids_dir, subject_label)
+    os.makedirs(os.path.dirname(journal), exist_ok=True)
+    with open(journal, 'a') as f:
+        f.write(json.dumps(entry) + '\n')
+
+    return in_file
+
+
+def read_journal(bids_dir, subject_label):
+    """
+    Read the processing journal of a subject.
+
+    Parameters
+    ----------
+    bids_dir : str
+        Path to BIDS root directory.
+    subject_label : str
+        Label of subject (without 'sub-').
+
+    Returns
+    -------
+    dict
+        Completed stages, mapping (stage, item) to the journal entry.
+    """
+
+    journal = journal_file(bids_dir, subject_label)
+    completed = {}
+    if not os.path.exists(journal):
+        return completed
+
+    with open(journal) as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                # Line of an interrupted write
+                continue
+            completed[(entry['stage'], entry['item'])] = entry
+
+    return completed
+
+
+# Stage probes of the current run, see profile_stage
+_run_profile = []
+
+# Columns of the run profiles
+RUN_PROFILE_COLUMNS = ['subject', 'session', 'stage', 'item', 'status', 'start',
+                       'wall_time_s', 'cpu_time_s', 'peak_rss_mb', 'read_bytes',
+                       'write_bytes']
+
+
+def _resource_probe():
+    """
+    Measure the resources used by this process (and its finished child
+    processes, e.g. FSL tools) so far.
+
+    Returns
+    -------
+    dict
+        CPU time in seconds, peak resident memory in MB and bytes read
+        and written (None where not available).
+    """
+
+    import resource
+
+    usage_self = resource.getrusage(resource.RUSAGE_SELF)
+    usage_children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    # ru_maxrss is given in kB on Linux and in bytes on macOS
+    rss_unit = 1024 ** 2 if sys.platform == 'darwin' else 1024
+    probe = {
+        'cpu_time_s': (usage_self.ru_utime + usage_self.ru_stime +
+                       usage_children.ru_utime + usage_children.ru_stime),
+        'peak_rss_mb': max(usage_self.ru_maxrss, usage_children.ru_maxrss) / rss_unit,
+        'read_bytes': None,
+        'write_bytes': None
+    }
+
+    # Bytes passed through read/write calls, only available on Linux
+    try:
+        with open('/proc/self/io') as io_file:
+            io = dict(line.split(': ') for line in io_file.read().splitlines())
+        probe['read_bytes'] = int(io['rchar'])
+        probe['write_bytes'] = int(io['wchar'])
+    except (OSError, KeyError, ValueError):
+        pass
+
+    return probe
+
+
+@contextmanager
+def profile_stage(stage, subject_label=None, session=None, item=None):
+    """
+    Measure wall time, CPU time, peak memory and bytes read/written of a
+    processing stage and add them to the profile of the current run
+    (see write_run_profile).
+
+    Peak memory is the high-water mark of the process (or its child
+    processes) at the end of the stage, i.e. it is never lower than that
+    of earlier stages.
+
+    Parameters
+    ----------
+    stage : str
+        Name of the stage, e.g. 'backup'.
+    subject_label : str, optional
+        Label of subject (without 'sub-'), None for dataset-level stages.
+    session : str, optional
+        Session (without 'ses-').
+    item : str, optional
+        What the stage operates on, e.g. an image.
+    """
+
+    start = datetime.now().isoformat(timespec='seconds')
+    start_wall = time.perf_counter()
+    start_probe = _resource_probe()
+    status = 'failed'
+    try:
+        yield
+        status = 'ok'
+    finally:
+        end_probe = _resource_probe()
+        record = {'subject': subject_label, 'session': session, 'stage': stage,
+                  'item': item, 'status': status, 'start': start,
+                  'wall_time_s': time.perf_counter() - start_wall,
+                  'peak_rss_mb': end_probe['peak_rss_mb']}
+        for key in ['cpu_time_s', 'read_bytes', 'write_bytes']:
+            if end_probe[key] is not None and start_probe[key] is not None:
+                record[key] = end_probe[key] - start_probe[key]
+            else:
+                record[key] = None
+        _run_profile.append(record)
+
+
+def profile_node(node, status, run_start=None):
+    """
+    Add a finished Nipype node to the profile of the current run. Meant to
+    be called from the status_callback of a workflow's plugin.
+
+    The wall time is taken from the node's runtime. CPU time and peak memory
+    are only available if Nipype's resource monitor is enabled, bytes
+    read/written are not measured for nodes.
+
+    Parameters
+    ----------
+    node : nipype.pipeline.engine.Node
+        Node passed to the status_callback.
+    status : str
+        Status passed to the status_callback ('start', 'end' or 'exception').
+    run_start : datetime.datetime, optional
+        Start of the workflow run (timezone aware), nodes whose results
+        were computed before are recorded as 'cached'.
+    """
+
+    if status == 'start':
+        return
+
+    runtime = getattr(getattr(node, 'result', None), 'runtime', None)
+    if isinstance(runtime, list):
+        # MapNodes hold the runtimes of their iterations
+        runtime = runtime[0] if len(runtime) == 1 else None
+
+    # Assign the node to its subject/session via the workflow names
+    subject = re.search(r'\.sub_([a-zA-Z0-9]+)_wf\.', node.fullname)
+    session = re.search(r'\.ses_([a-zA-Z0-9]+)_wf\.', node.fullname)
+
+    # Nodes named after their image, e.g. 'sub_01_T1w_deface_journal',
+    # are grouped by the end of their name
+    stage = node.name
+    if stage.startswith('sub_'):
+        stage = '_'.join(stage.split('_')[-2:])
+
+    record = dict.fromkeys(RUN_PROFILE_COLUMNS)
+    record.update({'subject': subject.group(1) if subject else None,
+                   'session': session.group(1) if session else None,
+                   'stage': stage, 'item': node.fullname,
+                   'status': 'ok' if status == 'end' else 'failed'})
+    if runtime is not None:
+        start = getattr(runtime, 'startTime', None)
+        record['start'] = start
+        if (run_start is not None and start is not None and
+                datetime.fromisoformat(start) < run_start):
+            record['status'] = 'cached'
+        else:
+            record['wall_time_s'] = getattr(runtime, 'duration', None)
+            mem_peak_gb = getattr(runtime, 'mem_peak_gb', None)
+            cpu_percent = getattr(runtime, 'cpu_percent', None)
+            if mem_peak_gb is not None:
+                record['peak_rss_mb'] = mem_peak_gb * 1024
+            if cpu_percent is not None and record['wall_time_s'] is not None:
+                record['cpu_time_s'] = cpu_percent / 100 * record['wall_time_s']
+
+    _run_profile.append(record)
+
+
+def write_run_profile(bids_dir, subject_label):
+    """
+    Write the stages of a subject recorded during the current run to
+    sourcedata/bidsonym/sub-<label>/sub-<label>_desc-runprofile.json/.tsv.
+
+    Parameters
+    ----------
+    bids_dir : str
+        Path to BIDS root directory.
+    subject_label : str
+        Label of subject (without 'sub-').
+
+    Returns
+    -------
+    str
+        Path to the TSV file.
+    """
+
+    records = [record for record in _run_profile
+               if record['subject'] == subject_label]
+    out_base = os.path.join(bids_dir, 'sourcedata', 'bidsonym', f'sub-{subject_label}',
+                            f'sub-{subject_label}_desc-runprofile')
+    os.makedirs(os.path.dirname(out_base), exist_ok=True)
+
+    with open(out_base + '.json', 'w') as json_file:
+        json.dump(records, json_file, indent=4)
+    pd.DataFrame(records, columns=RUN_PROFILE_COLUMNS).to_csv(
+        out_base + '.tsv', sep='\t', index=False, na_rep='n/a')
+
+    return out_base + '.tsv'
+
+
+def write_dataset_run_profile(bids_dir, subject_labels):
+    """
+    Summarize the run profiles of all given subjects and the dataset-level
+    stages of the current run per stage, written to
+    sourcedata/bidsonym/desc-runprofile.json/.tsv.
+
+    Parameters
+    ----------
+    bids_dir : str
+        Path to BIDS root directory.
+    subject_labels : list of str
+        Labels of subjects (without 'sub-') whose run profiles are included.
+
+    Returns
+    -------
+    pandas.DataFrame
+        Summary with one row per stage.
+    """
+
+    # Subjects processed in worker processes wrote their own run profiles
+    tables = [pd.DataFrame([record for record in _run_profile if record['subject'] is None],
+                           columns=RUN_PROFILE_COLUMNS)]
+    for subject_label in subject_labels:
+        subject_profile = os.path.join(bids_dir, 'sourcedata', 'bidsonym',
+                                       f'sub-{subject_label}',
+                                       f'sub-{subject_label}_desc-runprofile.tsv')
+        if os.path.exists(subject_profile):
+            tables.append(pd.read_csv(subject_profile, sep='\t', na_values='n/a',
+                                      dtype={'subject': str, 'session': str}))
+    profile = pd.concat([table for table in tables if not table.empty] or tables[:1],
+                        ignore_index=True)
+    for column in ['wall_time_s', 'cpu_time_s', 'peak_rss_mb', 'read_bytes', 'write_bytes']:
+        profile[column] = pd.to_numeric(profile[column])
+
+    # Sums of stages without measurements (e.g. CPU time of nodes without
+    # the resource monitor) stay undefined
+    def total(values):
+        return values.sum(min_count=1)
+
+    summary = profile.groupby('stage', sort=False).agg(
+        n=('stage', 'size'),
+        n_subjects=('subject', 'nunique'),
+        n_failed=('status', lambda status: int((status == 'failed').sum())),
+        n_cached=('status', lambda status: int((status == 'cached').sum())),
+        wall_time_s=('wall_time_s', total),
+        wall_time_s_max=('wall_time_s', 'max'),
+        cpu_time_s=('cpu_time_s', total),
+        peak_rss_mb=('peak_rss_mb', 'max'),
+        read_bytes=('read_bytes', total),
+        write_bytes=('write_bytes', total)
+    ).reset_index().sort_values('wall_time_s', ascending=False)
+
+    out_base = os.path.join(bids_dir, 'sourcedata', 'bidsonym', 'desc-runprofile')
+    os.makedirs(os.path.dirname(out_base), exist_ok=True)
+    summary.to_csv(out_base + '.tsv', sep='\t', index=False, na_rep='n/a')
+    with open(out_base + '.json', 'w') as json_file:
+        json.dump({'subjects': list(subject_labels),
+                   'stages': json.loads(summary.to_json(orient='records'))},
+                  json_file, indent=4)
+
+    return summary
+
+
+# Meta-data fields of json files that may contain identifying information
+GENERAL_PROB_FIELDS = ['AcquisitionTime', 'InstitutionAddress', 'InstitutionName',
+                       'InstitutionalDepartmentName', 'ProcedureStepDescription', 'ProtocolName',
+                       'PulseSequenceDetails', 'SeriesDescription', 'global']
+
+
+@lru_cache(maxsize=None)
+def _field_matcher(fields, ignore_case=False):
+    """
+    Compile a matcher finding meta-data field names that contain any of
+    the given (sub)strings.
+
+    Parameters
+    ----------
+    fields : tuple of str
+        Field names (or parts of them) to look for.
+    ignore_case : bool, optional
+        Whether matching is case-insensitive.
+
+    Returns
+    -------
+    re.Pattern
+        Single regular expression matching all fields at once.
+    """
+
+    # Longer fields first, so that the alternation prefers the most
+    # specific match
+    alternation = '|'.join(re.escape(field) for field in
+                           sorted(set(fields), key=len, reverse=True))
+    return re.compile(alternation, re.IGNORECASE if ignore_case else 0)
+
+
+def read_nifti_header(image_file):
+    """
+    Read the header of a NIfTI-1/2 image without loading the image.
+
+    Only the 348 (NIfTI-1) or 540 (NIfTI-2) header bytes are read, for
+    gzip compressed images only the beginning of the stream is decompressed.
+
+    Parameters
+    ----------
+    image_file : str
+        Path to the (gzip compressed) NIfTI image.
+
+    Returns
+    -------
+    nibabel.Nifti1Header or nibabel.Nifti2Header
+        Header of the image.
+    """
+
+    opener = gzip.open if image_file.endswith('.gz') else open
+    with opener(image_file, 'rb') as image:
+        sizeof_hdr = image.read(4)
+        # The first field states the header size and tells the NIfTI
+        # version, in either byte order
+        for header_class in (nib.Nifti1Header, nib.Nifti2Header):
+            header_size = header_class.template_dtype.itemsize
+            if header_size in (int.from_bytes(sizeof_hdr, 'little'),
+                               int.from_bytes(sizeof_hdr, 'big')):
+                break
+        else:
+            raise Exception(f"{image_file} is not a NIfTI-1/2 image")
+        binaryblock = sizeof_hdr + image.read(header_size - 4)
+
+    if len(binaryblock) < header_size:
+        raise Exception(f"The header of {image_file} is truncated")
+
+    return header_class(binaryblock, check=False)
+
+
+def scan_nifti_headers(image_files, n_threads=None):
+    """
+    Read the headers of many NIfTI images in parallel.
+
+    Parameters
+    ----------
+    image_files : list of str
+        Paths to the (gzip compressed) NIfTI images.
+    n_threads : int, optional
+        Number of threads used to read the headers
+        (default: the ThreadPoolExecutor default).
+
+    Returns
+    -------
+    pandas.DataFrame
+        Table with one row per header field and image, containing the
+        columns 'file', 'header_data_field' and 'data'.
+    """
+
+    # Reading the headers is I/O bound, hence threads suffice
+    with ThreadPoolExecutor(max_workers=n_threads) as executor:
+        headers = list(executor.map(read_nifti_header, image_files))
+
+    files, fields, data = [], [], []
+    for image_file, header in zip(image_files, headers):
+        for key, value in header.items():
+            files.append(image_file)
+            fields.append(key)
+            data.append(value)
+
+    return pd.DataFrame({'file': files, 'header_data_field': fields, 'data': data},
+                        columns=['file', 'header_data_field', 'data'])
+
+
+def _screen_json_files(meta_files, prob_fields=None):
+    """
+    Collect the meta-data of json files in one table and check all
+    fields against problematic fields at once.
+
+    Parameters
+    ----------
+    meta_files : list of str
+        Paths to the json files.
+    prob_fields : list, optional
+        List of meta-data keys ('str') that should be evaluated in
+        addition to the commonly problematic fields.
+
+    Returns
+    -------
+    pandas.DataFrame
+        Table with the columns 'file', 'field', 'value', 'problematic'
+        and 'source'.
+    """
+
+    # json fields are checked for user-specified and commonly problematic
+    # fields (case-sensitive)
+    json_matcher = _field_matcher(tuple(list(prob_fields or []) + GENERAL_PROB_FIELDS))
+
+    # Inform user about which metadata files will be processed
+    print('the following meta-data files will be checked:')
+    print(*meta_files, sep='\n')
+
+    json_rows = []
+    for meta_file in meta_files:
+        with open(meta_file, 'r') as json_file:
+            meta_data = json.load(json_file)
+        json_rows += [(meta_file, key, inf) for key, inf in meta_data.items()]
+    json_table = pd.DataFrame(json_rows, columns=['file', 'field', 'value'])
+
+    json_table['problematic'] = json_table['field'].str.contains(json_matcher)
+    json_table['source'] = 'json'
+
+    return json_table
+
+
+def check_dataset_meta_data(bids_dir, prob_fields=None):
+    """
+    Check the dataset-level json files in the BIDS root directory, e.g.
+    task sidecars inherited by all subjects, for problematic information.
+    This is done once per run, instead of once per subject.
+
+    Parameters
+    ----------
+    bids_dir : str
+        Path to BIDS root directory.
+    prob_fields : list, optional
+        List of meta-data keys ('str') that should be evaluated.
+    """
+
+    # Find JSON metadata files at the task level (root of BIDS directory)
+    list_task_meta_files = glob(os.path.join(bids_dir, '*json'))
+
+    json_table = _screen_json_files(list_task_meta_files, prob_fields)
+
+    # Dataset-level json files are not assigned to a subject
+    json_table['subject'] = None
+    write_meta_data(bids_dir, json_table, list_task_meta_files)
+
+
+def check_meta_data(bids_dir, subject_label, prob_fields=None, n_threads=None):
     """
     Extract meta-data from image headers and json files and
     subsequently evaluate values based on default keys or
-    user specified keys. Outputs are csv files containing
-    DataFrames with keys, values and markers concerning values.
+    user specified keys. Keys, values and markers concerning values
+    are saved to the dataset's meta-data store (see query_meta_data).
+
+    Only the files of the subject are checked, dataset-level json files
+    are checked once per run via check_dataset_meta_data. The fields of
+    all headers and all json files of the subject are collected in one
+    table each and screened at once.
 
     Parameters
     ----------
@@ -115,196 +651,356 @@ def check_meta_data(bids_dir, subject_label, prob_fields=None):
         Label of subject to be checked (without 'sub-').
     prob_fields : list, optional
         List of meta-data keys ('str') that should be evaluated.
+    n_threads : int, optional
+        Number of threads used to read the image headers.
     """
 
     # Find all NIfTI image files for the specified subject
     list_subject_image_files = glob(os.path.join(bids_dir, 'sub-' + subject_label, '**/*.nii.gz'), recursive=True)
-    
-    # Find JSON metadata files at the task level (root of BIDS directory)
-    list_task_meta_files = glob(os.path.join(bids_dir, '*json'))
-    
+
     # Find JSON metadata files specific to the subject
     list_sub_meta_files = glob(os.path.join(bids_dir, 'sub-' + subject_label, '**/*.json'), recursive=True)
-    
-    # Combine both types of JSON files for comprehensive metadata checking
-    list_meta_files = list_task_meta_files + list_sub_meta_files
 
-    # Process each image file's header metadata
-    for subject_image_file in list_subject_image_files:
+    # Header fields are checked for user-specified problematic fields and
+    # the 'descrip' field (case-insensitive)
+    header_matcher = _field_matcher(tuple(list(prob_fields or []) + ['descrip']), ignore_case=True)
 
-        # Load the NIfTI file and extract header information
-        header = nib.load(subject_image_file).header
-        keys = []
-        dat = []
+    # Collect the header information of all images in one table, reading
+    # only the headers of the images
+    header_table = scan_nifti_headers(list_subject_image_files, n_threads).rename(
+        columns={'header_data_field': 'field', 'data': 'value'})
 
-        # Extract all key-value pairs from the header
-        for key, data in zip(header.keys(), header.values()):
-            keys.append(key)
-            dat.append(data)
-        
-        # Create a DataFrame with header information and default 'no' for problematic flag
-        header_df = pd.DataFrame({'header_data_field': keys, 'data': dat, 'problematic': 'no'})
+    # Check all header fields against problematic fields at once
+    header_table['problematic'] = header_table['field'].str.contains(header_matcher)
+    header_table['source'] = 'header'
 
-        # Set up problematic fields list - always include 'descrip' field
-        if prob_fields:
-            # Add user-specified problematic fields to the default 'descrip' field
-            prob_fields = prob_fields + ['descrip']
-        else:
-            # Use only the default 'descrip' field if no user fields specified
-            prob_fields = ['descrip']
-
-        # Check each header field against problematic fields list
-        for index, row in header_df.iterrows():
-            # Case-insensitive check if any problematic field name appears in header field name
-            if any(i.lower() in row['header_data_field'] for i in prob_fields):
-                row['problematic'] = 'maybe'
-            else:
-                row['problematic'] = 'no'
+    # Collect and check the meta-data of all json files in one table
+    json_table = _screen_json_files(list_sub_meta_files, prob_fields)
 
-        # Save header analysis to CSV file in sourcedata directory
-        # Extract filename without path and extension for output naming
-        header_df.to_csv(os.path.join(bids_dir, 'sourcedata/bidsonym',
-                                      'sub-%s' % subject_label,
-                                      subject_image_file[subject_image_file.rfind('/') +
-                                                         1:subject_image_file.rfind('.nii.gz')] +
-                                      '_desc-headerinfo.csv'),
-                         index=False)
+    # Save the meta-data of all files to the dataset's meta-data store
+    meta_data_table = pd.concat([header_table, json_table], ignore_index=True)
+    meta_data_table['subject'] = subject_label
+    write_meta_data(bids_dir, meta_data_table,
+                    list_subject_image_files + list_sub_meta_files)
 
-    # Inform user about which metadata files will be processed
-    print('the following meta-data files will be checked:')
-    print(*list_meta_files, sep='\n')
 
-    # Process each JSON metadata file
-    for meta_file in list_meta_files:
+def meta_data_store(bids_dir):
+    """
+    Get the path of the dataset's meta-data store.
 
-        # Load and parse JSON metadata
-        with open(meta_file, 'r') as json_file:
-            meta_data = json.load(json_file)
-            keys = []
-            info = []
-            
-            # Extract all key-value pairs from JSON metadata
-            for key, inf in zip(meta_data.keys(), meta_data.values()):
-                keys.append(key)
-                info.append(inf)
-            
-            # Create DataFrame with JSON metadata and default 'no' for problematic flag
-            json_df = pd.DataFrame({'meta_data_field': keys, 'information': info, 'problematic': 'no'})
+    Parameters
+    ----------
+    bids_dir : str
+        Path to BIDS root directory.
 
-        # Define default list of potentially problematic fields that may contain identifying information
-        list_general_prob_fields = ['AcquisitionTime', 'InstitutionAddress', 'InstitutionName',
-                                    'InstitutionalDepartmentName', 'ProcedureStepDescription', 'ProtocolName',
-                                    'PulseSequenceDetails', 'SeriesDescription', 'global']
+    Returns
+    -------
+    str
+        Path to the SQLite database holding the meta-data of all checked files.
+    """
 
-        # Combine user-specified and default problematic fields
-        if prob_fields:
-            prob_fields = prob_fields + list_general_prob_fields
-        else:
-            prob_fields = list_general_prob_fields
+    return os.path.join(bids_dir, 'sourcedata', 'bidsonym', 'desc-metadata.sqlite')
 
-        # Check each JSON field against problematic fields list
-        for index, row in json_df.iterrows():
-            # Exact match check (case-sensitive) for JSON field names
-            if any(i in row['meta_data_field'] for i in prob_fields):
-                row['problematic'] = 'maybe'
-            else:
-                row['problematic'] = 'no'
 
-        # Save JSON metadata analysis to CSV file
-        # Extract filename without path and extension for output naming
-        json_df.to_csv(os.path.join(bids_dir, 'sourcedata/bidsonym', 'sub-%s' % subject_label,
-                                    meta_file[meta_file.rfind('/') +
-                                              1:meta_file.rfind('.json')] +
-                                    '_desc-jsoninfo.csv'),
-                       index=False)
+def _connect_meta_data_store(bids_dir):
+    """
+    Open (and if needed create) the dataset's meta-data store.
 
+    Parameters
+    ----------
+    bids_dir : str
+        Path to BIDS root directory.
 
-def del_meta_data(bids_dir, subject_label, fields_del):
+    Returns
+    -------
+    sqlite3.Connection
+        Connection to the meta-data store.
+    """
+
+    store = meta_data_store(bids_dir)
+    os.makedirs(os.path.dirname(store), exist_ok=True)
+
+    # Subjects processed in parallel write to the same store, hence wait
+    # for locks instead of failing right away
+    connection = sqlite3.connect(store, timeout=120)
+    connection.executescript("""
+        CREATE TABLE IF NOT EXISTS meta_data (
+            subject TEXT,
+            session TEXT,
+            file TEXT NOT NULL,
+            source TEXT NOT NULL,
+            field TEXT NOT NULL,
+            value TEXT,
+            problematic INTEGER NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS meta_data_file ON meta_data (file);
+        CREATE INDEX IF NOT EXISTS meta_data_subject ON meta_data (subject, session);
+        CREATE INDEX IF NOT EXISTS meta_data_field ON meta_data (field, problematic);
+    """)
+    return connection
+
+
+def _meta_data_value(value):
+    """
+    Convert a header or json value to a string for the meta-data store.
+
+    Parameters
+    ----------
+    value : object
+        Header field (numpy) or json value.
+
+    Returns
+    -------
+    str
+        String representation of the value.
     """
-    Delete values from specified keys in meta-data json files.
+
+    # numpy scalars and arrays
+    if hasattr(value, 'tolist'):
+        value = value.tolist()
+    if isinstance(value, bytes):
+        value = value.decode('latin-1')
+    return value if isinstance(value, str) else json.dumps(value)
+
+
+def write_meta_data(bids_dir, meta_data_table, files, batch_size=10000):
+    """
+    Write checked meta-data to the dataset's meta-data store. Previously
+    stored entries of the given files are replaced.
+
+    Parameters
+    ----------
+    bids_dir : str
+        Path to BIDS root directory.
+    meta_data_table : pandas.DataFrame
+        Table with the columns 'subject', 'file', 'source', 'field',
+        'value' and 'problematic'.
+    files : list of str
+        Files the table covers.
+    batch_size : int, optional
+        Number of rows inserted at once.
+    """
+
+    def relative(path):
+        return os.path.relpath(path, bids_dir)
+
+    def session(path):
+        match = re.search(r'_ses-([a-zA-Z0-9]+)_', os.path.basename(path))
+        return match.group(1) if match else None
+
+    rows = zip(meta_data_table['subject'],
+               map(session, meta_data_table['file']),
+               map(relative, meta_data_table['file']),
+               meta_data_table['source'],
+               meta_data_table['field'],
+               map(_meta_data_value, meta_data_table['value']),
+               meta_data_table['problematic'].astype(int).tolist())
+
+    connection = _connect_meta_data_store(bids_dir)
+    try:
+        # Replace the entries of all files in one transaction, so that
+        # an interrupted check leaves the store unchanged
+        with connection:
+            connection.executemany('DELETE FROM meta_data WHERE file = ?',
+                                   [(relative(path),) for path in files])
+            while True:
+                batch = list(islice(rows, batch_size))
+                if not batch:
+                    break
+                connection.executemany('INSERT INTO meta_data VALUES (?, ?, ?, ?, ?, ?, ?)',
+                                       batch)
+    finally:
+        connection.close()
+
+
+def query_meta_data(bids_dir, field=None, subject_label=None, session=None,
+                    source=None, problematic=None):
+    """
+    Query the dataset's meta-data store, e.g. for all files in which a
+    given field was flagged as problematic.
+
+    Parameters
+    ----------
+    bids_dir : str
+        Path to BIDS root directory.
+    field : str, optional
+        Meta-data field (key) to select.
+    subject_label : str, optional
+        Label of subject to select (without 'sub-').
+    session : str, optional
+        Session to select (without 'ses-').
+    source : str, optional
+        'header' or 'json' to select image header or json meta-data.
+    problematic : bool, optional
+        Select only flagged (True) or non-flagged (False) fields.
+
+    Returns
+    -------
+    pandas.DataFrame
+        Table with the columns 'subject', 'session', 'file' (relative
+        to the BIDS root directory), 'source', 'field', 'value' and
+        'problematic'.
+    """
+
+    conditions, parameters = [], []
+    for column, value in (('field', field), ('subject', subject_label),
+                          ('session', session), ('source', source)):
+        if value is not None:
+            conditions.append(f'{column} = ?')
+            parameters.append(value)
+    if problematic is not None:
+        conditions.append('problematic = ?')
+        parameters.append(int(problematic))
+
+    query = 'SELECT * FROM meta_data'
+    if conditions:
+        query += ' WHERE ' + ' AND '.join(conditions)
+
+    connection = _connect_meta_data_store(bids_dir)
+    try:
+        meta_data = pd.read_sql_query(query, connection, params=parameters)
+    finally:
+        connection.close()
+    meta_data['problematic'] = meta_data['problematic'].astype(bool)
+
+    return meta_data
+
+
+def delete_meta_data(bids_dir, subject_label, session=None):
+    """
+    Remove the entries of a subject (session) from the dataset's
+    meta-data store.
 
     Parameters
     ----------
     bids_dir : str
         Path to BIDS root directory.
     subject_label : str
-        Label of subject to operate on (without 'sub-').
+        Label of subject (without 'sub-').
+    session : str, optional
+        Session (without 'ses-'), if only its entries should be removed.
+    """
+
+    if not os.path.exists(meta_data_store(bids_dir)):
+        return
+
+    connection = _connect_meta_data_store(bids_dir)
+    try:
+        with connection:
+            if session is None:
+                connection.execute('DELETE FROM meta_data WHERE subject = ?',
+                                   (subject_label,))
+            else:
+                connection.execute('DELETE FROM meta_data WHERE subject = ? AND session = ?',
+                                   (subject_label, session))
+    finally:
+        connection.close()
+
+
+def _scrub_meta_data(meta_file, backup_dir, fields_del):
+    """
+    Move a json file to its backup location and write a version without
+    the values of the specified keys to the original location.
+
+    Parameters
+    ----------
+    meta_file : str
+        Path to the json file.
+    backup_dir : str
+        Directory the original json file is moved to.
     fields_del : list
         List of meta-data keys ('str') which value should be removed.
     """
 
-    # Define paths for storing backed-up metadata files
-    path_task_meta = os.path.join(bids_dir, "sourcedata/bidsonym/")
-    path_sub_meta = os.path.join(bids_dir, "sourcedata/bidsonym/sub-%s" % subject_label)
-    
-    # Find all JSON metadata files at task level and subject level
+    # Move original file to backup location, unless a previous
+    # (interrupted) run already did, so that the original is never
+    # replaced by a de-identified version
+    meta_file_deid = os.path.join(backup_dir, os.path.basename(meta_file))
+    if not os.path.exists(meta_file_deid):
+        os.makedirs(backup_dir, exist_ok=True)
+        move(meta_file, meta_file_deid)
+
+    # Load the backed-up JSON file for processing
+    with open(meta_file_deid, 'r') as json_file:
+        meta_data = json.load(json_file)
+
+    # Process each field marked for deletion
+    for field in fields_del:
+        if field in meta_data:
+            # Replace the field value with a deletion marker instead of removing the key
+            # This maintains the JSON structure while indicating the field was anonymized
+            meta_data[field] = 'deleted_by_bidsonym'
+        else:
+            # Inform user if a specified field doesn't exist in this file
+            print("The field you indicated to delete does not exist in %s" % meta_file_deid)
+
+    # Write the de-identified metadata back to the original file location
+    # This replaces the original file with the anonymized version
+    with open(meta_file, 'w') as json_output_file:
+        print('writing %s' % meta_file)
+        # Use indent=4 for human-readable formatting
+        json.dump(meta_data, json_output_file, indent=4)
+
+
+def del_dataset_meta_data(bids_dir, fields_del):
+    """
+    Delete values from specified keys in the dataset-level json files in
+    the BIDS root directory. This is done once per run, the original
+    files are moved to sourcedata/bidsonym.
+
+    Parameters
+    ----------
+    bids_dir : str
+        Path to BIDS root directory.
+    fields_del : list
+        List of meta-data keys ('str') which value should be removed.
+    """
+
+    # Find JSON metadata files at the task level (root of BIDS directory)
     list_task_meta_files = glob(os.path.join(bids_dir, '*json'))
-    list_sub_meta_files = glob(os.path.join(bids_dir, 'sub-' + subject_label, '**/*.json'), recursive=True)
 
-    # Combine both lists for comprehensive processing
-    list_meta_files = list_task_meta_files + list_sub_meta_files
+    # Print progress information for user
+    print('working on the dataset-level meta-data files:')
+    print(*list_task_meta_files, sep='\n')
+    print('the following fields will be deleted:')
+    print(*fields_del, sep='\n')
 
-    # Move original task-level JSON files to backup location in sourcedata
-    # This preserves the original metadata before de-identification
     for task_meta_data_file in list_task_meta_files:
-        # Extract just the filename from the full path
-        task_out = task_meta_data_file[task_meta_data_file.rfind('/') + 1:]
-        # Move original file to backup location
-        move(task_meta_data_file, os.path.join(path_task_meta, task_out))
-    
-    # Move original subject-level JSON files to backup location in sourcedata
-    for sub_meta_data_file in list_sub_meta_files:
-        # Extract just the filename from the full path
-        sub_out = sub_meta_data_file[sub_meta_data_file.rfind('/') + 1:]
-        # Move original file to backup location
-        move(sub_meta_data_file, os.path.join(path_sub_meta, sub_out))
-
-    # Find the backed-up JSON files in their new locations for processing
-    list_task_meta_files_deid = glob(os.path.join(bids_dir, "sourcedata/bidsonym/", '*json'))
-    list_sub_meta_files_deid = glob(os.path.join(bids_dir, "sourcedata/bidsonym/",
-                                                 'sub-' + subject_label, '**/*.json'),
-                                    recursive=True)
-    
-    # Combine backed-up files for de-identification processing
-    list_meta_files_deid = list_task_meta_files_deid + list_sub_meta_files_deid
+        _scrub_meta_data(task_meta_data_file,
+                         os.path.join(bids_dir, "sourcedata/bidsonym/"), fields_del)
+
+
+def del_meta_data(bids_dir, subject_label, fields_del):
+    """
+    Delete values from specified keys in the subject's meta-data json files.
+    Dataset-level json files are handled once per run via del_dataset_meta_data.
+
+    Parameters
+    ----------
+    bids_dir : str
+        Path to BIDS root directory.
+    subject_label : str
+        Label of subject to operate on (without 'sub-').
+    fields_del : list
+        List of meta-data keys ('str') which value should be removed.
+    """
+
+    # Define path for storing backed-up metadata files
+    path_sub_meta = os.path.join(bids_dir, "sourcedata/bidsonym/sub-%s" % subject_label)
 
-    # Store the fields to delete (redundant assignment, but kept for clarity)
-    fields_del = fields_del
+    # Find all JSON metadata files of the subject
+    list_sub_meta_files = glob(os.path.join(bids_dir, 'sub-' + subject_label, '**/*.json'), recursive=True)
 
     # Print progress information for user
     print('working on %s' % subject_label)
     print('found the following meta-data files:')
-    print(*list_meta_files, sep='\n')
+    print(*list_sub_meta_files, sep='\n')
     print('the following fields will be deleted:')
     print(*fields_del, sep='\n')
 
-    # Sort both lists to ensure consistent pairing of original and backup files
-    list_meta_files.sort()
-    list_meta_files_deid.sort()
-
-    # Process each pair of backed-up and original files
-    for meta_file_deid, meta_file in zip(list_meta_files_deid, list_meta_files):
-        # Load the backed-up JSON file for processing
-        with open(meta_file_deid, 'r') as json_file:
-            meta_data = json.load(json_file)
-            
-            # Process each field marked for deletion
-            for field in fields_del:
-                if field in meta_data:
-                    # Replace the field value with a deletion marker instead of removing the key
-                    # This maintains the JSON structure while indicating the field was anonymized
-                    meta_data[field] = 'deleted_by_bidsonym'
-                else:
-                    # Inform user if a specified field doesn't exist in this file
-                    print("The field you indicated to delete does not exist in %s" % meta_file_deid)
-                    continue
-        
-        # Write the de-identified metadata back to the original file location
-        # This replaces the original file with the anonymized version
-        with open(meta_file, 'w') as json_output_file:
-            print('writing %s' % meta_file)
-            # Use indent=4 for human-readable formatting
-            json.dump(meta_data, json_output_file, indent=4)
+    # Back up and de-identify each file of the subject
+    for sub_meta_data_file in list_sub_meta_files:
+        _scrub_meta_data(sub_meta_data_file, path_sub_meta, fields_del)
 
 
 def rename_non_deid(bids_dir, subject_label):
@@ -351,67 +1047,255 @@ def rename_non_deid(bids_dir, subject_label):
         os.rename(image_file, os.path.join(bids_dir, 'sourcedata/bidsonym/sub-' + subject_label, image_deid))
 
 
-def brain_extraction_nb(image, subject_label, bids_dir):
+# Pre-trained nobrainer U-Net model used for brain extraction, can be set
+# via the BIDSONYM_NOBRAINER_MODEL environment variable
+NOBRAINER_MODEL = os.environ.get('BIDSONYM_NOBRAINER_MODEL',
+                                 '/opt/nobrainer/models/brain-extraction-unet-128iso-model.h5')
+
+# nobrainer models loaded in this process, see load_nobrainer_model
+_nobrainer_models = {}
+
+
+def configure_tf_threads(n_threads):
+    """
+    Limit the number of threads used by TensorFlow.
+
+    Parameters
+    ----------
+    n_threads : int or None
+        Number of threads TensorFlow uses within operations. Only has an
+        effect if TensorFlow was not initialized by this process yet.
+    """
+
+    import tensorflow as tf
+
+    if n_threads:
+        try:
+            tf.config.threading.set_intra_op_parallelism_threads(int(n_threads))
+            tf.config.threading.set_inter_op_parallelism_threads(1)
+        except RuntimeError:
+            # Threads can only be set before TensorFlow is initialized
+            pass
+
+
+def load_nobrainer_model(model_path=NOBRAINER_MODEL, n_threads=None):
+    """
+    Load a nobrainer model, reusing it if it was already loaded by this
+    process.
+
+    Parameters
+    ----------
+    model_path : str, optional
+        Path to the nobrainer model.
+    n_threads : int, optional
+        Number of threads TensorFlow uses within operations. Only has an
+        effect if TensorFlow was not initialized by this process yet.
+
+    Returns
+    -------
+    model : tf.keras.Model
+        Loaded nobrainer model.
+    """
+
+    if model_path not in _nobrainer_models:
+        import tensorflow as tf
+
+        configure_tf_threads(n_threads)
+        _nobrainer_models[model_path] = tf.keras.models.load_model(model_path, compile=False)
+
+    return _nobrainer_models[model_path]
+
+
+def nobrainer_predict(images, outfiles, model_path=NOBRAINER_MODEL,
+                      n_threads=None, batch_size=4):
     """
-    Setup nobrainer brainextraction command.
+    Run nobrainer brain extraction on a batch of images in-process.
+
+    The model is loaded only once per process and reused for all images,
+    instead of starting a 'nobrainer predict' subprocess (and loading
+    TensorFlow and the model weights) for every image. Processing follows
+    'nobrainer predict': the image is resized to 256^3 voxels,
+    standardized and split into 128^3 blocks, and the predicted brain
+    probability is thresholded at 0.3 and resized back to the image grid.
+
+    Parameters
+    ----------
+    images : list of str
+        Paths to images that should be brain extracted.
+    outfiles : list of str
+        Names of the brain masks, one per image.
+    model_path : str, optional
+        Path to the nobrainer model.
+    n_threads : int, optional
+        Number of threads TensorFlow uses within operations.
+    batch_size : int, optional
+        Number of blocks predicted at once.
+
+    Returns
+    -------
+    outfiles : list of str or None
+        Names of the brain masks, None for images that failed. Errors are
+        reported, but do not stop the remaining images of the batch.
+    """
+
+    # Imports are done here as this function is run as a Nipype Function node
+    import time
+    import traceback
+    import numpy as np
+    import nibabel as nib
+    from skimage.transform import resize
+    from nobrainer.volume import (standardize_numpy, to_blocks_numpy,
+                                  from_blocks_numpy)
+    from bidsonym.utils import load_nobrainer_model
+
+    model = load_nobrainer_model(model_path, n_threads)
+
+    features_shape = (256, 256, 256)
+    block_shape = (128, 128, 128)
+
+    results = []
+    for image, outfile in zip(images, outfiles):
+        start = time.time()
+        try:
+            img = nib.load(image)
+            data = img.get_fdata(dtype=np.float32)
+
+            features = resize(data, features_shape, order=1,
+                              preserve_range=True, anti_aliasing=False)
+            features = standardize_numpy(features)
+            blocks = to_blocks_numpy(features, block_shape)
+
+            predictions = model.predict(blocks[..., np.newaxis],
+                                        batch_size=batch_size, verbose=0)
+            probability = from_blocks_numpy(predictions[..., 0], features_shape)
+
+            mask = resize((probability > 0.3).astype(np.float32), data.shape[:3],
+                          order=0, preserve_range=True, anti_aliasing=False)
+
+            nib.Nifti1Image(mask.astype(np.int32), img.affine,
+                            img.header).to_filename(outfile)
+            results.append(outfile)
+            print(f"nobrainer: {image} done in {time.time() - start:.1f}s")
+        except Exception:
+            print(f"nobrainer: brain extraction of {image} failed")
+            traceback.print_exc()
+            results.append(None)
+
+    return results
+
+
+def _brainmask_outfile(image, subject_label, bids_dir):
+    """
+    Construct the name of the brain mask of a non-de-identified image.
 
     Parameters
     ----------
     image : str
-        Path to image that should be defaced.
-    outfile : str
-        Name of the defaced file.
+        Path to image.
+    subject_label : str
+        Label of subject (without 'sub-').
     bids_dir : str
         Path to BIDS root directory.
-    """
 
-    import os
-    from subprocess import check_call
+    Returns
+    -------
+    str
+        Path to the brain mask in sourcedata/bidsonym.
+    """
 
-    # Construct the output path for the brain mask
     # The mask will be saved in the subject's backup directory with descriptive naming
     # Extract the base filename and add brain mask identifier and non-deid descriptor
-    outfile = os.path.join(bids_dir, "sourcedata/bidsonym/sub-%s" % subject_label,
-                           image[image.rfind('/') + 1:image.rfind('.nii')] + '_brainmask_desc-nondeid.nii.gz')
-
-    # Construct the nobrainer command for brain extraction
-    # nobrainer is a deep learning-based neuroimaging tool for brain extraction
-    cmd = ['nobrainer',                    # Base command
-           'predict',                      # Use prediction mode
-           '--model=/opt/nobrainer/models/brain-extraction-unet-128iso-model.h5',  # Pre-trained U-Net model for brain extraction
-           '--verbose',                    # Enable verbose output for debugging/monitoring
-           image,                          # Input image file path
-           outfile,                        # Output brain mask file path
-           ]
-    
-    # Execute the nobrainer brain extraction command
-    # check_call will raise an exception if the command fails (non-zero exit code)
-    # This ensures the function fails fast if brain extraction doesn't work
-    check_call(cmd)
+    return os.path.join(bids_dir, "sourcedata/bidsonym/sub-%s" % subject_label,
+                        image[image.rfind('/') + 1:image.rfind('.nii')] + '_brainmask_desc-nondeid.nii.gz')
 
 
-def run_brain_extraction_nb(image, subject_label, bids_dir):
+def brain_extraction_nb(image, subject_label, bids_dir, n_threads=None):
     """
-    Setup and run nobrainer brainextraction workflow.
+    Run nobrainer brainextraction in-process.
 
     Parameters
     ----------
     image : str
-        Path to image that should be defaced.
+        Path to image that should be brain extracted.
+    subject_label : str
+        Label of subject to operate on (without 'sub-').
+    bids_dir : str
+        Path to BIDS root directory.
+    n_threads : int, optional
+        Number of threads TensorFlow uses within operations.
+
+    Returns
+    -------
     outfile : str
-        Name of the defaced file.
+        Path to the brain mask.
+    """
+
+    # Imports are done here as this function is run as a Nipype Function node
+    from bidsonym.utils import _brainmask_outfile, nobrainer_predict
+
+    outfile = _brainmask_outfile(image, subject_label, bids_dir)
+
+    # The model is kept in memory, so further images processed by the
+    # same process skip loading TensorFlow and the model weights
+    if nobrainer_predict([image], [outfile], n_threads=n_threads)[0] is None:
+        raise RuntimeError(f"nobrainer brain extraction of {image} failed.")
+
+    return outfile
+
+
+def init_brain_extraction_nb_wf(image, subject_label, bids_dir, batched=False,
+                                name='brainextraction_wf'):
+    """
+    Setup nobrainer brainextraction workflow.
+
+    Parameters
+    ----------
+    image : str
+        Path to image that should be brain extracted.
+    subject_label : str
+        Label of subject to operate on (without 'sub-').
     bids_dir : str
         Path to BIDS root directory.
+    batched : bool, optional
+        If True, the workflow does not run nobrainer itself. Instead,
+        'inputnode.mask_file' has to be connected to the output of a
+        nobrainer_predict node processing 'inputnode.in_file' as part of
+        a batch of images, written to 'inputnode.out_file'.
+    name : str, optional
+        Name of the workflow.
+
+    Returns
+    -------
+    brainextraction_wf : nipype.pipeline.engine.Workflow
+        Workflow providing the brain mask as 'outputnode.out_file'.
     """
 
+    import nipype.pipeline.engine as pe
+    from nipype import Function
+    from nipype.interfaces import utility as niu
+
     # Create a Nipype workflow for brain extraction
-    brainextraction_wf = pe.Workflow('brainextraction_wf')
+    brainextraction_wf = pe.Workflow(name)
     
     # Create an input node to handle input data
     # IdentityInterface passes data through without modification
-    inputnode = pe.Node(niu.IdentityInterface(['in_file']),
+    inputnode = pe.Node(niu.IdentityInterface(['in_file', 'out_file', 'mask_file']),
                         name='inputnode')
     
+    # Create an output node exposing the brain mask
+    outputnode = pe.Node(niu.IdentityInterface(['out_file']),
+                         name='outputnode')
+
+    # Set the input data - the path to the image file to be processed
+    # and the path of the brain mask
+    inputnode.inputs.in_file = image
+    inputnode.inputs.out_file = _brainmask_outfile(image, subject_label, bids_dir)
+
+    if batched:
+        # The brain mask is provided by a batch of images processed at once
+        brainextraction_wf.connect([(inputnode, outputnode, [('mask_file', 'out_file')])])
+        return brainextraction_wf
+    
     # Create a processing node that wraps the brain_extraction_nb function
     brainextraction = pe.Node(Function(input_names=['image', 'subject_label', 'bids_dir'],
                                        output_names=['outfile'],
@@ -419,10 +1303,8 @@ def run_brain_extraction_nb(image, subject_label, bids_dir):
                               name='brainextraction')
     
     # Connect the input node to the brain extraction node
-    brainextraction_wf.connect([(inputnode, brainextraction, [('in_file', 'image')])])
-    
-    # Set the input data - the path to the image file to be processed
-    inputnode.inputs.in_file = image
+    brainextraction_wf.connect([(inputnode, brainextraction, [('in_file', 'image')]),
+                                (brainextraction, outputnode, [('outfile', 'out_file')])])
     
     # Set the subject label for the brain extraction node
     # This is used to construct proper output paths and filenames
@@ -432,14 +1314,38 @@ def run_brain_extraction_nb(image, subject_label, bids_dir):
     # This defines where output files should be stored
     brainextraction.inputs.bids_dir = bids_dir
     
+    return brainextraction_wf
+
+
+def run_brain_extraction_nb(image, subject_label, bids_dir, base_dir=None):
+    """
+    Setup and run nobrainer brainextraction workflow.
+
+    Parameters
+    ----------
+    image : str
+        Path to image that should be brain extracted.
+    subject_label : str
+        Label of subject to operate on (without 'sub-').
+    bids_dir : str
+        Path to BIDS root directory.
+    base_dir : str, optional
+        Directory in which the workflow is executed and its results are
+        cached, so that reruns with unchanged inputs are skipped.
+    """
+
+    brainextraction_wf = init_brain_extraction_nb_wf(image, subject_label, bids_dir)
+    brainextraction_wf.base_dir = base_dir
+
     # Execute the workflow
     # This runs the entire pipeline: input -> brain extraction -> output
     brainextraction_wf.run()
 
 
-def run_brain_extraction_bet(image, frac, subject_label, bids_dir):
+def init_brain_extraction_bet_wf(image, frac, subject_label, bids_dir,
+                                 name='brainextraction_wf'):
     """
-    Setup and FSLs brainextraction (BET) workflow.
+    Setup FSLs brainextraction (BET) workflow.
 
     Parameters
     ----------
@@ -447,12 +1353,23 @@ def run_brain_extraction_bet(image, frac, subject_label, bids_dir):
         Path to image that should be defaced.
     frac : float
         Fractional intensity threshold (0 - 1).
-    outfile : str
-        Name of the defaced file.
+    subject_label : str
+        Label of subject to operate on (without 'sub-').
     bids_dir : str
         Path to BIDS root directory.
+    name : str, optional
+        Name of the workflow.
+
+    Returns
+    -------
+    brainextraction_wf : nipype.pipeline.engine.Workflow
+        Workflow providing the brain extracted image as 'outputnode.out_file'.
     """
 
+    import nipype.pipeline.engine as pe
+    from nipype.interfaces import utility as niu
+    from nipype.interfaces.fsl import BET
+
     import os
 
     # Construct the output path for the brain-extracted image
@@ -463,7 +1380,7 @@ def run_brain_extraction_bet(image, frac, subject_label, bids_dir):
 
     # Create a Nipype workflow for FSL BET brain extraction
     # BET (Brain Extraction Tool) is FSL's classic brain extraction algorithm
-    brainextraction_wf = pe.Workflow('brainextraction_wf')
+    brainextraction_wf = pe.Workflow(name)
     
     # Create an input node to handle input data
     # IdentityInterface passes data through without modification
@@ -476,10 +1393,15 @@ def run_brain_extraction_bet(image, frac, subject_label, bids_dir):
     # BET uses intensity-based thresholding and morphological operations for brain extraction
     bet = pe.Node(BET(mask=False), name='bet')
     
+    # Create an output node exposing the brain extracted image
+    outputnode = pe.Node(niu.IdentityInterface(['out_file']),
+                         name='outputnode')
+    
     # Connect the input node to the BET node
-    # This creates a data flow: inputnode.in_file -> bet.in_file
+    # This creates a data flow: inputnode.in_file -> bet.in_file -> outputnode
     brainextraction_wf.connect([
-        (inputnode, bet, [('in_file', 'in_file')])
+        (inputnode, bet, [('in_file', 'in_file')]),
+        (bet, outputnode, [('out_file', 'out_file')])
     ])
     
     # Set the input data - the path to the image file to be processed
@@ -493,11 +1415,140 @@ def run_brain_extraction_bet(image, frac, subject_label, bids_dir):
     # Set the output file path for the brain-extracted image
     bet.inputs.out_file = outfile
     
+    return brainextraction_wf
+
+
+def run_brain_extraction_bet(image, frac, subject_label, bids_dir, base_dir=None):
+    """
+    Setup and run FSLs brainextraction (BET) workflow.
+
+    Parameters
+    ----------
+    image : str
+        Path to image that should be defaced.
+    frac : float
+        Fractional intensity threshold (0 - 1).
+    subject_label : str
+        Label of subject to operate on (without 'sub-').
+    bids_dir : str
+        Path to BIDS root directory.
+    base_dir : str, optional
+        Directory in which the workflow is executed and its results are
+        cached, so that reruns with unchanged inputs are skipped.
+    """
+
+    brainextraction_wf = init_brain_extraction_bet_wf(image, frac, subject_label, bids_dir)
+    brainextraction_wf.base_dir = base_dir
+
     # Execute the workflow
     # This runs the entire pipeline: input -> BET brain extraction -> output
     brainextraction_wf.run()
 
 
+def _bids_file_signature(bids_dir):
+    """
+    Compute a signature of the files that make up a BIDS dataset.
+
+    Only the relative paths of the files outside of sourcedata/derivatives
+    (which pybids ignores by default) are considered. Defacing rewrites
+    images in place, so it does not change the signature, while adding,
+    removing or renaming files does.
+
+    Parameters
+    ----------
+    bids_dir : str or Path
+        Path to BIDS root directory.
+
+    Returns
+    -------
+    str
+        Hex digest of the sorted relative file paths.
+    """
+
+    import hashlib
+
+    # Paths given as str and Path (e.g. via argparse) need to give the same
+    # signature, the root is compared to the directories os.walk returns
+    bids_dir = os.path.abspath(os.fspath(bids_dir))
+    ignore = {'sourcedata', 'derivatives', 'code', 'stimuli'}
+    paths = []
+    for root, dirs, files in os.walk(bids_dir):
+        if root == bids_dir:
+            dirs[:] = [d for d in dirs if d not in ignore]
+        # Hidden directories (e.g. .git, .datalad) are ignored by pybids
+        dirs[:] = [d for d in dirs if not d.startswith('.')]
+        paths += [os.path.relpath(os.path.join(root, f), bids_dir) for f in files]
+
+    return hashlib.sha1('\n'.join(sorted(paths)).encode()).hexdigest()
+
+
+def get_bids_layout(bids_dir, database_path=None, log_print=print):
+    """
+    Build the BIDS layout of a dataset, optionally backed by an on-disk
+    SQLite index that is reused across runs and processes.
+
+    If database_path is provided and holds an index of the dataset whose
+    file signature still matches the files on disk, the index is loaded
+    instead of re-indexing the dataset. Otherwise the dataset is indexed
+    and the index is saved to database_path.
+
+    The meta-data of the json sidecars is not indexed, as only the entities
+    of the files are queried. Hence, sidecars edited via --del_meta do not
+    make the index stale.
+
+    Parameters
+    ----------
+    bids_dir : str or Path
+        Path to BIDS root directory.
+    database_path : str or Path, optional
+        Directory in which the SQLite index is stored.
+    log_print : function, optional
+        Logging function to use for output.
+
+    Returns
+    -------
+    layout : BIDSLayout
+        BIDS layout object.
+    """
+
+    from bids import BIDSLayout
+    from bids.layout import BIDSLayoutIndexer
+
+    bids_dir = os.path.abspath(os.fspath(bids_dir))
+    indexer = BIDSLayoutIndexer(index_metadata=False)
+    if database_path is None:
+        return BIDSLayout(bids_dir, indexer=indexer)
+
+    database_path = os.path.abspath(os.fspath(database_path))
+    signature_file = os.path.join(database_path, 'bidsonym_signature.txt')
+    signature = _bids_file_signature(bids_dir)
+
+    # The index is only reused if the files of the dataset did not change
+    # since it has been written
+    reset_database = True
+    if os.path.exists(signature_file):
+        with open(signature_file) as f:
+            reset_database = f.read().strip() != signature
+
+    if reset_database:
+        log_print(f"Indexing BIDS dataset, saving index to {database_path}")
+    else:
+        log_print(f"Loading BIDS index from {database_path}")
+
+    layout = BIDSLayout(bids_dir, database_path=database_path,
+                        reset_database=reset_database, indexer=indexer)
+
+    # Replace the signature atomically, so that processes loading the index
+    # concurrently never read a partial signature
+    if reset_database:
+        tmp_file = f'{signature_file}.{os.getpid()}.tmp'
+        with open(tmp_file, 'w') as f:
+            f.write(signature)
+        os.replace(tmp_file, signature_file)
+
+    return layout
+
+
 def validate_input_dir(exec_env, bids_dir, participant_label):
     """
     Validate BIDS directory and structure via the BIDS-validator.
@@ -626,11 +1677,20 @@ def validate_input_dir(exec_env, bids_dir, participant_label):
             print("bids-validator does not appear to be installed", file=sys.stderr)
 
 
-def deface_image(image, warped_mask, outfile):
+def deface_image(image, warped_mask, outfile, slab_size=None):
     """
     Deface other contrast/modality image using the 
     defaced T1w image as deface mask.
 
+    The image is streamed slab by slab (by default one volume at a time)
+    from disk to the output file, uncompressed images are memory-mapped.
+    The 3D mask is applied to every volume of 4D images without copying
+    it, and the output keeps the on-disk data type and scaling of the
+    input, so that the memory needed does not depend on the number of
+    volumes. Integer images whose scaling cannot represent 0 (e.g. uint8
+    with an intercept of 10) are written as float32 without scaling
+    instead, as their facial regions could not be set to 0 otherwise.
+
     Parameters
     ----------
     image : str
@@ -638,43 +1698,117 @@ def deface_image(image, warped_mask, outfile):
     warped_mask : str
         Path to warped defaced T1w image.
     outfile: str
+        Name of the defaced file. Can be the same as image.
+    slab_size : int, optional
+        Number of slices (along the third axis) processed at once.
+        Default is all slices of a volume.
+
+    Returns
+    -------
+    outfile : str
         Name of the defaced file.
     """
 
-    # functionality copied from pydeface
-    
-    # Load the input image and the warped mask image
-    infile_img = load(image)
-    warped_mask_img = load(warped_mask)
-    
-    # Convert the warped mask to binary (0 or 1 values)
-    # Any positive values in the mask become 1, others become 0
-    warped_mask_img = math_img('img > 0', img=warped_mask_img)
-    
+    # functionality adapted from pydeface
+
+    # Imports are done here as this function is run as a Nipype Function node
+    import os
+    import numpy as np
+    import nibabel as nib
+    from nibabel.openers import ImageOpener
+
+    infile_img = nib.load(image)
+    shape = infile_img.shape
+    if len(shape) < 3:
+        shape = shape + (1,) * (3 - len(shape))
+    nx, ny, nz = shape[:3]
+    n_vols = int(np.prod(shape[3:]))
+
+    # Binarize the warped mask, any positive value is kept
+    mask = np.asanyarray(nib.load(warped_mask).dataobj) > 0
+    while mask.ndim > 3 and mask.shape[-1] == 1:
+        mask = mask[..., 0]
+    if mask.shape != (nx, ny, nz):
+        raise ValueError(f"The deface mask {warped_mask} with shape "
+                         f"{mask.shape} does not match the image {image} "
+                         f"with shape {infile_img.shape}.")
+
+    slab_size = slab_size or nz
+    compressed = os.path.splitext(image)[1] in ImageOpener.compress_ext_map
+
+    # Write to a hidden temporary file next to the output first, as the
+    # input is still read while writing and might be the output itself
+    tmpfile = os.path.join(os.path.dirname(os.path.abspath(outfile)),
+                           '.' + os.path.basename(outfile))
+
     try:
-        # Attempt to apply the mask by element-wise multiplication
-        # This removes facial regions by setting them to 0
-        outdata = infile_img.get_fdata().squeeze() * warped_mask_img.get_fdata()
-    except ValueError:
-        # Handle cases where image dimensions don't match
-        # This typically happens with multi-volume/4D images
-        
-        # Create a stack of mask data to match the last dimension of the input image
-        # This replicates the 3D mask across all volumes in a 4D image
-        tmpdata = np.stack([warped_mask_img.get_fdata()] *
-                           infile_img.get_fdata().shape[-1], axis=-1)
-        
-        # Apply the replicated mask to all volumes
-        # Note: There's a typo here - should be get_fdata() not fget_data()
-        outdata = infile_img.fget_data() * tmpdata
-
-    # Create a new NIfTI image with the defaced data
-    # Preserve the original image's spatial transformation (affine) and metadata (header)
-    masked_brain = Nifti1Image(outdata, infile_img._affine,
-                               infile_img._header)
-    
-    # Save the defaced image to the specified output file
-    masked_brain.to_filename(outfile)
+        with ImageOpener(image, 'rb') as fin, ImageOpener(tmpfile, 'wb') as fout:
+            # The header of the loaded image does not hold the scaling
+            # anymore, hence it is read from the file again
+            header = infile_img.header_class.from_fileobj(fin)
+            dtype = header.get_data_dtype()
+            offset = header.get_data_offset()
+
+            # Raw value representing 0 after scaling
+            slope, inter = header.get_slope_inter()
+            zero = 0
+            rescale = False
+            if slope is not None and inter:
+                zero = -inter / slope
+                if np.issubdtype(dtype, np.integer):
+                    info = np.iinfo(dtype)
+                    rescale = not info.min <= np.round(zero) <= info.max
+                    zero = np.clip(np.round(zero), info.min, info.max)
+            zero = np.array(zero).astype(dtype)
+
+            # 0 is out of the range of the data type, hence the scaling is
+            # applied and the scaled values are written instead
+            out_dtype = dtype
+            if rescale:
+                print(f"Warning: The scaling of {image} (slope {slope}, "
+                      f"intercept {inter}) cannot represent 0 in "
+                      f"{dtype}, the defaced image is saved as float32.")
+                out_dtype = np.dtype(np.float32)
+                zero = np.float32(0)
+                header.set_data_dtype(out_dtype)
+                header.set_slope_inter(1, 0)
+
+            # Write header and extensions, pad up to the data offset
+            header.write_to(fout)
+            fout.write(b'\x00' * (offset - fout.tell()))
+
+            if compressed:
+                fin.seek(offset)
+            else:
+                raw = np.memmap(image, dtype=dtype, mode='r', offset=offset,
+                                shape=(nx, ny, nz * n_vols), order='F')
+
+            for i_vol in range(n_vols):
+                for z0 in range(0, nz, slab_size):
+                    z1 = min(z0 + slab_size, nz)
+                    if compressed:
+                        buffer = fin.read(nx * ny * (z1 - z0) * dtype.itemsize)
+                        slab = np.frombuffer(buffer, dtype=dtype).reshape(
+                            (nx, ny, z1 - z0), order='F').copy()
+                    else:
+                        slab = np.array(raw[:, :, i_vol * nz + z0:i_vol * nz + z1])
+
+                    if rescale:
+                        slab = slab.astype(out_dtype) * slope + inter
+
+                    # Remove facial regions by setting them to 0
+                    slab[~mask[:, :, z0:z1]] = zero
+                    fout.write(slab.tobytes(order='F'))
+
+            if not compressed:
+                del raw
+
+        os.replace(tmpfile, outfile)
+    finally:
+        if os.path.exists(tmpfile):
+            os.remove(tmpfile)
+
+    return outfile
 
 
 def clean_up_files(bids_dir, subject_label, session=None):
@@ -770,6 +1904,75 @@ def clean_up_files(bids_dir, subject_label, session=None):
         move(info_file, os.path.join(out_path_info, file_out))
 
 
+def _non_deid_backups(bids_dir, subject_label, session=None):
+    """
+    Find the backups of the original (non-de-identified) images and json
+    files of a subject and the locations they are restored to.
+
+    Backups are searched in sourcedata/bidsonym/sub-<label>, including
+    the session directories and the images/meta_data_info directories
+    created by clean_up_files. Brain masks, defacing masks and other
+    BIDSonym outputs are not restored. The session directory a file is
+    restored to is taken from its name, so that all sessions of a subject
+    can be restored at once.
+
+    Parameters
+    ----------
+    bids_dir : str
+        Path to BIDS root directory.
+    subject_label : str
+        Label of subject (without 'sub-').
+    session : str, optional
+        Only find the backups of this session (without 'ses-').
+
+    Returns
+    -------
+    dict
+        Paths the files are restored to, keyed by the path of their backup.
+    """
+
+    sourcedata_subject_dir = os.path.join(bids_dir, "sourcedata", "bidsonym",
+                                          f"sub-{subject_label}")
+
+    backups = {}
+    for backup in sorted(glob(os.path.join(sourcedata_subject_dir, '**', '*'),
+                              recursive=True)):
+        basename = os.path.basename(backup)
+        extension = next((ext for ext in ('.nii.gz', '.json')
+                          if basename.endswith(ext)), None)
+        if extension is None or not basename.startswith(f"sub-{subject_label}_"):
+            continue
+
+        # Originals are named as in the BIDS dataset, optionally with the
+        # 'desc-nondeid' identifier added by rename_non_deid
+        name = basename[:-len(extension)]
+        if name.endswith('_desc-nondeid'):
+            name = name[:-len('_desc-nondeid')]
+        if '_desc-' in name or name.endswith('_brainmask') or '_defacemask' in name:
+            continue
+
+        match = re.search(r'_ses-([a-zA-Z0-9]+)_', name)
+        file_session = match.group(1) if match else None
+        if session is not None and file_session != session:
+            continue
+
+        # Data type directory based on the BIDS suffix
+        suffix = name.split('_')[-1]
+        if suffix in ('bold', 'sbref'):
+            datatype = 'func'
+        elif suffix == 'dwi':
+            datatype = 'dwi'
+        else:
+            datatype = 'anat'
+
+        backups[backup] = os.path.join(
+            bids_dir, f"sub-{subject_label}",
+            f"ses-{file_session}" if file_session else '', datatype, name + extension
+        )
+
+    return backups
+
+
 def revert_bidsonym(bids_dir, subject_label, session=None, confirm=True):
     """
     Revert the BIDSonym process by copying back non-defaced images and
@@ -787,7 +1990,8 @@ def revert_bidsonym(bids_dir, subject_label, session=None, confirm=True):
         Label of subject to restore (without 'sub-' prefix).
     session : str, optional
         Session label (if applicable, without 'ses-' prefix).
-        If provided, only that specific session will be reverted.
+        If provided, only that specific session will be reverted,
+        otherwise all sessions of the subject are reverted.
     confirm : bool, optional
         If True, ask for user confirmation before proceeding.
         Default is True for safety to prevent accidental data loss.
@@ -798,14 +2002,34 @@ def revert_bidsonym(bids_dir, subject_label, session=None, confirm=True):
         True if reversion was successful, False otherwise.
     """
     
+    # Set up logging system, the log file is closed once the subject is
+    # reverted, as revert_bidsonym is called for every subject
+    log_print, log_path = setup_logging(bids_dir, subject_label, session, "bidsonymrevert")
+    try:
+        return _revert_subject(bids_dir, subject_label, session, confirm,
+                               log_print, log_path)
+    finally:
+        log_print.close()
+
+
+def _revert_subject(bids_dir, subject_label, session, confirm, log_print,
+                    log_path):
+    """
+    Revert the BIDSonym process of a subject, see revert_bidsonym.
+
+    Parameters
+    ----------
+    log_print : function
+        Logging function to use for output.
+    log_path : str or None
+        Path to the log file.
+    """
+
     import os
     import shutil
     from glob import glob
     from shutil import copy2
     
-    # Set up logging system
-    log_print, log_path = setup_logging(bids_dir, subject_label, session, "bidsonymrevert")
-    
     # Build session description for messages
     session_desc = f" (session: {session})" if session is not None else ""
     
@@ -818,7 +2042,7 @@ def revert_bidsonym(bids_dir, subject_label, session=None, confirm=True):
         log_print(f"Session: ses-{session}")
         log_print("Processing multi-session dataset structure")
     else:
-        log_print("Processing single-session dataset structure")
+        log_print("Processing all sessions of the subject")
     
     if log_path:
         log_print(f"Log file created: {log_path}")
@@ -854,45 +2078,21 @@ def revert_bidsonym(bids_dir, subject_label, session=None, confirm=True):
     else:
         log_print(f"Found BIDSonym backup directory: {sourcedata_base_dir}")
     
-    # Find all original files in sourcedata directory tree
-    # These files have 'desc-nondeid' identifier and represent the original, non-anonymized data
+    # Find all original files in sourcedata directory tree, which are
+    # restored to the session directories given by their names
     log_print(f"\nScanning for original (non-anonymized) files{session_desc}...")
-    
-    # Look for files with 'desc-nondeid' identifier in the main sourcedata directory
-    # Use recursive search to handle both organized and unorganized file structures
-    original_images = glob(os.path.join(sourcedata_base_dir, "**/*desc-nondeid.nii.gz"), recursive=True)
-    original_json_files = glob(os.path.join(sourcedata_base_dir, "**/*desc-nondeid.json"), recursive=True)
-    
-    # Also check organized subdirectories that may exist if clean_up_files was run
-    # These subdirectories separate images from metadata for better organization
-    images_subdir = os.path.join(sourcedata_base_dir, "images")
-    metadata_subdir = os.path.join(sourcedata_base_dir, "meta_data_info")
-    
-    # Check if organized images subdirectory exists and scan it
-    if os.path.exists(images_subdir):
-        log_print(f"   Checking organized images subdirectory: {images_subdir}")
-        additional_images = glob(os.path.join(images_subdir, "*desc-nondeid.nii.gz"))
-        original_images.extend(additional_images)
-        
-    # Check if organized metadata subdirectory exists and scan it    
-    if os.path.exists(metadata_subdir):
-        log_print(f"   Checking organized metadata subdirectory: {metadata_subdir}")
-        additional_json = glob(os.path.join(metadata_subdir, "*desc-nondeid.json"))
-        original_json_files.extend(additional_json)
-    
-    # Find current defaced/modified files in main BIDS structure that need to be replaced
-    # These are the anonymized files that will be removed and replaced with originals
+    backups = _non_deid_backups(bids_dir, subject_label, session)
+    original_images = [backup for backup in backups if backup.endswith('.nii.gz')]
+    original_json_files = [backup for backup in backups if backup.endswith('.json')]
+
+    # Only the de-identified versions of backed up files are replaced,
+    # files BIDSonym did not modify (e.g. BOLD images) are kept
     log_print(f"\nScanning current BIDS structure for files to replace{session_desc}...")
-    if session is not None:
-        # For session-specific reversion, only scan the target session directory
-        log_print(f"   Scanning session-specific directory: {subject_dir}")
-        current_images = glob(os.path.join(subject_dir, "**/*.nii.gz"), recursive=True)
-        current_json_files = glob(os.path.join(subject_dir, "**/*.json"), recursive=True)
-    else:
-        # For single-session reversion, scan the entire subject directory
-        log_print(f"   Scanning subject directory: {subject_dir}")
-        current_images = glob(os.path.join(subject_dir, "**/*.nii.gz"), recursive=True)
-        current_json_files = glob(os.path.join(subject_dir, "**/*.json"), recursive=True)
+    log_print(f"   Scanning directory: {subject_dir}")
+    current_images = [backups[backup] for backup in original_images
+                      if os.path.exists(backups[backup])]
+    current_json_files = [backups[backup] for backup in original_json_files
+                          if os.path.exists(backups[backup])]
     
     # Validate that we found backup files to restore
     # If no original files are found, this suggests BIDSonym was never run or backup data is missing
@@ -939,7 +2139,7 @@ def revert_bidsonym(bids_dir, subject_label, session=None, confirm=True):
         remaining_subjects = [
             d for d in os.listdir(bidsonym_dir)
             if os.path.isdir(os.path.join(bidsonym_dir, d))
-            and d != f"sub-{subject_label}"
+            and d.startswith("sub-") and d != f"sub-{subject_label}"
         ]
     
     # Inform user about directory cleanup scope
@@ -1011,49 +2211,15 @@ def revert_bidsonym(bids_dir, subject_label, session=None, confirm=True):
         
         # Process each original image file found in sourcedata
         for original_img in original_images:
-            # Remove the BIDSonym identifier to get the original BIDS filename
-            original_basename = os.path.basename(original_img)
-            restored_basename = original_basename.replace('_desc-nondeid', '')
-            
-            # Determine where this file should go in the BIDS structure
-            # This logic handles files from both organized and unorganized sourcedata
-            if "images/" in original_img:
-                # File is in organized structure - extract just the filename
-                relative_path = restored_basename
-            else:
-                # File is in root of subject sourcedata directory
-                relative_path = restored_basename
-            
-            # Determine target directory based on BIDS file naming conventions
-            # Use the base subject directory (which may include session)
-            if session is not None:
-                base_subject_dir = subject_dir
-            else:
-                base_subject_dir = subject_dir
-                
-            # Classify file type by filename patterns following BIDS conventions
-            if 'T1w' in restored_basename or 'T2w' in restored_basename or 'FLAIR' in restored_basename:
-                target_dir = os.path.join(base_subject_dir, 'anat')
-                modality = "anatomical"
-            elif 'bold' in restored_basename:
-                target_dir = os.path.join(base_subject_dir, 'func')
-                modality = "functional"
-            elif 'dwi' in restored_basename:
-                target_dir = os.path.join(base_subject_dir, 'dwi')
-                modality = "diffusion"
-            else:
-                # Default to anat directory for unknown/unclassified image types
-                target_dir = os.path.join(base_subject_dir, 'anat')
-                modality = "anatomical (default)"
+            target_path = backups[original_img]
             
             # Create target directory if it doesn't exist (handles new directory structure)
-            os.makedirs(target_dir, exist_ok=True)
+            os.makedirs(os.path.dirname(target_path), exist_ok=True)
             
             # Copy the original file back to its proper BIDS location
-            target_path = os.path.join(target_dir, restored_basename)
             copy2(original_img, target_path)
             restored_images += 1
-            log_print(f"      Restored {modality}: {restored_basename}")
+            log_print(f"      Restored: {os.path.relpath(target_path, bids_dir)}")
         
         log_print(f"   Summary: Restored {restored_images} original image files")
         
@@ -1066,52 +2232,40 @@ def revert_bidsonym(bids_dir, subject_label, session=None, confirm=True):
         
         # Process each original JSON file found in sourcedata
         for original_json in original_json_files:
-            # Determine the target path by removing the 'desc-nondeid' identifier
-            original_basename = os.path.basename(original_json)
-            restored_basename = original_basename.replace('_desc-nondeid', '')
-            
-            # Determine target directory (same logic as images)
-            if session is not None:
-                base_subject_dir = subject_dir
-            else:
-                base_subject_dir = subject_dir
-                
-            # Classify metadata type by filename patterns following BIDS conventions
-            if 'T1w' in restored_basename or 'T2w' in restored_basename or 'FLAIR' in restored_basename:
-                target_dir = os.path.join(base_subject_dir, 'anat')
-                metadata_type = "anatomical"
-            elif 'bold' in restored_basename:
-                target_dir = os.path.join(base_subject_dir, 'func')
-                metadata_type = "functional"
-            elif 'dwi' in restored_basename:
-                target_dir = os.path.join(base_subject_dir, 'dwi')
-                metadata_type = "diffusion"
-            else:
-                # Check if it's a task-level JSON (should go to BIDS root)
-                if original_basename.startswith('task-'):
-                    target_dir = bids_dir
-                    metadata_type = "task-level"
-                else:
-                    target_dir = os.path.join(base_subject_dir, 'anat')
-                    metadata_type = "anatomical (default)"
-            
-            # Create target directory if it doesn't exist
-            os.makedirs(target_dir, exist_ok=True)
-            
-            # Copy the original file back to its proper location
-            target_path = os.path.join(target_dir, restored_basename)
+            target_path = backups[original_json]
+            os.makedirs(os.path.dirname(target_path), exist_ok=True)
             copy2(original_json, target_path)
             restored_json += 1
-            log_print(f"      Restored {metadata_type} metadata: {restored_basename}")
+            log_print(f"      Restored metadata: {os.path.relpath(target_path, bids_dir)}")
         
         log_print(f"   Summary: Restored {restored_json} original JSON metadata files")
         
         # Step 4: Remove the entire BIDSonym sourcedata directory structure
         log_print("\n STEP 4: Cleaning up BIDSonym backup directories...")
         
-        # Remove the subject's BIDSonym directory
-        shutil.rmtree(sourcedata_base_dir)
-        log_print(f"      Removed subject backup directory: {sourcedata_base_dir}")
+        # Remove the backup directory of the session, or of the subject if
+        # all of its sessions are reverted
+        if session is not None:
+            shutil.rmtree(sourcedata_subject_dir, ignore_errors=True)
+            log_print(f"      Removed session backup directory: {sourcedata_subject_dir}")
+
+            # Files of the session left in the subject's directory, e.g. by
+            # an interrupted run, and its stages in the journal
+            for backup in glob(os.path.join(sourcedata_base_dir, f"*_ses-{session}_*")):
+                os.remove(backup)
+            journal = journal_file(bids_dir, subject_label)
+            if os.path.exists(journal):
+                entries = [entry for entry in read_journal(bids_dir, subject_label).values()
+                           if f"ses-{session}" not in entry['item'].split('/')]
+                with open(journal, 'w') as f:
+                    f.writelines(json.dumps(entry) + '\n' for entry in entries)
+
+        if session is None or not glob(os.path.join(sourcedata_base_dir, "ses-*")):
+            shutil.rmtree(sourcedata_base_dir)
+            log_print(f"      Removed subject backup directory: {sourcedata_base_dir}")
+
+        # Remove the subject's entries from the meta-data store
+        delete_meta_data(bids_dir, subject_label, session)
         
         # Check if the parent sourcedata/bidsonym directory is now empty
         bidsonym_dir = os.path.join(bids_dir, "sourcedata", "bidsonym")
@@ -47,8 +47,14 @@ setup(
     entry_points={
         'console_scripts': [
             'bidsonym = bidsonym.run_deeid:run_deeid',
+            'bidsonym-bench = bidsonym.bench:run_bench',
             # 'command = some.module:some_function',
         ],
+        # Other packages can register defacers in this group, see
+        # bidsonym.defacers
+        'bidsonym.defacers': [
+            # 'name = some.module:DEFACER',
+        ],
     },
     include_package_data=True,
     package_data={
@@ -0,0 +1,16 @@
+# Shared fixtures of the BIDSonym tests, the datasets are generated via
+# bidsonym.bench, i.e. synthetic 'heads' small enough to be processed in
+# a fraction of a second
+import pytest
+
+from bidsonym.bench import generate_dataset
+
+
+@pytest.fixture
+def bids_dataset(tmp_path):
+    """Synthetic BIDS dataset of two subjects with one T1w image each."""
+
+    bids_dir = str(tmp_path / 'bids')
+    generate_dataset(bids_dir, n_subjects=2, n_sessions=0, modalities=('T1w',),
+                     n_bold=0, shape=(24, 24, 20))
+    return bids_dir
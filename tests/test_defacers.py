@@ -0,0 +1,117 @@
+import os
+import shutil
+
+import pytest
+
+from bidsonym import defacers
+from bidsonym.defacers import (deface_batch, deface_files, defacemask_file,
+                               defacer_available, get_defacer, list_defacers,
+                               register_defacer, select_defacer)
+
+
+@pytest.fixture(autouse=True)
+def registry(monkeypatch):
+    # Defacers registered by a test are dropped afterwards
+    monkeypatch.setattr(defacers, '_defacers', dict(defacers._defacers))
+    monkeypatch.setattr(defacers, '_entry_points_loaded', True)
+
+
+def _copy_batch(images, outdir, n_workers=1, fail=(), calls=None):
+    # Fake defacer "defacing" by copying, writing a mask and failing on
+    # the images listed in fail
+    if calls is not None:
+        calls.append(outdir)
+    results = []
+    for image in images:
+        if os.path.basename(image) in fail:
+            results.append(None)
+            continue
+        outfile = os.path.join(outdir, os.path.basename(image))
+        shutil.copyfile(image, outfile)
+        with open(defacemask_file(image, outdir), 'w') as f:
+            f.write('mask')
+        results.append(outfile)
+    return results
+
+
+def _images(tmp_path, names):
+    images = []
+    for name in names:
+        image = tmp_path / 'in' / name
+        image.parent.mkdir(exist_ok=True)
+        image.write_text(name)
+        images.append(str(image))
+    return images
+
+
+def test_register_defacer_rejects_unknown_capabilities():
+    with pytest.raises(Exception, match='unknown capabilities: gpu'):
+        register_defacer('fake', _copy_batch, capabilities=('gpu',))
+    assert 'fake' not in list_defacers()
+
+    register_defacer('fake', _copy_batch, capabilities=('batched',))
+    capabilities = get_defacer('fake')['capabilities']
+    assert capabilities['batched'] and not any(
+        capabilities[c] for c in capabilities if c != 'batched')
+
+
+def test_select_defacer_prefers_fastest_available(monkeypatch):
+    monkeypatch.setattr(defacers, '_defacers', {})
+    register_defacer('slow', _copy_batch, rank=30, capabilities=('mask_output',))
+    register_defacer('fast', _copy_batch, rank=10)
+    register_defacer('missing', _copy_batch, rank=0, available=lambda: False)
+
+    assert list_defacers() == ['missing', 'fast', 'slow']
+    assert list_defacers(available_only=True) == ['fast', 'slow']
+    assert not defacer_available('missing')
+    assert select_defacer() == 'fast'
+    assert select_defacer(require=('mask_output',)) == 'slow'
+    assert select_defacer(candidates=['missing', 'slow']) == 'slow'
+    with pytest.raises(Exception, match='None of the defacers missing'):
+        select_defacer(candidates=['missing'])
+    with pytest.raises(Exception, match='Unknown defacer'):
+        get_defacer('unknown')
+
+
+def test_deface_batch_resolves_function_reference(tmp_path):
+    register_defacer('fake', f'{__name__}:_copy_batch', rank=-1)
+    images = _images(tmp_path, ['a.nii.gz'])
+
+    outdir = str(tmp_path / 'out')
+    assert deface_batch(images, outdir) == [os.path.join(outdir, 'a.nii.gz')]
+
+
+def test_deface_files_moves_results_into_place(tmp_path):
+    calls = []
+
+    def failing_batch(images, outdir, n_workers=1):
+        return _copy_batch(images, outdir, fail=('b.nii.gz',), calls=calls)
+
+    register_defacer('fake', failing_batch, capabilities=('mask_output',))
+    images = _images(tmp_path, ['a.nii.gz', 'b.nii.gz'])
+    outfiles = [str(tmp_path / 'anat' / f'defaced_{name}') for name in ['a', 'b']]
+    maskfiles = [str(tmp_path / 'masks' / f'mask_{name}') for name in ['a', 'b']]
+    os.makedirs(tmp_path / 'anat')
+    os.makedirs(tmp_path / 'masks')
+
+    assert deface_files('fake', images, outfiles, maskfiles) == [outfiles[0], None]
+    with open(outfiles[0]) as f:
+        assert f.read() == 'a.nii.gz'
+    assert os.path.exists(maskfiles[0])
+    assert not os.path.exists(outfiles[1]) and not os.path.exists(maskfiles[1])
+
+    # The temporary directory is created next to the defaced files and
+    # removed afterwards
+    assert os.path.dirname(calls[0]) == str(tmp_path / 'anat')
+    assert os.listdir(tmp_path / 'anat') == ['defaced_a']
+
+
+def test_quickshear_available_without_bet(tmp_path, monkeypatch):
+    from bidsonym.defacing_algorithms import quickshear_batch
+
+    monkeypatch.setenv('PATH', str(tmp_path))
+    assert defacer_available('quickshear')
+
+    # Only images without a brain mask require BET
+    with pytest.raises(RuntimeError, match='install FSL'):
+        quickshear_batch(_images(tmp_path, ['a.nii.gz']), str(tmp_path))
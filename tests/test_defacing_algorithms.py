@@ -0,0 +1,80 @@
+import shutil
+
+import numpy as np
+import nibabel as nib
+import pytest
+
+from bidsonym.defacing_algorithms import quickshear_array, registration_cache_key
+
+
+def _save(data, image_file):
+    nib.save(nib.Nifti1Image(data, np.diag([1.0, 1.0, 1.0, 1.0])), image_file)
+    return image_file
+
+
+def test_registration_cache_key_depends_on_reference_content(tmp_path):
+    rng = np.random.default_rng(0)
+    t1w = _save(rng.random((10, 10, 8), dtype=np.float32), str(tmp_path / 'T1w.nii.gz'))
+
+    # Two runs on the same voxel grid, with the head moved in between
+    run_1 = rng.random((10, 10, 8), dtype=np.float32)
+    run_2 = np.roll(run_1, 2, axis=1)
+    run_1 = _save(run_1, str(tmp_path / 'run-1_T2w.nii.gz'))
+    run_2 = _save(run_2, str(tmp_path / 'run-2_T2w.nii.gz'))
+    assert nib.load(run_1).header == nib.load(run_2).header
+
+    key_1 = registration_cache_key(t1w, run_1)
+    assert registration_cache_key(t1w, run_2) != key_1
+
+    # The key only depends on the content, e.g. it is reused by reruns
+    shutil.copyfile(run_1, tmp_path / 'copy.nii.gz')
+    assert registration_cache_key(t1w, str(tmp_path / 'copy.nii.gz')) == key_1
+    assert registration_cache_key(t1w, run_1, cost_func='corratio') != key_1
+    assert registration_cache_key(run_1, t1w) != key_1
+
+
+def _brain(shape=(30, 34, 30), radius=8):
+    """Spherical brain mask, shifted up and back within the field of view."""
+
+    grid = np.ogrid[tuple(slice(0, n) for n in shape)]
+    center = (shape[0] / 2, shape[1] / 2 - 4, shape[2] / 2 + 4)
+    return sum((axis - c) ** 2 for axis, c in zip(grid, center)) <= radius ** 2
+
+
+def test_quickshear_array_removes_face_and_keeps_brain():
+    brain = _brain()
+    anat = np.full(brain.shape + (2,), 100, dtype=np.int16)
+
+    # RAS+ image, i.e. anterior at the end of the second axis
+    defaced, keep = quickshear_array(anat, brain, np.eye(4), buff=2)
+
+    assert defaced.dtype == np.int16 and defaced.shape == anat.shape
+    assert keep[brain].all()
+    assert not keep[:, -1, 0].any()  # anterior, inferior: face
+    assert keep[:, 0, -1].all()  # posterior, superior
+    assert np.array_equal(defaced[..., 0], np.where(keep, 100, 0))
+    assert np.array_equal(defaced[..., 0], defaced[..., 1])
+
+    # A larger buffer keeps more voxels below the brain
+    assert quickshear_array(anat, brain, np.eye(4), buff=6)[1].sum() > keep.sum()
+
+
+def test_quickshear_array_is_orientation_independent():
+    brain = _brain()
+    anat = np.full(brain.shape, 100, dtype=np.int16)
+    _, keep = quickshear_array(anat, brain, np.eye(4))
+
+    # The same head stored in LPI orientation
+    flip = np.diag([-1.0, 1.0, -1.0, 1.0])
+    flip[:3, 3] = [brain.shape[0] - 1, 0, brain.shape[2] - 1]
+    _, keep_lpi = quickshear_array(anat[::-1, :, ::-1], brain[::-1, :, ::-1], flip)
+
+    assert np.array_equal(keep_lpi, keep[::-1, :, ::-1])
+
+
+def test_quickshear_array_rejects_invalid_masks():
+    anat = np.ones((10, 10, 10), dtype=np.int16)
+    with pytest.raises(ValueError):
+        quickshear_array(anat, np.zeros((10, 10, 10)), np.eye(4))
+    with pytest.raises(ValueError):
+        quickshear_array(anat, np.ones((10, 10, 9)), np.eye(4))
@@ -0,0 +1,223 @@
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import threading
+import time
+import tracemalloc
+
+import numpy as np
+import nibabel as nib
+import pytest
+
+from bidsonym.reports import (_load_volume, build_qc_dashboard, create_graphics,
+                              setup_logging, write_gif)
+
+
+def _stub_brainmask(bids_dir, subject_label):
+    image = os.path.join(bids_dir, f'sub-{subject_label}', 'anat',
+                         f'sub-{subject_label}_T1w.nii.gz')
+    img = nib.load(image)
+    mask_file = os.path.join(bids_dir, 'sourcedata', 'bidsonym', f'sub-{subject_label}',
+                             f'sub-{subject_label}_T1w_brainmask_desc-nondeid.nii.gz')
+    os.makedirs(os.path.dirname(mask_file), exist_ok=True)
+    nib.save(nib.Nifti1Image((np.asanyarray(img.dataobj) > 400).astype(np.uint8),
+                             img.affine), mask_file)
+    return mask_file
+
+
+def test_create_graphics_logs_via_log_print(bids_dataset, tmp_path):
+    _stub_brainmask(bids_dataset, '01')
+    messages = []
+
+    def log_print(message="", level="INFO"):
+        messages.append((level, message))
+
+    create_graphics(bids_dataset, '01', modalities=['T1w', 'DWI'],
+                    base_dir=str(tmp_path / 'work'), log_print=log_print)
+
+    subject_dir = os.path.join(bids_dataset, 'sourcedata', 'bidsonym', 'sub-01')
+    assert os.path.exists(os.path.join(subject_dir, 'sub-01_T1w_desc-brainmaskdeid.png'))
+    assert os.path.exists(os.path.join(subject_dir, 'images', 'sub-01_T1w.gif'))
+    assert ('INFO', "Processing modalities: ['T1w']") in messages
+    assert messages[-1] == ('INFO', 'Graphics workflow completed successfully')
+
+    create_graphics(bids_dataset, '01', modalities=['DWI'],
+                    base_dir=str(tmp_path / 'work'), log_print=log_print)
+    assert ('WARNING', "No valid modalities found. Defaulting to ['T1w'].") in messages
+
+
+def test_load_volume_reads_first_volume_only(tmp_path):
+    rng = np.random.default_rng(0)
+    bold = rng.random((32, 32, 24, 40), dtype=np.float32)
+    bold_file = str(tmp_path / 'bold.nii.gz')
+    nib.save(nib.Nifti1Image(bold, np.diag([-2.0, 2.0, 2.0, 1.0])), bold_file)
+
+    tracemalloc.start()
+    try:
+        _, data, zooms = _load_volume(bold_file)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    # Reoriented to RAS+, i.e. the first axis is flipped
+    np.testing.assert_array_equal(data, bold[::-1, :, :, 0])
+    np.testing.assert_array_equal(zooms, [2.0, 2.0, 2.0])
+    assert peak < bold.nbytes / 4
+
+
+def test_write_gif_removes_temporary_file_on_failure(tmp_path):
+    image = str(tmp_path / 'T1w.nii.gz')
+    nib.save(nib.Nifti1Image(np.zeros((8, 8, 8), dtype=np.uint8), np.eye(4)), image)
+
+    # The GIF cannot replace a directory of the same name
+    os.makedirs(tmp_path / 'T1w.gif' / 'keep')
+    with pytest.raises(OSError):
+        write_gif(image, str(tmp_path / 'T1w.gif'))
+    assert sorted(os.listdir(tmp_path)) == ['T1w.gif', 'T1w.nii.gz']
+
+
+# Renders many plots in a fresh interpreter, reporting the growth of the
+# peak resident memory and the Python allocations of the later plots
+_RENDER_MEMORY_SCRIPT = """
+import json, os, resource, sys, tracemalloc
+import numpy as np
+import nibabel as nib
+from bidsonym.reports import _render_montage, render_map
+
+out_dir, n_images = sys.argv[1], int(sys.argv[2])
+rng = np.random.default_rng(0)
+tasks = []
+for i in range(n_images):
+    data = rng.random((96, 96, 64), dtype=np.float32)
+    defaced = os.path.join(out_dir, f'defaced_{i}.nii')
+    brainmask = os.path.join(out_dir, f'brainmask_{i}.nii')
+    nib.save(nib.Nifti1Image(data, np.eye(4)), defaced)
+    nib.save(nib.Nifti1Image((data > 0.5).astype(np.uint8), np.eye(4)), brainmask)
+    tasks.append((defaced, brainmask, os.path.join(out_dir, f'plot_{i}.png')))
+
+render_map(_render_montage, tasks[:2])
+baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+tracemalloc.start()
+render_map(_render_montage, tasks[2:])
+current, peak = tracemalloc.get_traced_memory()
+print(json.dumps({
+    'rss_growth': (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - baseline) * 1024,
+    'current': current, 'peak': peak, 'volume': data.nbytes,
+}))
+"""
+
+
+def test_render_memory_does_not_grow_with_number_of_images(tmp_path):
+    pytest.importorskip('resource')
+    result = subprocess.run(
+        [sys.executable, '-c', _RENDER_MEMORY_SCRIPT, str(tmp_path), '20'],
+        capture_output=True, text=True, check=True,
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    )
+    memory = json.loads(result.stdout.strip().splitlines()[-1])
+
+    # Nothing is kept from plot to plot and a single plot needs a few
+    # copies of its (float) volume at most
+    assert memory['current'] < memory['volume']
+    assert memory['peak'] < 10 * memory['volume']
+    assert memory['rss_growth'] < 8 * memory['volume']
+
+
+def _write_graphic(bidsonym_dir, relpath, color=0):
+    from PIL import Image
+
+    graphic = os.path.join(bidsonym_dir, relpath)
+    os.makedirs(os.path.dirname(graphic), exist_ok=True)
+    if graphic.endswith('.gif'):
+        frames = [Image.new('L', (64, 32), color + i) for i in range(3)]
+        frames[0].save(graphic, save_all=True, append_images=frames[1:])
+    else:
+        Image.new('RGB', (640, 160), (color, 0, 0)).save(graphic)
+    return graphic
+
+
+def _build(bids_dir, thumbnail_size=32):
+    messages = []
+    build_qc_dashboard(bids_dir, thumbnail_size=thumbnail_size,
+                       log_print=messages.append)
+    return int(re.search(r'\((\d+) thumbnails rendered\)', messages[-1]).group(1))
+
+
+def test_qc_dashboard_only_renders_changed_thumbnails(tmp_path):
+    bids_dir = str(tmp_path)
+    bidsonym_dir = os.path.join(bids_dir, 'sourcedata', 'bidsonym')
+    plot = _write_graphic(bidsonym_dir, 'sub-01/images/sub-01_T1w_brainmaskplot.png')
+    _write_graphic(bidsonym_dir, 'sub-01/images/sub-01_T1w_defaced.gif')
+    _write_graphic(bidsonym_dir, 'sub-02/ses-1/images/sub-02_ses-1_T1w_brainmaskplot.png')
+
+    assert _build(bids_dir) == 3
+    assert _build(bids_dir) == 0
+    with open(os.path.join(bidsonym_dir, 'desc-qcmanifest.json')) as json_file:
+        manifest = json.load(json_file)
+    assert sorted(manifest['subjects']) == ['01', '02']
+    thumbnail = os.path.join(
+        bidsonym_dir, manifest['subjects']['01']['graphics'][os.path.relpath(plot, bidsonym_dir)]['thumbnail']
+    )
+    assert os.path.exists(thumbnail)
+    with open(os.path.join(bidsonym_dir, 'desc-qc.html')) as html_file:
+        assert 'sub-02' in html_file.read()
+
+    # A graphic written again is rendered again
+    _write_graphic(bidsonym_dir, 'sub-01/images/sub-01_T1w_brainmaskplot.png', color=255)
+    os.utime(plot, ns=(0, 0))
+    assert _build(bids_dir) == 1
+
+    # Only the graphics of a newly processed subject are rendered
+    _write_graphic(bidsonym_dir, 'sub-03/images/sub-03_T1w_brainmaskplot.png')
+    assert _build(bids_dir) == 1
+
+    # The thumbnails of a reverted subject are removed
+    shutil.rmtree(os.path.join(bidsonym_dir, 'sub-02'))
+    assert _build(bids_dir) == 0
+    assert sorted(os.listdir(os.path.join(bidsonym_dir, 'qc_thumbnails'))) == ['sub-01', 'sub-03']
+
+    # Changing the thumbnail size renders all thumbnails again
+    assert _build(bids_dir, thumbnail_size=16) == 3
+    assert _build(bids_dir, thumbnail_size=16) == 0
+
+
+def _open_files():
+    return len(os.listdir('/proc/self/fd'))
+
+
+def _read_when(path, text, timeout=5):
+    # Records are written by a background thread
+    deadline = time.monotonic() + timeout
+    while True:
+        with open(path) as log_file:
+            content = log_file.read()
+        if text in content or time.monotonic() > deadline:
+            return content
+        time.sleep(0.01)
+
+
+@pytest.mark.skipif(not os.path.isdir('/proc/self/fd'), reason='needs /proc')
+def test_setup_logging_releases_log_files(tmp_path):
+    # Start the background thread writing the log files
+    setup_logging(str(tmp_path), 'start')[0].close()
+    threads, open_files = threading.active_count(), _open_files()
+
+    for i in range(100):
+        log_print, log_path = setup_logging(str(tmp_path), f'{i:03d}')
+        log_print("Restoring files")
+        log_print("Missing backup", "WARNING")
+        if i == 0:
+            # Warnings are written out without closing the log
+            assert '[WARNING] Missing backup' in _read_when(log_path, 'Missing backup')
+        log_print.close()
+        log_print.close()
+
+        with open(log_path) as log_file:
+            content = log_file.read()
+        assert '[INFO] Restoring files' in content and '[WARNING] Missing backup' in content
+
+    assert threading.active_count() == threads
+    assert _open_files() == open_files
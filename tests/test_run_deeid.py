@@ -0,0 +1,107 @@
+import glob
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+from bidsonym.run_deeid import (_connect_batch, _select_batch_result,
+                                connect_nobrainer_batch)
+
+
+def _fake_batch(images, outfiles):
+    # Fails on the second image, like nobrainer_predict/deface_files
+    return [outfiles[0], None]
+
+
+def _batched_workflow(bids_dir, tmp_path):
+    import nipype.pipeline.engine as pe
+    from bidsonym.utils import init_brain_extraction_nb_wf
+
+    images = sorted(glob.glob(os.path.join(bids_dir, 'sub-*', 'anat', '*_T1w.nii.gz')))
+    workflow = pe.Workflow('bidsonym_wf', base_dir=str(tmp_path / 'work'))
+    workflow.config['execution']['crashdump_dir'] = str(tmp_path / 'crash')
+    for image in images:
+        subject_label = os.path.basename(image).split('_')[0][len('sub-'):]
+        workflow.add_nodes([init_brain_extraction_nb_wf(
+            image, subject_label, bids_dir, batched=True,
+            name=f'sub_{subject_label}_brainextraction_wf'
+        )])
+    return workflow, images
+
+
+def test_select_batch_result_names_failed_image():
+    assert _select_batch_result(['a.nii.gz', None], 0, 'sub-01_T1w.nii.gz') == 'a.nii.gz'
+    with pytest.raises(RuntimeError, match='sub-02_T1w.nii.gz'):
+        _select_batch_result(['a.nii.gz', None], 1, 'sub-02_T1w.nii.gz')
+
+
+def test_failed_batch_images_only_stop_their_workflow(bids_dataset, tmp_path):
+    import nipype.pipeline.engine as pe
+    from nipype import Function
+
+    workflow, images = _batched_workflow(bids_dataset, tmp_path)
+    batch = pe.Node(Function(input_names=['images', 'outfiles'], output_names=['outfiles'],
+                             function=_fake_batch), name='fake_batch')
+    _connect_batch(workflow, batch, 'brainextraction_wf',
+                   {'in_file': 'images', 'out_file': 'outfiles'}, 'mask_file')
+    assert batch.inputs.images == images
+
+    with pytest.raises(RuntimeError):
+        workflow.run()
+
+    # The first image got its mask, the second one failed in its select
+    # node, naming the image
+    select_dir = str(tmp_path / 'work' / 'bidsonym_wf' / 'select_sub_01_brainextraction_wf_inputnode')
+    assert os.path.exists(os.path.join(select_dir, 'result_select_sub_01_brainextraction_wf_inputnode.pklz'))
+    crash_files = glob.glob(str(tmp_path / 'crash' / 'crash-*'))
+    assert len(crash_files) == 1 and 'select_sub_02' in crash_files[0]
+
+
+def test_nobrainer_batch_threads_limited_to_plugin_procs(bids_dataset, tmp_path):
+    workflow, _ = _batched_workflow(bids_dataset, tmp_path)
+    connect_nobrainer_batch(workflow, n_threads=8, max_procs=2)
+
+    batch = workflow.get_node('nobrainer_batch')
+    assert batch.n_procs == 2 and batch.inputs.n_threads == 2
+
+
+def test_get_images_adds_images_moved_by_previous_run(bids_dataset):
+    from argparse import Namespace
+    from bidsonym.run_deeid import _get_images
+    from bidsonym.utils import copy_no_deid, get_bids_layout, read_journal, record_stage
+
+    image = os.path.join(bids_dataset, 'sub-01', 'anat', 'sub-01_T1w.nii.gz')
+    moved = copy_no_deid(bids_dataset, '01', image)
+    record_stage(bids_dataset, '01', 'backup', os.path.relpath(image, bids_dataset),
+                 source=moved)
+
+    # The run was interrupted before the defaced image was written
+    layout = get_bids_layout(bids_dataset)
+    args = Namespace(bids_dir=bids_dataset)
+    assert _get_images(args, layout, '01', 'T1w') == []
+    assert _get_images(args, layout, '01', 'T1w',
+                       journal=read_journal(bids_dataset, '01')) == [image]
+    assert _get_images(args, layout, '01', 'T2w',
+                       journal=read_journal(bids_dataset, '01')) == []
+
+
+def test_cli_import_is_lightweight():
+    # Importing the command line interface and building its parser must not
+    # load the processing dependencies, so that e.g. --help and --version start fast
+    code = (
+        'import json, sys, time\n'
+        'start = time.perf_counter()\n'
+        'import bidsonym.run_deeid\n'
+        'bidsonym.run_deeid.get_parser()\n'
+        'elapsed = time.perf_counter() - start\n'
+        'heavy = ["nipype", "bids", "pandas", "nibabel", "tensorflow"]\n'
+        'print(json.dumps({"elapsed": elapsed, '
+        '"loaded": [m for m in heavy if m in sys.modules]}))\n'
+    )
+    result = subprocess.run([sys.executable, '-c', code], capture_output=True,
+                            text=True, check=True)
+    report = json.loads(result.stdout.strip().splitlines()[-1])
+    assert report['loaded'] == []
+    assert report['elapsed'] < 1.0
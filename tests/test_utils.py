@@ -0,0 +1,231 @@
+import os
+from pathlib import Path
+
+import pytest
+
+from bidsonym.utils import (_bids_file_signature, copy_no_deid, deface_image,
+                            get_bids_layout, journal_file, read_journal,
+                            record_stage)
+
+
+def test_bids_file_signature_ignores_sourcedata(bids_dataset):
+    signature = _bids_file_signature(bids_dataset)
+    assert _bids_file_signature(Path(bids_dataset)) == signature
+
+    # Files moved to sourcedata during a run do not change the signature
+    os.makedirs(os.path.join(bids_dataset, 'sourcedata', 'bidsonym'))
+    open(os.path.join(bids_dataset, 'sourcedata', 'bidsonym', 'backup.nii.gz'), 'w').close()
+    assert _bids_file_signature(Path(bids_dataset)) == signature
+
+    open(os.path.join(bids_dataset, 'sub-01', 'anat', 'sub-01_T2w.nii.gz'), 'w').close()
+    assert _bids_file_signature(bids_dataset) != signature
+
+
+def test_get_bids_layout_reuses_index_for_str_and_path(bids_dataset, tmp_path):
+    database_path = tmp_path / 'index'
+    messages = []
+
+    layout = get_bids_layout(Path(bids_dataset), database_path, messages.append)
+    assert layout.get_subjects() == ['01', '02']
+    assert messages[-1].startswith('Indexing')
+
+    # The report nodes pass the directory as str, the index stays valid
+    layout = get_bids_layout(bids_dataset, str(database_path), messages.append)
+    assert layout.get_subjects() == ['01', '02']
+    assert messages[-1].startswith('Loading')
+    assert not [f for f in os.listdir(database_path) if f.endswith('.tmp')]
+
+
+def _write_raw_nifti(image_file, raw, slope=1, inter=0):
+    """Write raw data with a given scaling, which nibabel would recompute."""
+
+    import gzip
+    import numpy as np
+    import nibabel as nib
+
+    header = nib.Nifti1Header()
+    header.set_data_shape(raw.shape)
+    header.set_data_dtype(raw.dtype)
+    header.set_slope_inter(slope, inter)
+    header.set_qform(np.eye(4), code=1)
+    header.set_data_offset(352)
+    with (gzip.open if image_file.endswith('.gz') else open)(image_file, 'wb') as f:
+        header.write_to(f)
+        f.write(b'\x00' * (352 - f.tell()))
+        f.write(raw.tobytes(order='F'))
+
+
+def _deface_mask(tmp_path, shape):
+    import numpy as np
+    import nibabel as nib
+
+    mask = np.ones(shape, dtype=np.uint8)
+    mask[:, :shape[1] // 2, :] = 0
+    mask_file = str(tmp_path / 'mask.nii.gz')
+    nib.save(nib.Nifti1Image(mask, np.eye(4)), mask_file)
+    return mask.astype(bool), mask_file
+
+
+@pytest.mark.parametrize('extension', ['.nii', '.nii.gz'])
+def test_deface_image_keeps_dtype_and_scaling(tmp_path, extension):
+    import numpy as np
+    import nibabel as nib
+
+    rng = np.random.default_rng(0)
+    raw = rng.integers(1, 1000, (8, 10, 6, 3)).astype(np.int16)
+    image = str(tmp_path / f'bold{extension}')
+    _write_raw_nifti(image, raw, slope=2, inter=-20)
+    keep, mask_file = _deface_mask(tmp_path, raw.shape[:3])
+
+    outfile = deface_image(image, mask_file, str(tmp_path / f'defaced{extension}'),
+                           slab_size=4)
+
+    defaced = nib.load(outfile)
+    assert defaced.get_data_dtype() == np.int16
+    assert defaced.dataobj.slope == 2 and defaced.dataobj.inter == -20
+    data = defaced.get_fdata()
+    assert np.all(data[~keep] == 0)
+    assert np.array_equal(data[keep], raw[keep] * 2.0 - 20)
+
+
+def test_deface_image_without_representable_zero(tmp_path):
+    import numpy as np
+    import nibabel as nib
+
+    raw = np.arange(8 * 10 * 6, dtype=np.uint8).reshape((8, 10, 6))
+    image = str(tmp_path / 'T2w.nii.gz')
+    _write_raw_nifti(image, raw, slope=1, inter=10)
+    keep, mask_file = _deface_mask(tmp_path, raw.shape)
+
+    deface_image(image, mask_file, image)
+
+    defaced = nib.load(image)
+    assert defaced.get_data_dtype() == np.float32
+    data = defaced.get_fdata()
+    assert np.all(data[~keep] == 0)
+    assert np.array_equal(data[keep], raw[keep] + 10.0)
+
+
+def test_journal_records_completed_stages(bids_dataset):
+    assert read_journal(bids_dataset, '01') == {}
+
+    item = 'sub-01/anat/sub-01_T1w.nii.gz'
+    assert record_stage(bids_dataset, '01', 'backup', item, in_file='out',
+                        source='moved.nii.gz') == 'out'
+    record_stage(bids_dataset, '01', 'deface', item)
+
+    # A line of an interrupted write is ignored
+    with open(journal_file(bids_dataset, '01'), 'a') as f:
+        f.write('{"stage": "report", "it')
+
+    journal = read_journal(bids_dataset, '01')
+    assert set(journal) == {('backup', item), ('deface', item)}
+    assert journal[('backup', item)]['source'] == 'moved.nii.gz'
+
+
+def test_copy_no_deid_resume(bids_dataset):
+    image = os.path.join(bids_dataset, 'sub-01', 'anat', 'sub-01_T1w.nii.gz')
+    with open(image, 'rb') as f:
+        original = f.read()
+
+    moved = copy_no_deid(bids_dataset, '01', image)
+    assert not os.path.exists(image)
+    with open(moved, 'rb') as f:
+        assert f.read() == original
+
+    # The moved original is never overwritten without --resume
+    with open(image, 'wb') as f:
+        f.write(b'defaced')
+    with pytest.raises(Exception, match='already exists'):
+        copy_no_deid(bids_dataset, '01', image)
+
+    # A move that was interrupted after copying is redone, a completed
+    # move is kept
+    with open(image, 'wb') as f:
+        f.write(original)
+    assert copy_no_deid(bids_dataset, '01', image, resume=True) == moved
+    assert not os.path.exists(image)
+    assert copy_no_deid(bids_dataset, '01', image, resume=True) == moved
+    with open(moved, 'rb') as f:
+        assert f.read() == original
+
+
+def test_meta_data_store(bids_dataset):
+    import pandas as pd
+    from bidsonym.utils import check_meta_data, delete_meta_data, query_meta_data, write_meta_data
+
+    for subject_label in ['01', '02']:
+        check_meta_data(bids_dataset, subject_label, prob_fields=['Manufacturer'])
+
+    flagged = query_meta_data(bids_dataset, subject_label='01', problematic=True)
+    assert set(flagged['file']) == {'sub-01/anat/sub-01_T1w.json',
+                                    'sub-01/anat/sub-01_T1w.nii.gz'}
+    assert {'InstitutionName', 'AcquisitionTime', 'Manufacturer'} <= set(flagged['field'])
+    header = query_meta_data(bids_dataset, field='descrip', source='header')
+    assert list(header['value']) == ['bidsonym-bench synthetic subject'] * 2
+    assert header['problematic'].all()
+    assert not query_meta_data(bids_dataset, field='MagneticFieldStrength')['problematic'].any()
+
+    # Checking a subject again replaces its entries
+    n_entries = len(query_meta_data(bids_dataset))
+    check_meta_data(bids_dataset, '01', prob_fields=['Manufacturer'])
+    assert len(query_meta_data(bids_dataset)) == n_entries
+
+    # Sessions are taken from the file names
+    session_file = os.path.join(bids_dataset, 'sub-02', 'ses-1', 'anat', 'sub-02_ses-1_T1w.json')
+    write_meta_data(bids_dataset, pd.DataFrame({
+        'subject': ['02'], 'file': [session_file], 'source': ['json'],
+        'field': ['PatientName'], 'value': [['Doe', 'Jane']], 'problematic': [True]
+    }), [session_file])
+    entry = query_meta_data(bids_dataset, session='1')
+    assert list(entry['value']) == ['["Doe", "Jane"]']
+
+    delete_meta_data(bids_dataset, '02', session='1')
+    assert query_meta_data(bids_dataset, session='1').empty
+    assert not query_meta_data(bids_dataset, subject_label='02').empty
+    delete_meta_data(bids_dataset, '02')
+    assert set(query_meta_data(bids_dataset)['subject']) == {'01'}
+
+
+@pytest.fixture
+def multi_session_dataset(tmp_path):
+    from bidsonym.bench import generate_dataset
+
+    bids_dir = str(tmp_path / 'bids')
+    generate_dataset(bids_dir, n_subjects=1, n_sessions=2, modalities=('T1w', 'T2w'),
+                     n_bold=1, shape=(24, 24, 20), bold_shape=(8, 8, 6, 3))
+    return bids_dir
+
+
+def test_revert_restores_all_sessions(multi_session_dataset):
+    from bidsonym.bench import bench_subject
+
+    # Raises if the original files are not restored exactly
+    bench_subject(multi_session_dataset, '01', del_meta=['InstitutionName'],
+                  reports=False, revert=True)
+
+
+def test_revert_single_session(multi_session_dataset):
+    from bidsonym.bench import _file_hashes, bench_subject
+    from bidsonym.utils import revert_bidsonym
+
+    originals = _file_hashes(multi_session_dataset, '01')
+    bench_subject(multi_session_dataset, '01', del_meta=['InstitutionName'],
+                  reports=False, revert=False)
+    for session in ['1', '2']:
+        record_stage(multi_session_dataset, '01', 'deface',
+                     f'sub-01/ses-{session}/anat/sub-01_ses-{session}_T1w.nii.gz')
+
+    assert revert_bidsonym(multi_session_dataset, '01', session='1', confirm=False)
+
+    restored = _file_hashes(multi_session_dataset, '01')
+    for path, digest in originals.items():
+        assert (restored[path] == digest) == ('ses-1' in path or 'bold.nii.gz' in path)
+    sourcedata = os.path.join(multi_session_dataset, 'sourcedata', 'bidsonym', 'sub-01')
+    assert sorted(os.listdir(sourcedata)) == ['ses-2', 'sub-01_desc-journal.jsonl']
+    assert [item for _, item in read_journal(multi_session_dataset, '01')] == \
+        ['sub-01/ses-2/anat/sub-01_ses-2_T1w.nii.gz']
+
+    assert revert_bidsonym(multi_session_dataset, '01', session='2', confirm=False)
+    assert _file_hashes(multi_session_dataset, '01') == originals
+    assert not os.path.exists(sourcedata)